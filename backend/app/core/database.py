@@ -33,6 +33,10 @@ Sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def get_session_factory():
+    """For long-lived handlers (the kiosk socket) that open a short session per unit of work."""
+    return Sessionmaker
+
 def get_db():
     db = Sessionmaker()
     try:
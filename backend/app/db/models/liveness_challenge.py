@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, Float, String
+from app.core.database import Base
+
+
+class LivenessChallengeRecord(Base):
+    """An issued, not yet verified liveness challenge (shared store, see app/util/liveness.py)."""
+    __tablename__ = "LivenessChallenges"
+
+    token = Column(String(64), primary_key=True)
+    session_id = Column(Integer, nullable=False)
+    action = Column(String(32), nullable=False)
+    # Unix time; expired rows are purged in batches
+    expires_at = Column(Float, nullable=False, index=True)
@@ -1,5 +1,6 @@
 from app.core.database import Base
-from sqlalchemy import Column, Integer, String, ARRAY, Float, Text
+from app.util.embedding_format import EMBEDDING_MODEL, decode_embedding, encode_embedding
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, Boolean, false
 
 class User(Base):
     __tablename__ = "Users"
@@ -8,7 +9,21 @@ class User(Base):
     last_name = Column(String(100))
     email = Column(String(100), unique=True, nullable=False)
     password = Column(String(250))
-    embedding = Column(ARRAY(Float), nullable=True)
+    # float32/float16 bytes, see app/util/embedding_format.py; use .embedding
+    embedding_vec = Column(LargeBinary, nullable=True)
+    embedding_model = Column(String(64), nullable=True)
+    has_embedding = Column(Boolean, nullable=False, default=False, server_default=false(), index=True)
     avatar_url = Column(Text, nullable=True)
     #add nullable date account created.
-    #account_created = Column(DateTime, nullable=True)
\ No newline at end of file
+    #account_created = Column(DateTime, nullable=True)
+
+    @property
+    def embedding(self) -> list[float] | None:
+        vec = decode_embedding(self.embedding_vec, row=f"Users id={self.id}")
+        return None if vec is None else vec.tolist()
+
+    @embedding.setter
+    def embedding(self, value) -> None:
+        self.embedding_vec = encode_embedding(value)
+        self.has_embedding = self.embedding_vec is not None
+        self.embedding_model = EMBEDDING_MODEL if self.has_embedding else None
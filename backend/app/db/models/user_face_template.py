@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.util.embedding_format import decode_embedding, encode_embedding
+
+
+class UserFaceTemplate(Base):
+    """One enrolled face embedding of a user; a user keeps up to FACE_TEMPLATES_PER_USER."""
+    __tablename__ = "UserFaceTemplates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("Users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # float32/float16 bytes, see app/util/embedding_format.py; use .embedding
+    embedding_vec = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    @property
+    def embedding(self) -> list[float] | None:
+        vec = decode_embedding(self.embedding_vec, row=f"UserFaceTemplates id={self.id}")
+        return None if vec is None else vec.tolist()
+
+    @embedding.setter
+    def embedding(self, value) -> None:
+        self.embedding_vec = encode_embedding(value)
@@ -1,4 +1,6 @@
-from sqlalchemy import select
+from sqlalchemy import exists, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from .base import BaseRepository
 from datetime import datetime, timezone
@@ -9,6 +11,20 @@ from app.db.models.session import Session as SessionModel
 from app.db.models.event import Event
 from app.db.models.event_user import EventUser
 from app.db.models.user import User
+from app.db.models.user_face_template import UserFaceTemplate
+from app.util.embedding_format import EMBEDDING_MODEL, decode_embedding
+from app.util.gallery_cache import gallery_cache
+
+
+def gallery_member(row) -> tuple:
+    """A get_session_gallery_rows row as a build_gallery row; embeddings of another model count as not enrolled."""
+    vector = None
+    if row.embedding_model == EMBEDDING_MODEL:
+        vector = decode_embedding(
+            row.template if row.template is not None else row.embedding,
+            row=f"user {row.user_id}",
+        )
+    return (row.user_id, vector, row.first_name, row.last_name)
 
 
 class AttendanceRepository(BaseRepository):
@@ -81,7 +97,9 @@ class AttendanceRepository(BaseRepository):
             self.session.add(attendance)
             new_attendances.append(attendance)
 
+        added_user_ids = [att.user_id for att in new_attendances]
         self.session.commit()
+        self.add_to_cached_gallery(session_id, added_user_ids)
 
         # Optionally refresh to get IDs etc.
         for att in new_attendances:
@@ -92,6 +110,60 @@ class AttendanceRepository(BaseRepository):
 
 
 
+    def get_session_gallery_rows(self, session_id: int, user_ids: list[int] | None = None) -> list:
+        """
+        Return one row per face template of each attendee of a session (or
+        only of *user_ids*) in a single query: (user_id, template, embedding,
+        embedding_model, first_name, last_name, is_creator, event_id). Users
+        without templates (enrolled before templates existed) get one row
+        with template None. Embeddings are the raw bytea blobs (see
+        app/util/embedding_format.py); gallery_member() decodes a row.
+        """
+        query = (
+            self.session.query(
+                Attendance.user_id,
+                UserFaceTemplate.embedding_vec.label("template"),
+                User.embedding_vec.label("embedding"),
+                User.embedding_model,
+                User.first_name,
+                User.last_name,
+                (Attendance.user_id == Event.user_id).label("is_creator"),
+                SessionModel.event_id,
+            )
+            .join(User, User.id == Attendance.user_id)
+            .join(SessionModel, SessionModel.id == Attendance.session_id)
+            .join(Event, Event.id == SessionModel.event_id)
+            .outerjoin(UserFaceTemplate, UserFaceTemplate.user_id == Attendance.user_id)
+            .filter(Attendance.session_id == session_id)
+        )
+        if user_ids is not None:
+            query = query.filter(Attendance.user_id.in_(user_ids))
+        return query.order_by(Attendance.id, UserFaceTemplate.id).all()
+
+    def add_to_cached_gallery(self, session_id: int, user_ids: list[int]) -> None:
+        """Append new attendees to the session's cached gallery (no rebuild); no-op if it is not cached."""
+        if not user_ids:
+            return
+        if session_id not in gallery_cache:
+            # Nothing to patch; still bumps the generation so a load racing this write is not cached
+            gallery_cache.invalidate_session(session_id)
+            return
+        rows = self.get_session_gallery_rows(session_id, user_ids=user_ids)
+        gallery_cache.add_users(session_id, [gallery_member(r) for r in rows if not r.is_creator])
+
+
+    def get_checkin_admission_row(self, session_id: int):
+        """(end_time, has_attendees) of a session in one query, or None if it does not exist."""
+        return (
+            self.session.query(
+                SessionModel.end_time,
+                exists().where(Attendance.session_id == SessionModel.id).label("has_attendees"),
+            )
+            .filter(SessionModel.id == session_id)
+            .one_or_none()
+        )
+
+
     def check_in(
         self,
         user_id: int,
@@ -103,20 +175,7 @@ class AttendanceRepository(BaseRepository):
         Mark a user as checked in for a session.
         If session_start_time is set and when > session_start_time, status is LATE; else PRESENT.
         """
-        if when is None:
-            when = datetime.now(timezone.utc)
-            tz_pacific = ZoneInfo("America/Los_Angeles")
-            when = when.astimezone(tz_pacific)
-
-        if session_start_time is not None and session_start_time.tzinfo is None:
-            session_start_time = session_start_time.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
-
-        if session_start_time is not None and when.tzinfo is None:
-            when = when.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
-
-        status = AttendanceStatus.PRESENT
-        if session_start_time is not None:
-            status = AttendanceStatus.LATE if when > session_start_time else AttendanceStatus.PRESENT
+        when, status = self.check_in_time_and_status(when, session_start_time)
 
         att = (
             self.session.query(Attendance)
@@ -127,6 +186,7 @@ class AttendanceRepository(BaseRepository):
             .first()
         )
 
+        roster_changed = att is None
         if not att:
             att = Attendance(
                 user_id=user_id,
@@ -141,9 +201,87 @@ class AttendanceRepository(BaseRepository):
 
         self.session.commit()
         self.session.refresh(att)
+        if roster_changed:
+            self.add_to_cached_gallery(session_id, [user_id])
         return att
+
+
+    def check_in_many(
+        self,
+        user_ids: list[int],
+        session_id: int,
+        when: datetime | None = None,
+        session_start_time: datetime | None = None,
+    ) -> list[Attendance]:
+        """
+        Mark several users as checked in for a session in one transaction.
+        Uses the same PRESENT/LATE rule as check_in. Users without an
+        attendance row for the session are skipped.
+        """
+        if not user_ids:
+            return []
+
+        when, status = self.check_in_time_and_status(when, session_start_time)
+
+        query = self.session.query(Attendance).filter(
+            Attendance.session_id == session_id,
+            Attendance.user_id.in_(user_ids),
+        )
+        for att in query.all():
+            att.check_in_time = when
+            att.status = status
+
+        self.session.commit()
+        # One SELECT reloads every expired row instead of a refresh per row
+        return query.all()
+
+
+    def check_in_time_and_status(
+        self,
+        when: datetime | None,
+        session_start_time: datetime | None,
+    ) -> tuple[datetime, AttendanceStatus]:
+        """Check-in time (now in Pacific time by default) and PRESENT/LATE for it."""
+        if when is None:
+            when = datetime.now(timezone.utc)
+            tz_pacific = ZoneInfo("America/Los_Angeles")
+            when = when.astimezone(tz_pacific)
+
+        if session_start_time is not None and session_start_time.tzinfo is None:
+            session_start_time = session_start_time.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
+
+        if session_start_time is not None and when.tzinfo is None:
+            when = when.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
+
+        status = AttendanceStatus.PRESENT
+        if session_start_time is not None:
+            status = AttendanceStatus.LATE if when > session_start_time else AttendanceStatus.PRESENT
+        return when, status
     
 
+    def upsert_check_ins(self, rows: list[dict]) -> None:
+        """
+        Apply journaled check-ins (dicts with user_id, session_id,
+        check_in_time, status) in one INSERT ... ON CONFLICT statement.
+        Rows that are no longer ABSENT keep their first check-in.
+        """
+        if not rows:
+            return
+        dialect = self.session.get_bind().dialect.name
+        insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(Attendance).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Attendance.user_id, Attendance.session_id],
+            set_={
+                "check_in_time": stmt.excluded.check_in_time,
+                "status": stmt.excluded.status,
+            },
+            where=Attendance.status == AttendanceStatus.ABSENT,
+        )
+        self.session.execute(stmt)
+        self.session.commit()
+
+
     def update_status(
         self, user_id: int, session_id: int, status: AttendanceStatus
     ) -> tuple[Attendance | None, str | None]:
@@ -326,5 +464,6 @@ class AttendanceRepository(BaseRepository):
             .delete()
         )
         self.session.commit()
+        gallery_cache.invalidate_session(session_id)
         return deleted
     
@@ -3,6 +3,7 @@ from app.db.models.session import Session as SessionEvent
 from app.db.schema.session import SessionInCreate, SessionOutput
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy import func
+from app.util.gallery_cache import gallery_cache
 
 
 class SessionRepository(BaseRepository):
@@ -84,4 +85,5 @@ class SessionRepository(BaseRepository):
             .delete()
         )
         self.session.commit()
+        gallery_cache.invalidate_event(event_id)
         return deleted
\ No newline at end of file
@@ -5,7 +5,10 @@ from app.db.models.event_user import EventUser
 from app.db.models.user_achievement import UserAchievement
 from app.db.models.user_setting import UserSetting
 from app.db.models.pending_email_change import PendingEmailChange
+from app.db.models.user_face_template import UserFaceTemplate
 from app.db.schema.user import UserInCreate
+from app.util.gallery import FACE_TEMPLATES_PER_USER, normalize_rows, templates_to_keep
+from app.util.gallery_cache import gallery_cache
 from typing import Any, Dict
 
 class UserRepository(BaseRepository):
@@ -43,8 +46,10 @@ class UserRepository(BaseRepository):
         self.session.query(UserAchievement).filter_by(user_id=id).delete()
         self.session.query(Attendance).filter_by(user_id=id).delete()
         self.session.query(EventUser).filter_by(user_id=id).delete()
+        self.session.query(UserFaceTemplate).filter_by(user_id=id).delete()
         self.session.delete(user)
         self.session.commit()
+        gallery_cache.remove_user(id)
         return True
 
     def update_user_by_id(self, id: int, updates: Dict[str, Any]) -> User:
@@ -57,9 +62,63 @@ class UserRepository(BaseRepository):
             if hasattr(user, field):
                 setattr(user, field, value)
 
+        if "embedding" in updates:
+            # Setting the embedding outright (or clearing it) replaces every template
+            self.session.query(UserFaceTemplate).filter_by(user_id=id).delete()
+            if updates["embedding"] is not None:
+                self.session.add(UserFaceTemplate(user_id=id, embedding=list(updates["embedding"])))
+
         self.session.add(user)
         self.session.commit()
         self.session.refresh(user)
+
+        # Cached check-in galleries carry names and embeddings
+        if "first_name" in updates or "last_name" in updates:
+            gallery_cache.invalidate_user(id)
+        elif "embedding" in updates:
+            gallery_cache.patch_user(id, user.embedding, name=(user.first_name, user.last_name))
+        return user
+
+    def get_face_templates(self, user_id: int) -> list[UserFaceTemplate]:
+        return (
+            self.session.query(UserFaceTemplate)
+            .filter_by(user_id=user_id)
+            .order_by(UserFaceTemplate.id)
+            .all()
+        )
+
+    def add_face_template(
+        self, id: int, embedding, max_templates: int = FACE_TEMPLATES_PER_USER
+    ) -> User:
+        """
+        Add an enrolled embedding as a new face template, keep at most
+        max_templates (dropping the most redundant ones) and store their
+        normalized mean in Users.embedding for single-vector readers.
+        """
+        user = self.get_user_by_id(id=id)
+        if not user:
+            return None
+
+        templates = self.get_face_templates(id)
+        if not templates and user.embedding:
+            # Enrolled before templates existed: that embedding is the first template
+            templates.append(UserFaceTemplate(user_id=id, embedding=list(user.embedding)))
+        templates.append(UserFaceTemplate(user_id=id, embedding=[float(x) for x in embedding]))
+        self.session.add_all(templates)
+        self.session.flush()
+
+        keep = set(templates_to_keep([t.embedding for t in templates], max_templates))
+        for i, template in enumerate(templates):
+            if i not in keep:
+                self.session.delete(template)
+        kept = [t.embedding for i, t in enumerate(templates) if i in keep]
+
+        user.embedding = [float(x) for x in normalize_rows(normalize_rows(kept).mean(axis=0))[0]]
+        self.session.add(user)
+        self.session.commit()
+        self.session.refresh(user)
+
+        gallery_cache.patch_user(id, kept, name=(user.first_name, user.last_name))
         return user
     
 
@@ -1,5 +1,7 @@
 import tempfile
 import os
+import cv2
+import numpy as np
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy.orm import Session
 from nudenet import NudeDetector
@@ -8,10 +10,11 @@ from app.util.protectRoute import get_current_user
 from app.db.schema.user import UserOutput
 from app.service.userService import UserService
 from app.core.supabase_client import get_supabase_client, SUPABASE_BUCKET
+from app.service.ModelRegistry import model_registry
 
 avatarRouter = APIRouter()
 
-_detector = NudeDetector()
+NSFW_MODEL = "nsfw"
 
 _NSFW_CLASSES = {
     "FEMALE_GENITALIA_EXPOSED",
@@ -21,12 +24,12 @@ _NSFW_CLASSES = {
     "ANUS_EXPOSED",
 }
 
-def _is_nsfw(image_bytes: bytes, threshold: float = 0.5) -> bool:
+def _is_nsfw(detector: NudeDetector, image_bytes: bytes, threshold: float = 0.5) -> bool:
     with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
         tmp.write(image_bytes)
         tmp_path = tmp.name
     try:
-        detections = _detector.detect(tmp_path)
+        detections = detector.detect(tmp_path)
         return any(
             d["class"] in _NSFW_CLASSES and d["score"] >= threshold
             for d in detections
@@ -34,6 +37,14 @@ def _is_nsfw(image_bytes: bytes, threshold: float = 0.5) -> bool:
     finally:
         os.unlink(tmp_path)
 
+
+def _warm_up(detector: NudeDetector) -> None:
+    _, blank = cv2.imencode(".jpg", np.zeros((320, 320, 3), dtype=np.uint8))
+    _is_nsfw(detector, blank.tobytes())
+
+
+model_registry.register(NSFW_MODEL, NudeDetector, warmup=_warm_up)
+
 @avatarRouter.post("/upload")
 async def upload_avatar(
     file: UploadFile = File(...),
@@ -47,7 +58,8 @@ async def upload_avatar(
     path = f"{user.id}/avatar.{ext}"
     file_bytes = await file.read()
 
-    if _is_nsfw(file_bytes):
+    detector = await model_registry.aget(NSFW_MODEL)
+    if _is_nsfw(detector, file_bytes):
         raise HTTPException(status_code=400, detail="Image contains inappropriate content and cannot be uploaded")
 
     supabase = get_supabase_client()
@@ -1,7 +1,13 @@
 from app.db.schema.user import UserOutput
 from app.core.database import get_db
-from app.util.embeddings import has_embedding
+from app.util.admission import inference_admission
+from app.util.checkin_journal import checkin_journal
+from app.util.embedding_cache import embedding_cache
+from app.util.embeddings import has_embedding, inference
+from app.util.gallery_cache import gallery_cache
+from app.util.idempotency import idempotency_store
 from app.util.protectRoute import get_current_user
+from app.util.timing import stage_timings
 from sqlalchemy.orm import Session
 
 from fastapi import APIRouter, Depends
@@ -19,4 +25,60 @@ async def hasEmbedding(
 
     except Exception as error:
         print(error)
-        raise error
\ No newline at end of file
+        raise error
+
+
+@modelRouter.get("/galleryCacheStats")
+async def gallery_cache_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Hit/miss/eviction counters of the in-process check-in gallery cache."""
+    return gallery_cache.stats()
+
+
+@modelRouter.get("/embeddingCacheStats")
+async def embedding_cache_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Hit/miss/eviction counters of the in-process upload embedding cache."""
+    return embedding_cache.stats()
+
+
+@modelRouter.get("/checkinJournalStats")
+async def checkin_journal_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Pending / flushed counters of this worker's write-behind check-in journal."""
+    return checkin_journal.stats()
+
+
+@modelRouter.get("/admissionStats")
+async def admission_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Running / waiting / rejected counters of this worker's recognition admission control."""
+    return inference_admission.stats()
+
+
+@modelRouter.get("/idempotencyStats")
+async def idempotency_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Executed / replayed / joined counters of this worker's Idempotency-Key store."""
+    return idempotency_store.stats()
+
+
+@modelRouter.get("/inferenceStats")
+async def inference_stats(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Queue/batch metrics of the embedding scheduler, or worker stats in pool mode."""
+    return inference.stats()
+
+
+@modelRouter.get("/pipelineTimings")
+async def pipeline_timings(
+    user: UserOutput = Depends(get_current_user),
+):
+    """Count / average / max duration of each face-pipeline stage (decode, detect, crop, embed)."""
+    return stage_timings.stats()
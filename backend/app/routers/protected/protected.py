@@ -5,7 +5,17 @@ from app.routers.protected.event import eventRouter
 from app.routers.protected.session import sessionRouter
 from app.routers.protected.model import modelRouter
 from app.routers.protected.userSetting import userSettingRouter
-from app.util.embeddings import upload_img_to_embedding
+from app.util.embeddings import (
+    decode_upload,
+    detect_faces_many,
+    embed_faces,
+    mean_embedding,
+    read_upload_image,
+    upload_img_to_embedding,
+)
+from app.util.admission import inference_admission
+from app.util.idempotency import idempotency_store, request_fingerprint
+from app.util.metrics import upload_received
 from app.util.protectRoute import get_current_user
 from app.routers.protected.avatar import avatarRouter
 from app.routers.protected.achievements import achievementsRouter
@@ -13,12 +23,13 @@ from app.routers.protected.emailChange import emailChangeRouter
 from app.routers.protected.profile import profileRouter
 from app.routers.protected.breakout import breakoutRouter
 from app.routers.protected.account import accountRouter
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
-import numpy as np
-import cv2
-from app.service.OcclusionService import occlusion_service
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import torch
+from app.service.ModelRegistry import model_registry
+from app.service.OcclusionService import OCCLUSION_MODEL
 
 
 protectedRouter = APIRouter()
@@ -39,79 +50,106 @@ def read_protected(user: UserOutput = Depends(get_current_user)):
     return {"data": user}
 
 
-@protectedRouter.post("/uploadPicture")
+@protectedRouter.post("/uploadPicture", dependencies=[Depends(upload_received)])
 async def upload_picture(
+    response: Response,
     upload_image: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user: UserOutput = Depends(get_current_user),
     session: Session = Depends(get_db),
     response_model=UserOutput
 ):
-    embedding = await upload_img_to_embedding(upload_image, multiple=False)
-    # upload_img_to_embedding return a list of embeddings hence must squeeze() dimension 0
-    embedding = [float(x) for x in embedding.squeeze(0)]
+    async def enroll():
+        async with inference_admission.slot():
+            embedding = await upload_img_to_embedding(upload_image, multiple=False)
+        # upload_img_to_embedding return a list of embeddings hence must squeeze() dimension 0
+        embedding = [float(x) for x in embedding.squeeze(0)]
 
-    try:
-        return UserService(session=session).update_user_by_id(
-            user_id=user.id,
-            updates={"embedding": embedding}
-        )
+        try:
+            return UserService(session=session).add_face_template(
+                user_id=user.id,
+                embedding=embedding,
+            )
 
-    except Exception as error:
-        print(error)
-        raise error
+        except Exception as error:
+            print(error)
+            raise error
+
+    # Retries with the same Idempotency-Key replay the first response (or wait for it)
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = await request_fingerprint([upload_image])
+    return await idempotency_store.run(f"uploadPicture:{user.id}", idempotency_key, enroll, response, fingerprint)
 
 
-@protectedRouter.post("/uploadPictureMulti")
+@protectedRouter.post("/uploadPictureMulti", dependencies=[Depends(upload_received)])
 async def upload_picture_multi(
+    response: Response,
     upload_images: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user: UserOutput = Depends(get_current_user),
     session: Session = Depends(get_db),
 ):
-    if not upload_images:
-        raise HTTPException(status_code=400, detail="No images provided")
+    async def enroll():
+        if not upload_images:
+            raise HTTPException(status_code=400, detail="No images provided")
+
+        occlusion_service = await model_registry.aget(OCCLUSION_MODEL)
+
+        async with inference_admission.slot():
+            # Decode every frame once, then run each stage over all frames together:
+            # one batched detection, one occlusion pass and one embedder pass over the surviving crops.
+            frames = []
+            for img in upload_images:
+                try:
+                    frames.append(await read_upload_image(img))
+                except HTTPException as e:
+                    print(f"Skipping frame (could not read image): {e.detail}")
+
+            crops = []
+            for faces in await detect_faces_many(frames, multiple=False):
+                if isinstance(faces, HTTPException):
+                    print(f"Skipping frame (face not detected): {faces.detail}")
+                else:
+                    crops.append(faces)
+
+            if not crops:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Could not detect a face in any of the provided frames. Please try again."
+                )
+            faces = torch.cat(crops)
+
+            if occlusion_service.enabled:
+                scores = await run_in_threadpool(occlusion_service.score_faces, faces)
+                for occluded, conf in scores:
+                    if occluded:
+                        print(f"Skipping frame — occlusion detected (conf={conf:.2f})")
+                faces = faces[torch.tensor([not occluded for occluded, _ in scores])]
+
+            if len(faces) == 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Could not detect a face in any of the provided frames. Please try again."
+                )
+
+            embeddings = await embed_faces(faces)
+        embedding = [float(x) for x in mean_embedding(embeddings)]
 
-    embeddings = []
-    for img in upload_images:
         try:
-            raw = await img.read()
-            arr = np.frombuffer(raw, np.uint8)
-            bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-            # Occlusion check
-            if occlusion_service.enabled and bgr is not None:
-                occluded, conf = occlusion_service.is_occluded(bgr)
-                if occluded:
-                    print(f"Skipping frame — occlusion detected (conf={conf:.2f})")
-                    continue
-
-            # Seek back so upload_img_to_embedding can read the same bytes
-            await img.seek(0)
-            emb = await upload_img_to_embedding(img, multiple=False)
-            embeddings.append(emb.squeeze(0).cpu().numpy())
-        except Exception as e:
-            print(f"Skipping frame (face not detected): {e}")
-            continue
-
-    if not embeddings:
-        raise HTTPException(
-            status_code=400,
-            detail="Could not detect a face in any of the provided frames. Please try again."
-        )
+            return UserService(session=session).add_face_template(
+                user_id=user.id,
+                embedding=embedding,
+            )
+        except Exception as error:
+            print(error)
+            raise error
 
-    avg = np.mean(embeddings, axis=0)
-    norm = np.linalg.norm(avg)
-    if norm > 0:
-        avg = avg / norm
-    embedding = [float(x) for x in avg]
-
-    try:
-        return UserService(session=session).update_user_by_id(
-            user_id=user.id,
-            updates={"embedding": embedding}
-        )
-    except Exception as error:
-        print(error)
-        raise error
+    # Retries with the same Idempotency-Key replay the first response (or wait for it)
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = await request_fingerprint(upload_images)
+    return await idempotency_store.run(f"uploadPictureMulti:{user.id}", idempotency_key, enroll, response, fingerprint)
 
 
 @protectedRouter.post("/check-occlusion")
@@ -119,17 +157,15 @@ async def check_occlusion(
     upload_image: UploadFile = File(...),
     user: UserOutput = Depends(get_current_user),
 ):
-    raw = await upload_image.read()
-    arr = np.frombuffer(raw, np.uint8)
-    bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-    if bgr is None:
-        raise HTTPException(status_code=400, detail="Could not decode image")
+    bgr = decode_upload(await upload_image.read())
 
+    occlusion_service = await model_registry.aget(OCCLUSION_MODEL)
     if not occlusion_service.enabled:
         return {"occluded": False, "confidence": 0.0, "enabled": False}
 
-    occluded, conf = occlusion_service.is_occluded(bgr)
+    # Scores the whole frame, with or without a detectable face: the capture page polls this
+    # as a live hint, so it never runs the detector and is not subject to admission control
+    occluded, conf = await run_in_threadpool(occlusion_service.is_occluded, bgr)
 
     return {"occluded": occluded, "confidence": round(conf, 3), "enabled": True}
 
@@ -145,20 +181,21 @@ async def reset_embedding(
     )
 
 
-@protectedRouter.post("/uploadPictureGodmode")
+@protectedRouter.post("/uploadPictureGodmode", dependencies=[Depends(upload_received)])
 async def upload_picture_godmode(
     upload_image: UploadFile = File(...),
     user_id: int = Form(...),
     session: Session = Depends(get_db),
 ):
-    embedding = await upload_img_to_embedding(upload_image)
+    async with inference_admission.slot():
+        embedding = await upload_img_to_embedding(upload_image)
     # upload_img_to_embedding return a list of embeddings hence must squeeze() dimension 0
     embedding = [float(x) for x in embedding.squeeze(0)]
 
     try:
-        return UserService(session=session).update_user_by_id(
+        return UserService(session=session).add_face_template(
             user_id=user_id,
-            updates={"embedding": embedding}
+            embedding=embedding,
         )
     except Exception as error:
         print(error)
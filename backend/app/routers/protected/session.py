@@ -16,12 +16,16 @@ from app.db.models.session import Session as SessionModel
 from app.db.models.user import User
 from app.service.eventAuditService import try_log_event_action
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, Form, HTTPException, Response, status, UploadFile, File, WebSocket, WebSocketDisconnect
-from app.util.embeddings import upload_img_to_embedding
-from app.util.datetime_json import utc_iso_z
+from starlette.concurrency import run_in_threadpool
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Request, Response, status, UploadFile, File, WebSocket, WebSocketDisconnect
+from app.util.admission import inference_admission
+from app.util.checkin import recognize_frame, record_checkins
+from app.util.embeddings import read_upload_image, upload_img_to_embedding
+from app.util.face_tracker import face_trackers
+from app.util.idempotency import idempotency_store, request_fingerprint
 from app.util.liveness import liveness_store
+from app.util.metrics import upload_received
 from app.util.pdf_report import render_attendance_report_pdf
-from app.util.ws_manager import manager
 
 
 class SessionIdRequest(BaseModel):
@@ -455,68 +459,59 @@ async def update_attendance_status(
         raise
 
 
-@sessionRouter.post("/checkin")
+@sessionRouter.post("/checkin", dependencies=[Depends(upload_received)])
 async def check_in_with_face(
     session_id: int,
+    request: Request,
+    response: Response,
     liveness_token: str = Form(...),
     liveness_action: str = Form(...),
     upload_image: UploadFile = File(...),
+    kiosk_id: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     session: Session = Depends(get_db),
 ):
-    liveness_store.verify(liveness_token, session_id, liveness_action)
-    try:
-        # Convert image -> face embedding (ensures 1 face, size, etc.)
-        
-        embs = await upload_img_to_embedding(upload_image)
-    except Exception as error:
-            print(error)
-            raise error 
-
-    service = AttendanceService(session=session)
-    results = {}
-    total_embs = len(embs)
-    checkedin_embs = 0
-    already_checked_in_embs = 0
-    last_error = None
-    for i in range(total_embs):
-        try:
-            emb = [float(x) for x in embs[i]]
-            result = service.check_in_with_embedding(session_id=session_id, face_embedding=emb)
-            results[i] = {"success": True, "data": result}
-            if result.get("attendance_updated"):
-                checkedin_embs += 1
-            elif result.get("already_checked_in"):
-                already_checked_in_embs += 1
-
-            # Only broadcast to dashboard if this changed attendance state
-            if result.get("attendance_updated"):
-                ws_data = {**result}
-                if ws_data.get("check_in_time") is not None:
-                    ct = ws_data["check_in_time"]
-                    ws_data["check_in_time"] = (
-                        utc_iso_z(ct) if isinstance(ct, datetime) else str(ct)
-                    )
-                await manager.broadcast_to_session(session_id, {
-                    "type": "checkin",
-                    "data": ws_data
-                })
-        except Exception as error:
-            results[i] = {"success": False, "error": str(error)}
-            last_error = error
-
-    # If every face failed, surface the actual error instead of returning 200
-    if checkedin_embs == 0 and already_checked_in_embs == 0 and last_error is not None:
-        raise last_error
-
-    return {
-        "stats": {
-            "num_face": total_embs,
-            "checked_in": checkedin_embs,
-            "already_checked_in": already_checked_in_embs,
-            "matched": checkedin_embs + already_checked_in_embs,
-        },
-        "result": results,
-    }
+    async def check_in() -> dict:
+        # Cheap checks first: unknown / empty / ended sessions and overload never reach the model,
+        # and a 503 does not spend the one-time liveness token
+        await run_in_threadpool(AttendanceService(session=session).check_admission, session_id)
+        inference_admission.reject_if_saturated()
+        await liveness_store.averify(liveness_token, session_id, liveness_action)
+
+        async with inference_admission.slot():
+            if kiosk_id is not None:
+                # Burst retries from one kiosk: faces identified by an earlier request skip the embedder
+                img = await read_upload_image(upload_image)
+                result, last_error = await recognize_frame(
+                    session, session_id, img, face_trackers.get(session_id, kiosk_id)
+                )
+                if last_error is not None:
+                    raise last_error
+                return result
+
+            # Convert image -> face embedding (ensures 1 face, size, etc.)
+            embs = await upload_img_to_embedding(upload_image)
+            result, last_error = await record_checkins(session, session_id, embs)
+
+        # If every face failed, surface the actual error instead of returning 200
+        if last_error is not None:
+            raise last_error
+
+        return result
+
+    # Retries with the same Idempotency-Key replay the first response (or wait for it)
+    # instead of running liveness, inference and the broadcast again. Kiosks are not
+    # logged in, so keys are scoped by kiosk_id, or by the client address without one
+    if kiosk_id is not None:
+        caller = f"kiosk={kiosk_id}"
+    else:
+        caller = f"client={request.client.host if request.client else ''}"
+    fingerprint = None
+    if idempotency_key is not None:
+        fingerprint = await request_fingerprint([upload_image], liveness_token, liveness_action)
+    return await idempotency_store.run(
+        f"checkin:{session_id}:{caller}", idempotency_key, check_in, response, fingerprint
+    )
 
 @sessionRouter.post("/livenessChallenge")
 async def create_liveness_challenge(
@@ -535,7 +530,7 @@ async def create_liveness_challenge(
         )
     return {
         "success": True,
-        **liveness_store.create(session_id=body.session_id),
+        **await liveness_store.acreate(session_id=body.session_id),
     }
 
 @sessionRouter.post('/camera')
@@ -0,0 +1,203 @@
+"""
+FaceDetector — the detection stage of ModelService behind one interface.
+
+Every detector returns an (k, 5) float32 array of ``x1, y1, x2, y2, score``
+in the pixel coordinates of the image it was given; ``detect_batch`` returns
+one such array per image. ModelService maps the
+boxes back to the full-resolution frame and cuts the 160x160 crops with
+MTCNN.extract, so the embedder input is produced the same way whatever
+detector found the face.
+
+  mtcnn       facenet-pytorch MTCNN cascade (default, no extra files)
+  yunet       OpenCV YuNet via cv2.FaceDetectorYN (face_detection_yunet_2023mar.onnx)
+  centerface  CenterFace run with onnxruntime (centerface.onnx)
+
+FACE_DETECTOR selects the backend per deployment. Model files are read from
+FACE_DETECTOR_MODEL_DIR (default backend/models), or from FACE_DETECTOR_MODEL
+if it is set. A missing or unloadable file falls back to MTCNN.
+Compare the backends with `python -m scripts.benchmark_detectors`.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.service.InferenceEngine import ONNX_INTRA_OP_THREADS
+
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "mtcnn")
+FACE_DETECTOR_MODEL_DIR = Path(os.getenv(
+    "FACE_DETECTOR_MODEL_DIR", Path(__file__).parent.parent.parent / "models"
+))
+FACE_DETECTOR_MODEL = os.getenv("FACE_DETECTOR_MODEL")
+FACE_DETECTOR_SCORE_THRESHOLD = float(os.getenv("FACE_DETECTOR_SCORE_THRESHOLD", "0.6"))
+NMS_THRESHOLD = 0.3
+
+YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+CENTERFACE_MODEL = "centerface.onnx"
+
+
+def _no_faces() -> np.ndarray:
+    return np.empty((0, 5), dtype=np.float32)
+
+
+class MtcnnDetector:
+    name = "mtcnn"
+
+    def __init__(self, mtcnn):
+        self.mtcnn = mtcnn
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        boxes, probs = self.mtcnn.detect(img)
+        return self.__to_dets(boxes, probs)
+
+    def detect_batch(self, imgs: list[np.ndarray]) -> list[np.ndarray]:
+        """One MTCNN cascade per group of equal-sized images (capture frames share a size)."""
+        results: list[np.ndarray | None] = [None] * len(imgs)
+        groups: dict[tuple, list[int]] = {}
+        for i, img in enumerate(imgs):
+            groups.setdefault(img.shape, []).append(i)
+
+        for indices in groups.values():
+            if len(indices) == 1:
+                results[indices[0]] = self.detect(imgs[indices[0]])
+                continue
+            batch_boxes, batch_probs = self.mtcnn.detect([imgs[i] for i in indices])
+            for i, boxes, probs in zip(indices, batch_boxes, batch_probs):
+                results[i] = self.__to_dets(boxes, probs)
+        return results
+
+    def __to_dets(self, boxes, probs) -> np.ndarray:
+        if boxes is None:
+            return _no_faces()
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        probs = np.asarray(probs, dtype=np.float32).reshape(-1, 1)
+        return np.hstack([boxes, probs])
+
+
+class YuNetDetector:
+    name = "yunet"
+
+    def __init__(self, path: Path, score_threshold: float = FACE_DETECTOR_SCORE_THRESHOLD):
+        self.net = cv2.FaceDetectorYN.create(
+            str(path), "", (320, 320), score_threshold, NMS_THRESHOLD, 5000
+        )
+        # setInputSize + detect mutate the detector; requests arrive from the threadpool
+        self.__lock = threading.Lock()
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        h, w = img.shape[:2]
+        with self.__lock:
+            self.net.setInputSize((w, h))
+            _, faces = self.net.detect(img)
+        if faces is None:
+            return _no_faces()
+        # rows: x, y, w, h, 5 landmark (x, y) pairs, score
+        boxes = faces[:, :4].astype(np.float32)
+        boxes[:, 2:] += boxes[:, :2]
+        return np.hstack([boxes, faces[:, 14:15].astype(np.float32)])
+
+    def detect_batch(self, imgs: list[np.ndarray]) -> list[np.ndarray]:
+        return [self.detect(img) for img in imgs]
+
+
+class CenterFaceDetector:
+    """CenterFace: one heatmap + box-size + offset head at stride 4 (anchor free)."""
+
+    name = "centerface"
+    INPUT = "input.1"
+    OUTPUTS = ["537", "538", "539", "540"]   # heatmap, scale, offset, landmarks
+
+    def __init__(self, path: Path, score_threshold: float = FACE_DETECTOR_SCORE_THRESHOLD):
+        import onnx
+        import onnxruntime as ort
+
+        # The published graph has a fixed 32x32 input; free the batch and
+        # spatial dims so every frame runs at its own size (cv2.dnn keeps stale
+        # buffers when the input size changes between calls, so it is not used).
+        model = onnx.load(str(path))
+        # Old exporter: weights are also listed as graph inputs, which stops
+        # onnxruntime from folding them as constants
+        weights = {init.name for init in model.graph.initializer}
+        graph_inputs = [value for value in model.graph.input if value.name not in weights]
+        del model.graph.input[:]
+        model.graph.input.extend(graph_inputs)
+        for value in [*model.graph.input, *model.graph.output]:
+            if value.name == self.INPUT or value.name in self.OUTPUTS:
+                dims = value.type.tensor_type.shape.dim
+                for i, param in ((0, "B"), (2, "H"), (3, "W")):
+                    dims[i].dim_param = param
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.log_severity_level = 3     # unused batch-norm counters in the graph
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        self.session = ort.InferenceSession(
+            model.SerializeToString(), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.score_threshold = score_threshold
+
+    def detect(self, img: np.ndarray) -> np.ndarray:
+        h, w = img.shape[:2]
+        h32, w32 = int(np.ceil(h / 32) * 32), int(np.ceil(w / 32) * 32)
+        blob = cv2.dnn.blobFromImage(img, 1.0, (w32, h32), (0, 0, 0), swapRB=True, crop=False)
+        heatmap, scale, offset, _ = self.session.run(self.OUTPUTS, {self.INPUT: blob})
+
+        heatmap = heatmap[0, 0]
+        ys, xs = np.nonzero(heatmap > self.score_threshold)
+        if ys.size == 0:
+            return _no_faces()
+
+        box_h = np.exp(scale[0, 0, ys, xs]) * 4
+        box_w = np.exp(scale[0, 1, ys, xs]) * 4
+        x1 = np.clip((xs + offset[0, 1, ys, xs] + 0.5) * 4 - box_w / 2, 0, w32)
+        y1 = np.clip((ys + offset[0, 0, ys, xs] + 0.5) * 4 - box_h / 2, 0, h32)
+        x2 = np.minimum(x1 + box_w, w32)
+        y2 = np.minimum(y1 + box_h, h32)
+        scores = heatmap[ys, xs]
+
+        keep = cv2.dnn.NMSBoxes(
+            np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist(),
+            scores.tolist(), self.score_threshold, NMS_THRESHOLD,
+        )
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)
+        dets = np.stack([x1, y1, x2, y2, scores], axis=1)[keep].astype(np.float32)
+        dets[:, [0, 2]] *= w / w32
+        dets[:, [1, 3]] *= h / h32
+        return dets
+
+    def detect_batch(self, imgs: list[np.ndarray]) -> list[np.ndarray]:
+        return [self.detect(img) for img in imgs]
+
+
+_FILE_BACKENDS = {
+    "yunet": (YuNetDetector, YUNET_MODEL),
+    "centerface": (CenterFaceDetector, CENTERFACE_MODEL),
+}
+
+
+def load_detector(mtcnn, name: str = FACE_DETECTOR, model_path: str | None = FACE_DETECTOR_MODEL):
+    """Build the configured detector; anything that cannot load falls back to MTCNN."""
+    if name == "mtcnn":
+        return MtcnnDetector(mtcnn)
+    if name not in _FILE_BACKENDS:
+        print(f"[FaceDetector] Unknown FACE_DETECTOR={name!r}; using MTCNN.")
+        return MtcnnDetector(mtcnn)
+
+    cls, filename = _FILE_BACKENDS[name]
+    path = Path(model_path) if model_path else FACE_DETECTOR_MODEL_DIR / filename
+    if not path.exists():
+        print(f"[FaceDetector] {path} not found; using MTCNN.")
+        return MtcnnDetector(mtcnn)
+    try:
+        detector = cls(path)
+    except ImportError:
+        print("[FaceDetector] onnx/onnxruntime is not installed; using MTCNN.")
+        return MtcnnDetector(mtcnn)
+    except Exception as error:
+        print(f"[FaceDetector] Could not load {path}: {error}; using MTCNN.")
+        return MtcnnDetector(mtcnn)
+    print(f"[FaceDetector] Using {name} ({path.name})")
+    return detector
@@ -0,0 +1,159 @@
+"""
+InferenceEngine — runs a model's forward pass behind one small interface so
+ModelService and OcclusionService do not care whether eager PyTorch or
+ONNX Runtime executes it.
+
+  TorchEngine  wraps an nn.Module (the original path)
+  OnnxEngine   runs an exported .onnx graph with onnxruntime (CPU by default)
+
+The engine is picked once at startup with INFERENCE_ENGINE ("torch", "onnx"
+or "onnx-int8"). Exported graphs live in ONNX_MODEL_DIR and are produced by
+`python -m scripts.export_onnx`. If the onnx engine is requested but the
+graph or onnxruntime is missing, the service falls back to PyTorch.
+
+"onnx-int8" loads the statically quantized graphs written by
+`python -m scripts.quantize_models`. Each one ships with a JSON report of its
+match-decision agreement with FP32; the INT8 graph is refused (and FP32 ONNX
+used instead) unless that report matches the file and its agreement is at
+least QUANTIZED_MIN_AGREEMENT.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "torch")
+ONNX_MODEL_DIR = Path(os.getenv(
+    "ONNX_MODEL_DIR", Path(__file__).parent.parent.parent / "models"
+))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 = onnxruntime default
+QUANTIZED_MIN_AGREEMENT = float(os.getenv("QUANTIZED_MIN_AGREEMENT", "0.99"))
+
+EMBEDDER_ONNX = "facenet_vggface2.onnx"
+OCCLUSION_ONNX = "occlusion_model.onnx"
+
+
+class TorchEngine:
+    name = "torch"
+
+    def __init__(self, module: torch.nn.Module, device):
+        self.module = module
+        self.device = device
+
+    def run(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(batch.to(self.device))
+
+
+class OnnxEngine:
+    def __init__(self, path: Path, providers: list[str] | None = None, name: str = "onnx"):
+        import onnxruntime as ort
+
+        self.name = name
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+
+        self.path = Path(path)
+        self.session = ort.InferenceSession(
+            str(self.path),
+            sess_options=options,
+            providers=providers or ["CPUExecutionProvider"],
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch: torch.Tensor) -> torch.Tensor:
+        inputs = np.ascontiguousarray(batch.detach().cpu().numpy(), dtype=np.float32)
+        (out,) = self.session.run(None, {self.input_name: inputs})
+        return torch.from_numpy(out)
+
+
+def quantized_file(onnx_file: str) -> str:
+    """facenet_vggface2.onnx -> facenet_vggface2.int8.onnx"""
+    return onnx_file.removesuffix(".onnx") + ".int8.onnx"
+
+
+def quantization_report_path(path: Path) -> Path:
+    return Path(path).with_suffix(".json")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def quantization_gate(path: Path, min_agreement: float = QUANTIZED_MIN_AGREEMENT) -> tuple[bool, str]:
+    """Decide whether the INT8 graph at *path* may be used, based on its report."""
+    path = Path(path)
+    report_path = quantization_report_path(path)
+    if not path.exists():
+        return False, f"{path.name} not found"
+    if not report_path.exists():
+        return False, f"no agreement report ({report_path.name})"
+
+    report = json.loads(report_path.read_text())
+    if report.get("sha256") != file_sha256(path):
+        return False, "agreement report does not match the model file"
+    agreement = float(report.get("agreement", 0.0))
+    if agreement < min_agreement:
+        return False, f"decision agreement {agreement:.4f} < {min_agreement:.4f}"
+    return True, f"decision agreement {agreement:.4f}"
+
+
+def onnx_available(onnx_file: str, engine: str = INFERENCE_ENGINE) -> bool:
+    """True when *engine* is an ONNX engine and a graph for *onnx_file* exists."""
+    if engine not in ("onnx", "onnx-int8"):
+        return False
+    return (ONNX_MODEL_DIR / onnx_file).exists() or (
+        engine == "onnx-int8" and (ONNX_MODEL_DIR / quantized_file(onnx_file)).exists()
+    )
+
+
+def _try_onnx(path: Path, name: str = "onnx") -> OnnxEngine | None:
+    try:
+        onnx_engine = OnnxEngine(path, name=name)
+        print(f"[InferenceEngine] Using ONNX Runtime for {path.name}")
+        return onnx_engine
+    except ImportError:
+        print("[InferenceEngine] onnxruntime is not installed; falling back to PyTorch.")
+    except Exception as error:
+        print(f"[InferenceEngine] Could not load {path}: {error}; falling back.")
+    return None
+
+
+def load_engine(module_factory, onnx_file: str, device, engine: str = INFERENCE_ENGINE):
+    """
+    Build the configured engine for one model.
+
+    module_factory is only called when PyTorch is used (or as the fallback),
+    so the onnx engines never load the .pth/.pt weights.
+    """
+    if engine == "onnx-int8":
+        path = ONNX_MODEL_DIR / quantized_file(onnx_file)
+        ok, reason = quantization_gate(path)
+        if ok:
+            print(f"[InferenceEngine] INT8 {path.name} accepted: {reason}")
+            loaded = _try_onnx(path, name="onnx-int8")
+            if loaded is not None:
+                return loaded
+        else:
+            print(f"[InferenceEngine] Refusing INT8 {path.name}: {reason}; using FP32.")
+        engine = "onnx"
+
+    if engine == "onnx":
+        loaded = _try_onnx(ONNX_MODEL_DIR / onnx_file)
+        if loaded is not None:
+            return loaded
+    elif engine != "torch":
+        print(f"[InferenceEngine] Unknown INFERENCE_ENGINE={engine!r}; using PyTorch.")
+
+    return TorchEngine(module_factory(), device)
@@ -0,0 +1,350 @@
+"""
+InferencePool — out-of-process face detection + embedding.
+
+Runs ModelService in INFERENCE_WORKERS separate processes so a burst of
+check-ins does not hold the GIL and CPU of the uvicorn worker that also
+serves every other route. Enable with INFERENCE_BACKEND=pool.
+
+- Decoded frames are copied once into a SharedMemory block; only its name,
+  shape and dtype travel over the worker's pipe. Embeddings (k x 512 floats)
+  come back over the pipe.
+- Besides the whole pipeline, a job can be "detect" (frame -> face crops) or
+  "embed_faces" (crops -> embeddings), so callers can inspect the crops
+  (e.g. the occlusion check) between the two stages.
+- Each worker handles one job at a time; callers block (in the threadpool)
+  until a worker is idle, and get a 503 when none is within
+  INFERENCE_TIMEOUT_SECONDS.
+- A worker that dies or exceeds INFERENCE_TIMEOUT_SECONDS is killed and
+  respawned and the request fails with 503. A health thread pings idle
+  workers every INFERENCE_HEALTH_INTERVAL_SECONDS and respawns any that died
+  or stopped answering between requests.
+"""
+
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from time import monotonic
+
+import numpy as np
+import torch
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.util.timing import collect_timings, record_stage
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", "1"))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "30"))
+INFERENCE_START_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_START_TIMEOUT_SECONDS", "180"))
+INFERENCE_HEALTH_INTERVAL_SECONDS = float(os.getenv("INFERENCE_HEALTH_INTERVAL_SECONDS", "5"))
+PING_TIMEOUT_SECONDS = 5.0
+
+
+def _worker_main(conn, threads: int) -> None:
+    """Entry point of a worker process: load the models once, then serve jobs."""
+    torch.set_num_threads(threads)
+    from app.service.ModelService import ModelService
+
+    model = ModelService()
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+
+        if msg[0] == "ping":
+            conn.send(("pong", os.getpid()))
+            continue
+        if msg[0] == "stop":
+            return
+
+        op, shm_name, shape, dtype, multiple = msg
+        shm = shared_memory.SharedMemory(name=shm_name)
+        img = None
+        try:
+            img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            with collect_timings() as timings:
+                if op == "detect":
+                    out = model.detect(img, multiple)
+                elif op == "detect_with_boxes":
+                    boxes, faces = model.detect_with_boxes(img, multiple)
+                    out = (boxes, faces.cpu().numpy())
+                elif op == "embed_faces":
+                    # Copy: the tensor must not outlive the shared memory block
+                    out = model.embed(torch.tensor(img))
+                else:
+                    out = model.img_to_embedding(img, multiple)
+            conn.send(("ok", out if isinstance(out, tuple) else out.cpu().numpy(), timings))
+        except HTTPException as error:
+            conn.send(("http_error", error.status_code, error.detail))
+        except Exception as error:
+            conn.send(("error", repr(error)))
+        finally:
+            del img
+            shm.close()
+
+
+@dataclass
+class _Worker:
+    index: int
+    process: mp.Process
+    conn: object
+    ready: bool = False
+    jobs: int = 0
+    started_at: float = field(default_factory=monotonic)
+
+
+class InferencePool:
+    def __init__(
+        self,
+        workers: int = INFERENCE_WORKERS,
+        threads_per_worker: int = INFERENCE_THREADS_PER_WORKER,
+        timeout: float = INFERENCE_TIMEOUT_SECONDS,
+    ):
+        self.num_workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.timeout = timeout
+        self.__ctx = mp.get_context("spawn")
+        self.__idle: queue.Queue[_Worker] = queue.Queue()
+        self.__workers: dict[int, _Worker] = {}
+        self.__lock = threading.Lock()
+        self.__started = False
+        self.__stop = threading.Event()
+        self.__health_thread: threading.Thread | None = None
+
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.in_flight = 0
+
+    def start(self) -> None:
+        with self.__lock:
+            if self.__started:
+                return
+            for i in range(self.num_workers):
+                self.__idle.put(self.__spawn(i))
+            self.__started = True
+            self.__stop.clear()
+            self.__health_thread = threading.Thread(
+                target=self.__health_loop, name="inference-pool-health", daemon=True
+            )
+            self.__health_thread.start()
+
+    def shutdown(self) -> None:
+        with self.__lock:
+            if not self.__started:
+                return
+            self.__started = False
+            self.__stop.set()
+            for worker in self.__workers.values():
+                try:
+                    worker.conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+                worker.process.join(timeout=2)
+                if worker.process.is_alive():
+                    worker.process.kill()
+            self.__workers.clear()
+            self.__idle = queue.Queue()
+
+    def wait_ready(self, timeout: float = INFERENCE_START_TIMEOUT_SECONDS) -> None:
+        """Start the pool and block until every worker has loaded its models."""
+        self.start()
+        taken = []
+        try:
+            for _ in range(self.num_workers):
+                worker = self.__idle.get(timeout=timeout)
+                taken.append(worker)
+                if not worker.ready:
+                    self.__recv(worker, timeout)
+                    worker.ready = True
+        finally:
+            for worker in taken:
+                self.__idle.put(worker)
+
+    async def img_to_embedding(self, img, multiple=False):
+        """Same contract as ModelService.img_to_embedding, executed in a worker process."""
+        self.start()
+        embs = await run_in_threadpool(self.__run_job, "embed", img, multiple)
+        return torch.from_numpy(embs)
+
+    async def detect(self, img, multiple=False) -> torch.Tensor:
+        """ModelService.detect in a worker process: the aligned face crops of one frame."""
+        self.start()
+        faces = await run_in_threadpool(self.__run_job, "detect", img, multiple)
+        return torch.from_numpy(faces)
+
+    async def detect_with_boxes(self, img, multiple=False) -> tuple[np.ndarray, torch.Tensor]:
+        """ModelService.detect_with_boxes in a worker process: full-resolution boxes and crops."""
+        self.start()
+        boxes, faces = await run_in_threadpool(self.__run_job, "detect_with_boxes", img, multiple)
+        return boxes, torch.from_numpy(faces)
+
+    async def detect_many(self, imgs, multiple=False) -> list:
+        """Per frame, its crops or an HTTPException; the frames are spread over the idle workers."""
+        results = await asyncio.gather(
+            *(self.detect(img, multiple) for img in imgs), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, HTTPException):
+                raise result
+        return results
+
+    async def embed(self, faces: torch.Tensor) -> torch.Tensor:
+        """ModelService.embed in a worker process."""
+        self.start()
+        embs = await run_in_threadpool(self.__run_job, "embed_faces", faces.cpu().numpy(), False)
+        return torch.from_numpy(embs)
+
+    def health_check(self) -> list[dict]:
+        """Per-worker liveness, readiness and job counts (pings happen in the health thread)."""
+        report = []
+        for worker in list(self.__workers.values()):
+            report.append({
+                "worker": worker.index,
+                "pid": worker.process.pid,
+                "alive": worker.process.is_alive(),
+                "ready": worker.ready,
+                "jobs": worker.jobs,
+                "uptime_seconds": round(monotonic() - worker.started_at, 1),
+            })
+        return report
+
+    def stats(self) -> dict:
+        return {
+            "backend": "pool",
+            "workers": self.num_workers,
+            "alive": sum(w.process.is_alive() for w in list(self.__workers.values())),
+            "idle": self.__idle.qsize(),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "restarts": self.restarts,
+        }
+
+    def __spawn(self, index: int) -> _Worker:
+        parent_conn, child_conn = self.__ctx.Pipe()
+        process = self.__ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.threads_per_worker),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(index=index, process=process, conn=parent_conn)
+        self.__workers[index] = worker
+        return worker
+
+    def __restart(self, worker: _Worker) -> _Worker:
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=2)
+        worker.conn.close()
+        with self.__lock:
+            self.restarts += 1
+        print(f"[InferencePool] Restarting worker {worker.index} (pid {worker.process.pid})")
+        return self.__spawn(worker.index)
+
+    def __recv(self, worker: _Worker, timeout: float):
+        """Wait for a message, noticing worker death instead of blocking forever."""
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            if worker.conn.poll(0.05):
+                return worker.conn.recv()
+            if not worker.process.is_alive():
+                raise EOFError
+        raise TimeoutError
+
+    def __run_job(self, op: str, img: np.ndarray, multiple: bool) -> np.ndarray:
+        if img is None:
+            raise HTTPException(status_code=400, detail="Could not decode image")
+
+        try:
+            # Every worker busy (or stuck mid-restart) for a whole job timeout: shed the request
+            worker = self.__idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise HTTPException(
+                status_code=503,
+                detail="Face recognition worker is unavailable, please try again.",
+            )
+        with self.__lock:
+            self.in_flight += 1
+        img = np.ascontiguousarray(img)
+        shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+        try:
+            np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+
+            if not worker.ready:
+                self.__recv(worker, INFERENCE_START_TIMEOUT_SECONDS)
+                worker.ready = True
+
+            worker.conn.send((op, shm.name, img.shape, img.dtype.str, multiple))
+            reply = self.__recv(worker, self.timeout)
+            worker.jobs += 1
+        except (EOFError, OSError, TimeoutError) as error:
+            with self.__lock:
+                self.failed += 1
+            worker = self.__restart(worker)
+            raise HTTPException(
+                status_code=503,
+                detail="Face recognition worker is unavailable, please try again.",
+            ) from error
+        finally:
+            with self.__lock:
+                self.in_flight -= 1
+            self.__idle.put(worker)
+            shm.close()
+            shm.unlink()
+
+        if reply[0] == "ok":
+            with self.__lock:
+                self.completed += 1
+            for stage, seconds in reply[2].items():
+                record_stage(stage, seconds)
+            return reply[1]
+        with self.__lock:
+            self.failed += 1
+        if reply[0] == "http_error":
+            raise HTTPException(status_code=reply[1], detail=reply[2])
+        raise RuntimeError(f"Inference worker failed: {reply[1]}")
+
+    def __health_loop(self) -> None:
+        while not self.__stop.wait(INFERENCE_HEALTH_INTERVAL_SECONDS):
+            # One worker at a time, put back before the next is taken, so a round of
+            # pings never leaves requests waiting for more than one worker
+            checked = set()
+            for _ in range(self.num_workers):
+                try:
+                    worker = self.__idle.get_nowait()
+                except queue.Empty:
+                    break
+                if worker.index in checked:
+                    # Back at the head of the queue: every idle worker has been pinged
+                    self.__idle.put(worker)
+                    break
+                checked.add(worker.index)
+                if not self.__is_healthy(worker):
+                    worker = self.__restart(worker)
+                self.__idle.put(worker)
+
+    def __is_healthy(self, worker: _Worker) -> bool:
+        if not worker.process.is_alive():
+            return False
+        if not worker.ready:
+            # Still loading models: consume the ready message if it has arrived
+            if worker.conn.poll():
+                worker.conn.recv()
+                worker.ready = True
+            return True
+        try:
+            worker.conn.send(("ping",))
+            return self.__recv(worker, PING_TIMEOUT_SECONDS)[0] == "pong"
+        except (EOFError, OSError, TimeoutError):
+            return False
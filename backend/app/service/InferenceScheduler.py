@@ -0,0 +1,177 @@
+"""
+InferenceScheduler — dynamic micro-batching in front of ModelService.
+
+Each request still runs MTCNN on its own frame (in the threadpool), but the
+resulting face crops are queued instead of being embedded immediately. A
+single background task drains the queue: once the first crops arrive it
+waits up to EMBED_BATCH_MAX_WAIT_MS for more (or until EMBED_BATCH_MAX_SIZE
+crops are queued), runs one batched InceptionResnetV1 forward pass, and
+hands every caller back its own slice of the result.
+
+A request is never split across batches, so one frame with more faces than
+the batch size is embedded on its own.
+"""
+
+import asyncio
+import contextvars
+import os
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable
+import numpy as np
+
+import torch
+from starlette.concurrency import run_in_threadpool
+
+from app.util.timing import timed
+
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+@dataclass
+class _PendingCrops:
+    faces: torch.Tensor
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class InferenceScheduler:
+    def __init__(
+        self,
+        get_model: Callable,
+        max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS,
+    ):
+        # Called from the threadpool on every use, so the model can load lazily
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.__queue: asyncio.Queue | None = None
+        self.__worker: asyncio.Task | None = None
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__pending_faces = 0
+
+        self.batches = 0
+        self.requests = 0
+        self.faces = 0
+        self.max_batch_faces = 0
+        self.total_wait = 0.0
+        self.total_forward = 0.0
+
+    async def img_to_embedding(self, img, multiple=False):
+        """Same contract as ModelService.img_to_embedding, with batched embedding."""
+        return await self.embed(await self.detect(img, multiple))
+
+    async def detect(self, img, multiple=False) -> torch.Tensor:
+        """ModelService.detect in the threadpool: the aligned face crops of one frame."""
+        return await run_in_threadpool(self.__detect, img, multiple)
+
+    async def detect_with_boxes(self, img, multiple=False) -> tuple[np.ndarray, torch.Tensor]:
+        """ModelService.detect_with_boxes in the threadpool: full-resolution boxes and crops."""
+        return await run_in_threadpool(self.__detect_with_boxes, img, multiple)
+
+    async def detect_many(self, imgs, multiple=False) -> list:
+        """ModelService.detect_many in the threadpool: per frame, its crops or an HTTPException."""
+        return await run_in_threadpool(self.__detect_many, imgs, multiple)
+
+    async def embed(self, faces: torch.Tensor) -> torch.Tensor:
+        """Queue face crops for the next batched forward pass and await their embeddings."""
+        self.__ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self.__pending_faces += len(faces)
+        with timed("embed_wait"):
+            await self.__queue.put(_PendingCrops(faces=faces, future=future, enqueued_at=perf_counter()))
+            return await future
+
+    def stats(self) -> dict:
+        return {
+            "backend": "inprocess",
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.__pending_faces,
+            "batches": self.batches,
+            "requests": self.requests,
+            "faces": self.faces,
+            "max_batch_faces": self.max_batch_faces,
+            "avg_batch_faces": round(self.faces / self.batches, 2) if self.batches else 0.0,
+            "avg_wait_ms": round(self.total_wait / self.requests * 1000.0, 3) if self.requests else 0.0,
+            "avg_forward_ms": round(self.total_forward / self.batches * 1000.0, 3) if self.batches else 0.0,
+        }
+
+    def __detect(self, img, multiple):
+        return self.get_model().detect(img, multiple)
+
+    def __detect_with_boxes(self, img, multiple):
+        return self.get_model().detect_with_boxes(img, multiple)
+
+    def __detect_many(self, imgs, multiple):
+        return self.get_model().detect_many(imgs, multiple)
+
+    def __embed(self, faces: torch.Tensor) -> torch.Tensor:
+        return self.get_model().embed(faces)
+
+    def __ensure_worker(self) -> None:
+        # The worker is bound to the loop that first used it; test clients and
+        # reloads start a fresh loop, so rebuild the queue when the loop changes.
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop or self.__worker is None or self.__worker.done():
+            self.__loop = loop
+            self.__queue = asyncio.Queue()
+            self.__pending_faces = 0
+            # Fresh context: the worker must not inherit the first caller's request timings
+            self.__worker = loop.create_task(self.__run(), context=contextvars.Context())
+
+    async def __run(self) -> None:
+        queue = self.__queue
+        while True:
+            batch = [await queue.get()]
+            size = len(batch[0].faces)
+            deadline = perf_counter() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(item.faces) > self.max_batch_size:
+                    # Keep requests whole: run this batch now, start the next with item
+                    await self.__flush(batch)
+                    batch, size = [item], len(item.faces)
+                    deadline = perf_counter() + self.max_wait
+                    continue
+                batch.append(item)
+                size += len(item.faces)
+
+            await self.__flush(batch)
+
+    async def __flush(self, batch: list[_PendingCrops]) -> None:
+        started = perf_counter()
+        counts = [len(item.faces) for item in batch]
+        self.__pending_faces -= sum(counts)
+
+        try:
+            faces = batch[0].faces if len(batch) == 1 else torch.cat([item.faces for item in batch])
+            embs = await run_in_threadpool(self.__embed, faces)
+        except Exception as error:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.requests += len(batch)
+        self.faces += sum(counts)
+        self.max_batch_faces = max(self.max_batch_faces, sum(counts))
+        self.total_forward += perf_counter() - started
+        self.total_wait += sum(started - item.enqueued_at for item in batch)
+
+        offset = 0
+        for item, count in zip(batch, counts):
+            if not item.future.done():
+                item.future.set_result(embs[offset:offset + count])
+            offset += count
@@ -0,0 +1,206 @@
+"""
+ModelRegistry — lazy, warmed-up loading of the ML models.
+
+Modules register a loader (and optionally a warm-up) instead of building
+their model at import time:
+
+    model_registry.register("occlusion", OcclusionService, warmup=...)
+    service = model_registry.get("occlusion")        # loads on first use
+
+The app lifespan calls ``start_warmup()``. Depending on MODEL_WARMUP it:
+  "background" (default) loads and warms every model in a thread while the
+                         server already answers /ready with 503
+  "blocking"             loads everything before the app accepts requests
+  "lazy"                 loads nothing up front (each model on first use)
+
+``status()`` backs the /ready endpoint: per-model state, load and warm-up
+time, and the last error. A failed load is retried on the next ``get``.
+
+Prefork sharing (gunicorn.conf.py with MODEL_PRELOAD=1): ``preload_for_fork``
+loads the weights of every ``fork_safe`` model once in the gunicorn master and
+freezes the GC, so forked workers share those pages copy-on-write. Workers
+then only run the warm-up. Only plain PyTorch models are fork-safe: ONNX
+Runtime sessions (NudeNet, INFERENCE_ENGINE=onnx*) start thread pools when
+they are created and are loaded per worker. The master keeps torch at one
+thread so libgomp never starts its pool before the fork.
+"""
+
+import gc
+import os
+import threading
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable
+
+import torch
+from starlette.concurrency import run_in_threadpool
+
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+LOADED = "loaded"        # weights in memory (preloaded before fork), warm-up pending
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class _Entry:
+    name: str
+    loader: Callable[[], Any]
+    warmup: Callable[[Any], None] | None
+    required: bool
+    fork_safe: bool
+    state: str = NOT_LOADED
+    preloaded: bool = False
+    instance: Any = None
+    load_seconds: float | None = None
+    warmup_seconds: float | None = None
+    error: str | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.__entries: dict[str, _Entry] = {}
+        self.__warmup_thread: threading.Thread | None = None
+        self.__worker_threads: int | None = None
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        warmup: Callable[[Any], None] | None = None,
+        required: bool = True,
+        fork_safe: bool = False,
+    ) -> None:
+        """
+        Register a model; *required* models gate readiness and *fork_safe*
+        ones may be preloaded in a prefork master.
+        """
+        if name not in self.__entries:
+            self.__entries[name] = _Entry(
+                name=name, loader=loader, warmup=warmup, required=required, fork_safe=fork_safe
+            )
+
+    def get(self, name: str):
+        """Return the loaded model, loading (and warming) it on first use. Blocking."""
+        entry = self.__entries[name]
+        if entry.state == READY:
+            return entry.instance
+
+        with entry.lock:
+            if entry.state == LOADED:
+                self.__warm_up(entry)
+            elif entry.state != READY:
+                self.__load(entry)
+        if entry.state != READY:
+            raise RuntimeError(f"Model '{name}' failed to load: {entry.error}")
+        return entry.instance
+
+    async def aget(self, name: str):
+        """Like get(), but a cold load runs in the threadpool instead of on the event loop."""
+        entry = self.__entries[name]
+        if entry.state == READY:
+            return entry.instance
+        return await run_in_threadpool(self.get, name)
+
+    def is_loaded(self, name: str) -> bool:
+        return self.__entries[name].state == READY
+
+    def load_all(self) -> None:
+        for name in list(self.__entries):
+            try:
+                self.get(name)
+            except RuntimeError as error:
+                print(f"[ModelRegistry] {error}")
+
+    def start_warmup(self, mode: str = MODEL_WARMUP) -> None:
+        if mode == "blocking":
+            self.load_all()
+        elif mode == "background":
+            if self.__warmup_thread is None or not self.__warmup_thread.is_alive():
+                self.__warmup_thread = threading.Thread(
+                    target=self.load_all, name="model-warmup", daemon=True
+                )
+                self.__warmup_thread.start()
+        elif mode != "lazy":
+            print(f"[ModelRegistry] Unknown MODEL_WARMUP={mode!r}; loading models lazily.")
+
+    def preload_for_fork(self) -> None:
+        """Load fork-safe weights (no warm-up) in the prefork master, then freeze the GC."""
+        self.__worker_threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+        for entry in self.__entries.values():
+            if entry.fork_safe and entry.state == NOT_LOADED:
+                with entry.lock:
+                    self.__load(entry, warm=False)
+                    entry.preloaded = entry.state == LOADED
+
+        # Move everything allocated so far out of the collector's reach: a GC
+        # pass in a worker would otherwise write to (and un-share) those pages.
+        gc.collect()
+        gc.freeze()
+
+    def after_fork(self) -> None:
+        """Restore the worker's torch thread count (the master ran single-threaded)."""
+        if self.__worker_threads is not None:
+            torch.set_num_threads(self.__worker_threads)
+
+    @property
+    def ready(self) -> bool:
+        return all(e.state == READY for e in self.__entries.values() if e.required)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "models": {
+                e.name: {
+                    "state": e.state,
+                    "required": e.required,
+                    "preloaded": e.preloaded,
+                    "load_ms": None if e.load_seconds is None else round(e.load_seconds * 1000.0, 1),
+                    "warmup_ms": None if e.warmup_seconds is None else round(e.warmup_seconds * 1000.0, 1),
+                    "error": e.error,
+                }
+                for e in self.__entries.values()
+            },
+        }
+
+    def __load(self, entry: _Entry, warm: bool = True) -> None:
+        entry.state = LOADING
+        entry.error = None
+        try:
+            started = perf_counter()
+            entry.instance = entry.loader()
+            entry.load_seconds = perf_counter() - started
+        except Exception as error:
+            entry.state = FAILED
+            entry.error = repr(error)
+            return
+
+        entry.state = LOADED
+        if warm:
+            self.__warm_up(entry)
+
+    def __warm_up(self, entry: _Entry) -> None:
+        try:
+            if entry.warmup is not None:
+                started = perf_counter()
+                entry.warmup(entry.instance)
+                entry.warmup_seconds = perf_counter() - started
+        except Exception as error:
+            entry.state = FAILED
+            entry.error = repr(error)
+            entry.instance = None
+            return
+
+        entry.state = READY
+        print(
+            f"[ModelRegistry] {entry.name} ready "
+            f"(load {entry.load_seconds:.2f}s, warm-up {entry.warmup_seconds or 0.0:.2f}s)"
+        )
+
+
+# Single global instance shared across the app
+model_registry = ModelRegistry()
@@ -4,12 +4,22 @@ from facenet_pytorch import MTCNN, InceptionResnetV1
 from fastapi import HTTPException
 import torch.nn.functional as F
 
+from app.service.FaceDetector import load_detector
+from app.service.InferenceEngine import EMBEDDER_ONNX, load_engine
+from app.util.image_preprocess import MAX_DIMENSION, downscale
+from app.util.timing import timed
+
 
 class ModelService:
     def __init__(self):
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.embedder = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        self.embedder = load_engine(
+            lambda: InceptionResnetV1(pretrained='vggface2').eval().to(self.device),
+            EMBEDDER_ONNX,
+            self.device,
+        )
         self.mtcnn = MTCNN(image_size=160, margin =20, keep_all= True, device=self.device)
+        self.detector = load_detector(self.mtcnn)
 
 
     def img_to_embedding(self, img, multiple=False):
@@ -18,16 +28,76 @@ class ModelService:
         If 1 face is detected, return 1 embedding; 
         if multiple=True detect >= 1 faces, return a list of embedding
         """
-        faces = self.mtcnn(img)
-        if faces is None:
+        return self.embed(self.detect(img, multiple))
+
+
+    def detect(self, img, multiple=False):
+        """
+        Run the configured detector (MTCNN by default) on a copy of img
+        downscaled to MAX_DIMENSION, map the boxes back and return the
+        aligned crops, cut from the full-resolution img, as a (k, 3, 160, 160) tensor.
+        """
+        with timed("downscale"):
+            small, scale = downscale(img, MAX_DIMENSION)
+
+        with timed("detect"):
+            boxes = self.detector.detect(small)[:, :4]
+        return self.__crop(img, boxes, scale, multiple)
+
+
+    def detect_with_boxes(self, img, multiple=False):
+        """
+        detect() that also returns where the faces are: ((k, 4) float32
+        x1, y1, x2, y2 boxes in full-resolution img coordinates, crops),
+        for callers that follow faces across frames.
+        """
+        with timed("downscale"):
+            small, scale = downscale(img, MAX_DIMENSION)
+
+        with timed("detect"):
+            boxes = self.detector.detect(small)[:, :4]
+        faces = self.__crop(img, boxes, scale, multiple)
+        return (boxes / scale).astype(np.float32), faces
+
+
+    def detect_many(self, imgs, multiple=False):
+        """
+        detect() over several frames with one batched detector call. Returns,
+        per frame, its crops or the HTTPException detect() would have raised,
+        so one bad frame does not fail the others.
+        """
+        with timed("downscale"):
+            scaled = [downscale(img, MAX_DIMENSION) for img in imgs]
+
+        with timed("detect"):
+            dets = self.detector.detect_batch([small for small, _ in scaled])
+
+        results = []
+        for img, (_, scale), det in zip(imgs, scaled, dets):
+            try:
+                results.append(self.__crop(img, det[:, :4], scale, multiple))
+            except HTTPException as error:
+                results.append(error)
+        return results
+
+
+    def __crop(self, img, boxes, scale, multiple):
+        if len(boxes) == 0:
             raise HTTPException(status_code = 400, detail = 'No face detected')
 
-        if not multiple and len(faces) > 1:
+        if not multiple and len(boxes) > 1:
             raise HTTPException(status_code=400, detail="Multiple faces detected.")
-        else:
-            with torch.no_grad():
-                emb = self.embedder(faces.to(self.device))
-                embs = torch.nn.functional.normalize(emb,p=2,dim =1)
+
+        with timed("crop"):
+            faces = self.mtcnn.extract(img, boxes / scale, None)
+        return faces
+
+
+    def embed(self, faces):
+        """Run the embedder over a batch of face crops and L2-normalize the output."""
+        with timed("embed"):
+            emb = self.embedder.run(faces)
+            embs = torch.nn.functional.normalize(emb,p=2,dim =1)
         return embs
     
 
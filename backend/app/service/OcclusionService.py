@@ -1,12 +1,18 @@
 """
 OcclusionService — runs EfficientNet-B0 occlusion classifier on a face crop.
 
+score_faces() takes the aligned crops ModelService.detect already produced,
+so a frame is decoded and detected once for both the occlusion check and
+the embedding. is_occluded() scores a whole frame.
+
 Classes (must match training):
   0 = clear
   1 = occluded
 
-Loads model from backend/models/occlusion_model.pth.
-If the file is missing the service is disabled and all checks pass through.
+Loads model from backend/models/occlusion_model.pth, or the exported
+occlusion_model.onnx / .int8.onnx when INFERENCE_ENGINE is "onnx" or
+"onnx-int8" (see InferenceEngine).
+If neither file is present the service is disabled and all checks pass through.
 """
 
 from pathlib import Path
@@ -15,9 +21,14 @@ import cv2
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torchvision import models, transforms
 from PIL import Image
 
+from app.service.InferenceEngine import INFERENCE_ENGINE, OCCLUSION_ONNX, load_engine, onnx_available
+from app.service.ModelRegistry import model_registry
+from app.util.timing import timed
+
 MODEL_PATH  = Path(__file__).parent.parent.parent / "models" / "occlusion_model.pth"
 # DEBUG_DIR   = Path(__file__).parent.parent.parent / "debug_frames"
 # DEBUG_DIR.mkdir(exist_ok=True)
@@ -38,22 +49,36 @@ class OcclusionService:
         self.enabled = False
         self.model   = None
 
-        if not MODEL_PATH.exists():
+        if not MODEL_PATH.exists() and not onnx_available(OCCLUSION_ONNX):
             print(
                 f"[OcclusionService] Model not found at {MODEL_PATH}. "
                 "Occlusion checks disabled — train and copy the model to enable."
             )
             return
 
-        model = models.efficientnet_b0(weights=None)
-        model.classifier[1] = nn.Linear(model.classifier[1].in_features, 2)
-        model.load_state_dict(torch.load(MODEL_PATH, map_location=self.device))
-        model.eval()
-        model.to(self.device)
-
-        self.model   = model
+        self.model   = load_engine(lambda: load_torch_model(self.device), OCCLUSION_ONNX, self.device)
         self.enabled = True
-        print(f"[OcclusionService] Loaded from {MODEL_PATH} on {self.device}")
+        print(f"[OcclusionService] Loaded {self.model.name} engine on {self.device}")
+
+    def score_faces(
+        self,
+        faces: torch.Tensor,
+        threshold: float = 0.8,
+    ) -> list[tuple[bool, float]]:
+        """
+        faces    : aligned crops from ModelService.detect, (k, 3, 160, 160)
+        threshold: confidence above which a face is considered occluded.
+
+        Scores all crops in one forward pass; returns one
+        (is_occluded, occluded_prob) per face. If the service is disabled every
+        face passes with (False, 0.0).
+        """
+        if not self.enabled:
+            return [(False, 0.0)] * len(faces)
+
+        with timed("occlusion"):
+            out = self.model.run(face_inputs(faces).to(self.device))
+            return [self.__decide(p, threshold) for p in torch.softmax(out, dim=1)]
 
     def is_occluded(
         self,
@@ -75,23 +100,57 @@ class OcclusionService:
         # pil_resized = pil.resize((224, 224))  # what the model actually sees
         tensor = _transform(pil).unsqueeze(0).to(self.device)
 
-        with torch.no_grad():
-            out   = self.model(tensor)
-            probs = torch.softmax(out, dim=1)
-            clear_prob    = probs[0, 0].item()
-            occluded_prob = probs[0, 1].item()
+        out   = self.model.run(tensor)
+        probs = torch.softmax(out, dim=1)
+
+        # import time
+        # debug_path = DEBUG_DIR / f"{int(time.time()*1000)}_{label}.jpg"
+        # pil_resized.save(debug_path)
+
+        return self.__decide(probs[0], threshold)
+
+    def __decide(self, probs: torch.Tensor, threshold: float) -> tuple[bool, float]:
+        clear_prob    = probs[0].item()
+        occluded_prob = probs[1].item()
 
         # Reject unless the model is confidently clear — uncertainty counts as occluded
         is_occ = clear_prob < threshold
         label  = "OCCLUDED" if is_occ else "CLEAR"
         print(f"[OcclusionService] clear={clear_prob:.3f}  occluded={occluded_prob:.3f}  result={label}")
+        return is_occ, occluded_prob
 
-        # import time
-        # debug_path = DEBUG_DIR / f"{int(time.time()*1000)}_{label}.jpg"
-        # pil_resized.save(debug_path)
 
-        return is_occ, occluded_prob
+def face_inputs(faces: torch.Tensor) -> torch.Tensor:
+    """
+    MTCNN crops -> classifier input, the tensor equivalent of _transform.
+
+    The crops are (x - 127.5) / 128 standardized, 160x160, with channels in
+    the order of the decoded frame (BGR, as cv2 decodes it).
+    """
+    pixels = ((faces * 128.0 + 127.5).clamp(0.0, 255.0) / 255.0).flip(1)   # BGR -> RGB
+    pixels = F.interpolate(pixels, size=(224, 224), mode="bilinear", align_corners=False, antialias=True)
+    mean = torch.tensor(MEAN, dtype=pixels.dtype).view(1, 3, 1, 1)
+    std = torch.tensor(STD, dtype=pixels.dtype).view(1, 3, 1, 1)
+    return (pixels - mean) / std
+
+
+def load_torch_model(device) -> nn.Module:
+    """EfficientNet-B0 with the 2-class head, weights from MODEL_PATH."""
+    model = models.efficientnet_b0(weights=None)
+    model.classifier[1] = nn.Linear(model.classifier[1].in_features, 2)
+    model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
+    model.eval()
+    model.to(device)
+    return model
+
+
+def _warm_up(service: OcclusionService) -> None:
+    if service.enabled:
+        service.model.run(torch.zeros(1, 3, 224, 224))
 
 
-# Singleton — loaded once at startup
-occlusion_service = OcclusionService()
+# Loaded on first use or by the startup warm-up: model_registry.get(OCCLUSION_MODEL)
+OCCLUSION_MODEL = "occlusion"
+model_registry.register(
+    OCCLUSION_MODEL, OcclusionService, warmup=_warm_up, fork_safe=INFERENCE_ENGINE == "torch"
+)
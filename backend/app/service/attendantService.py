@@ -1,14 +1,20 @@
-from app.db.repository.attendance import AttendanceRepository
+from app.db.repository.attendance import AttendanceRepository, gallery_member
 from app.db.models.attendance import Attendance
-from app.db.models.event import Event
 from app.db.models.session import Session as SessionModel
-from app.db.models.user import User
+from app.util.checkin_journal import checkin_journal
 from app.util.datetime_json import utc_iso_z
-from app.util.embeddings import cosine_similarity
+from app.util.gallery import EmbeddingGallery, GalleryMatch, build_gallery
+from app.util.gallery_cache import gallery_cache
+from app.util.timing import timed
 
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-import numpy as np
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import os
+
+# Minutes after a session's end_time during which face check-in stays open
+CHECKIN_GRACE_MINUTES = float(os.getenv("CHECKIN_GRACE_MINUTES", "0"))
 
 
 
@@ -17,18 +23,6 @@ class AttendanceService:
         self.__repo = AttendanceRepository(session=session)
         self.session = session
 
-    def __get_session_creator_id(self, session_id: int) -> int | None:
-        session_obj = self.session.get(SessionModel, session_id)
-        if session_obj is None:
-            return None
-
-        return (
-            self.session
-            .query(Event.user_id)
-            .filter(Event.id == session_obj.event_id)
-            .scalar()
-        )
-
     def add_users_for_session(self, session_id: int) -> list[Attendance]:
         return self.__repo.add_users(session_id)
 
@@ -50,6 +44,8 @@ class AttendanceService:
                 detail=f"Invalid status '{status}'. Must be present, late, or absent.",
             )
 
+        # Journaled face check-ins must land before a manual override
+        checkin_journal.flush()
         att, previous_status = self.__repo.update_status(
             user_id, session_id, status_enum
         )
@@ -73,6 +69,11 @@ class AttendanceService:
 
     def get_session_attendance(self, session_id: int) -> dict:
         records = self.__repo.get_attendance_by_session_id(session_id)
+        pending = checkin_journal.pending_for_session(session_id)
+        for r in records:
+            entry = pending.get(r["user_id"])
+            if entry is not None and r["status"] == "absent":
+                r["status"], r["check_in_time"] = entry["status"], entry["check_in_time"]
         summary = {"present": 0, "late": 0, "absent": 0, "total": len(records)}
         for r in records:
             status_val = r["status"].value if hasattr(r["status"], "value") else r["status"]
@@ -101,63 +102,84 @@ class AttendanceService:
             },
         }
 
-    def check_in_with_embedding(
-        self,
-        session_id: int,
-        face_embedding: list[float],
-        threshold: float = 0.5,
-    ):
+    def check_admission(self, session_id: int) -> None:
         """
-        Given a session_id and a face embedding:
-        - find all Attendance rows for that session
-        - for each attendance.user_id, load User and its embedding
-        - compute cosine similarity between face_embedding and user.embedding
-        - pick best match above threshold and mark them PRESENT
+        Cheap checks run before any inference: the session exists, has
+        attendance rows and has not ended (end_time is Pacific wall clock).
         """
-
-        # 1) Find all attendance records for this session
-        attendances = (
-            self.session
-            .query(Attendance)
-            .filter(Attendance.session_id == session_id)
-            .all()
-        )
-
-        if not attendances:
+        row = self.__repo.get_checkin_admission_row(session_id)
+        if row is None or not row.has_attendees:
             raise HTTPException(
                 status_code=404,
                 detail="No attendance records for this session",
             )
+        if row.end_time is not None:
+            now = datetime.now(ZoneInfo("America/Los_Angeles")).replace(tzinfo=None)
+            if now > row.end_time + timedelta(minutes=CHECKIN_GRACE_MINUTES):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="This session has ended; check-in is closed.",
+                )
+
+    def load_session_gallery(self, session_id: int) -> EmbeddingGallery:
+        """
+        Load every face template of a session's roster into one matrix (the
+        single Users.embedding for users without templates). The event
+        creator is never part of the gallery. Galleries are served from the
+        process-wide gallery_cache when possible.
+        """
+        gallery = gallery_cache.get(session_id)
+        if gallery is not None:
+            return gallery
+
+        generation = gallery_cache.generation()
+        with timed("gallery_load"):
+            rows = self.__repo.get_session_gallery_rows(session_id)
+            if not rows:
+                raise HTTPException(
+                    status_code=404,
+                    detail="No attendance records for this session",
+                )
+
+            members = [r for r in rows if not r.is_creator]
+            gallery = build_gallery(gallery_member(r) for r in members)
+        gallery_cache.put(
+            session_id,
+            event_id=rows[0].event_id,
+            gallery=gallery,
+            roster=(r.user_id for r in members),
+            generation=generation,
+        )
+        return gallery
 
-        query_emb = np.asarray(face_embedding, dtype=float)
-        creator_id = self.__get_session_creator_id(session_id)
-
-        best_user = None
-        best_sim = float('-inf')
-
-        # 2) For each attendance row, get the user and compare embeddings
-        for att in attendances:
-            if creator_id is not None and att.user_id == creator_id:
-                continue
-
-            user = self.session.get(User, att.user_id)
-            if not user or not user.embedding:
-                continue
-
-            user_emb = np.asarray(user.embedding, dtype=float)
-            sim = cosine_similarity(query_emb, user_emb)
-
-            if sim > best_sim:
-                best_sim = sim
-                best_user = user
+    def match_faces(
+        self,
+        session_id: int,
+        face_embeddings,
+        threshold: float | None = None,
+    ) -> list[GalleryMatch]:
+        """Score all query faces against the session gallery in one matrix multiply."""
+        gallery = self.load_session_gallery(session_id)
 
         # No users had embeddings
-        if best_user is None:
+        if len(gallery) == 0:
             raise HTTPException(
                 status_code=420,
                 detail="Could not find the user to checkin, please try again.",
             )
 
+        with timed("match"):
+            return gallery.best_matches(face_embeddings, threshold=threshold)
+
+    def check_in_match(
+        self,
+        session_id: int,
+        match: GalleryMatch,
+        threshold: float = 0.5,
+    ) -> dict:
+        """Apply the threshold to a gallery match and mark the user PRESENT/LATE."""
+        best_sim = match.similarity
+
         # Reject low-similarity matches before anything else
         if best_sim < threshold:
             raise HTTPException(
@@ -165,12 +187,11 @@ class AttendanceService:
                 detail="This student is not recognized please try again.",
             )
 
-        best_user_id = best_user.id
         attendance = (
             self.session
             .query(Attendance)
             .filter(Attendance.session_id == session_id,
-                    Attendance.user_id == best_user_id)
+                    Attendance.user_id == match.user_id)
             .first()
         )
 
@@ -185,42 +206,186 @@ class AttendanceService:
             if hasattr(attendance.status, "value")
             else str(attendance.status)
         )
+        check_in_time = attendance.check_in_time
+        pending = checkin_journal.pending(session_id, match.user_id)
+        if pending is not None:
+            attendance_status, check_in_time = pending["status"], pending["check_in_time"]
 
         if attendance_status in {"present", "late"}:
             return {
-                "user_id": best_user.id,
-                "first_name": getattr(best_user, "first_name", None),
-                "last_name": getattr(best_user, "last_name", None),
+                "user_id": match.user_id,
+                "first_name": match.first_name,
+                "last_name": match.last_name,
                 "already_checked_in": True,
                 "attendance_updated": False,
                 "similarity": best_sim,
                 "status": attendance_status,
-                "check_in_time": utc_iso_z(attendance.check_in_time),
+                "check_in_time": utc_iso_z(check_in_time),
             }
 
         session_obj = self.session.get(SessionModel, session_id)
         session_start_time = session_obj.start_time if session_obj else None
 
-        attendance = self.__repo.check_in(
-            user_id=best_user.id,
-            session_id=session_id,
-            session_start_time=session_start_time,
-        )
-
-        updated_status = (
-            attendance.status.value
-            if hasattr(attendance.status, "value")
-            else str(attendance.status)
-        )
+        if checkin_journal.enabled:
+            entry = self.__journal_check_ins(session_id, [match.user_id], session_start_time)[0]
+            updated_status, check_in_time = entry["status"], entry["check_in_time"]
+        else:
+            with timed("attendance_commit"):
+                attendance = self.__repo.check_in(
+                    user_id=match.user_id,
+                    session_id=session_id,
+                    session_start_time=session_start_time,
+                )
+            updated_status = (
+                attendance.status.value
+                if hasattr(attendance.status, "value")
+                else str(attendance.status)
+            )
+            check_in_time = attendance.check_in_time
 
         return {
-            "user_id": best_user.id,
-            "first_name": getattr(best_user, "first_name", None),
-            "last_name": getattr(best_user, "last_name", None),
+            "user_id": match.user_id,
+            "first_name": match.first_name,
+            "last_name": match.last_name,
             "similarity": best_sim,
             "attendance_id": attendance.id,
             "already_checked_in": False,
             "attendance_updated": True,
             "status": updated_status,
-            "check_in_time": utc_iso_z(attendance.check_in_time),
+            "check_in_time": utc_iso_z(check_in_time),
         }
+
+    def __journal_check_ins(self, session_id: int, user_ids: list[int], session_start_time) -> list[dict]:
+        """Acknowledge check-ins once they are fsync'd to the journal; the flusher writes them to Postgres."""
+        when, status = self.__repo.check_in_time_and_status(None, session_start_time)
+        entries = [
+            {"session_id": session_id, "user_id": uid, "status": status.value, "check_in_time": when}
+            for uid in user_ids
+        ]
+        with timed("attendance_commit"):
+            checkin_journal.append(entries)
+        return entries
+
+    def check_in_faces(
+        self,
+        session_id: int,
+        face_embeddings,
+        threshold: float = 0.5,
+    ) -> list[dict | HTTPException]:
+        """
+        Group check-in for every face detected in one frame:
+        - score all faces against the session gallery in one similarity matrix
+        - solve a one-to-one face/user assignment so no user is matched twice
+        - write all resulting check-ins in a single transaction
+        Returns one entry per face: the check-in result or the HTTPException
+        explaining why that face was not checked in.
+        """
+        gallery = self.load_session_gallery(session_id)
+
+        # No users had embeddings
+        if len(gallery) == 0:
+            raise HTTPException(
+                status_code=420,
+                detail="Could not find the user to checkin, please try again.",
+            )
+
+        with timed("match"):
+            assigned = gallery.assign(face_embeddings, threshold=threshold)
+        matched_ids = [m.user_id for m in assigned if m is not None]
+
+        attendances = {}
+        if matched_ids:
+            attendances = {
+                att.user_id: att
+                for att in (
+                    self.session.query(Attendance)
+                    .filter(Attendance.session_id == session_id,
+                            Attendance.user_id.in_(matched_ids))
+                    .all()
+                )
+            }
+
+        # Journaled, not yet flushed check-ins override the stored status and time
+        journaled = {
+            uid: entry for uid in attendances
+            if (entry := checkin_journal.pending(session_id, uid)) is not None
+        }
+
+        def _status(att) -> str:
+            if att.user_id in journaled:
+                return journaled[att.user_id]["status"]
+            return att.status.value if hasattr(att.status, "value") else str(att.status)
+
+        def _check_in_time(att):
+            if att.user_id in journaled:
+                return journaled[att.user_id]["check_in_time"]
+            return att.check_in_time
+
+        to_check_in = [
+            uid for uid in matched_ids
+            if uid in attendances and _status(attendances[uid]) not in {"present", "late"}
+        ]
+        if to_check_in:
+            session_obj = self.session.get(SessionModel, session_id)
+            session_start_time = session_obj.start_time if session_obj else None
+            if checkin_journal.enabled:
+                entries = self.__journal_check_ins(session_id, to_check_in, session_start_time)
+                journaled.update({e["user_id"]: e for e in entries})
+            else:
+                with timed("attendance_commit"):
+                    updated = self.__repo.check_in_many(
+                        user_ids=to_check_in,
+                        session_id=session_id,
+                        session_start_time=session_start_time,
+                    )
+                attendances.update({att.user_id: att for att in updated})
+        checked_in = set(to_check_in)
+
+        results: list[dict | HTTPException] = []
+        for match in assigned:
+            if match is None:
+                results.append(HTTPException(
+                    status_code=422,
+                    detail="This student is not recognized please try again.",
+                ))
+                continue
+
+            attendance = attendances.get(match.user_id)
+            if attendance is None:
+                results.append(HTTPException(
+                    status_code=404,
+                    detail="Matched user is not enrolled in this session.",
+                ))
+                continue
+
+            updated_now = match.user_id in checked_in
+            result = {
+                "user_id": match.user_id,
+                "first_name": match.first_name,
+                "last_name": match.last_name,
+                "similarity": match.similarity,
+                "already_checked_in": not updated_now,
+                "attendance_updated": updated_now,
+                "status": _status(attendance),
+                "check_in_time": utc_iso_z(_check_in_time(attendance)),
+            }
+            if updated_now:
+                result["attendance_id"] = attendance.id
+            results.append(result)
+
+        return results
+
+    def check_in_with_embedding(
+        self,
+        session_id: int,
+        face_embedding: list[float],
+        threshold: float = 0.5,
+    ):
+        """
+        Given a session_id and a face embedding:
+        - load the session gallery (all roster embeddings, creator excluded)
+        - score the face against every enrolled user in one matrix multiply
+        - pick best match above threshold and mark them PRESENT
+        """
+        match = self.match_faces(session_id, [face_embedding], threshold=threshold)[0]
+        return self.check_in_match(session_id, match, threshold=threshold)
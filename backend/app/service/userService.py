@@ -4,6 +4,7 @@ from app.core.security.hashHelper import HashHelper
 from app.core.security.authHandler import AuthHandler
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
+from app.util.timing import timed
 from typing import Any, Dict
 
 class UserService:
@@ -92,4 +93,16 @@ class UserService:
             updates=updates
         )
 
+        return UserOutput.model_validate(updated_user, from_attributes=True)
+
+    def add_face_template(self, user_id: int, embedding) -> UserOutput:
+        """Enroll one more face template for the user (capped at FACE_TEMPLATES_PER_USER)."""
+        with timed("enroll_commit"):
+            updated_user = self.__userRepository.add_face_template(
+                id=user_id,
+                embedding=[float(x) for x in embedding],
+            )
+        if not updated_user:
+            raise HTTPException(status_code=400, detail="User Id does not exist.")
+
         return UserOutput.model_validate(updated_user, from_attributes=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Admission control for the face recognition endpoints.
+
+Decode + detect + embed is the expensive part of a check-in or enrollment
+request, and with nothing bounding it a burst of kiosks piles up work until
+every request in the worker is slow. InferenceAdmission caps how many
+requests per worker run recognition at once (INFERENCE_MAX_CONCURRENT)
+and lets at most INFERENCE_MAX_QUEUE more wait, FIFO, up to
+INFERENCE_QUEUE_TIMEOUT_SECONDS for a slot. Anything beyond that is turned
+away right away with 503 and a Retry-After estimated from the recent
+service time, so admitted requests keep their normal latency and rejected
+clients back off instead of timing out.
+
+    async with inference_admission.slot():
+        embs = await upload_img_to_embedding(upload_image)
+
+The limiter is per worker process (like every other in-memory structure in
+app/util) and runs on the event loop, so it needs no lock.
+"""
+
+import asyncio
+import math
+import os
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from time import perf_counter
+
+from fastapi import HTTPException, status
+
+INFERENCE_MAX_CONCURRENT = int(os.getenv("INFERENCE_MAX_CONCURRENT", "4"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "16"))
+INFERENCE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# Weight of the newest sample in the moving average of the slot hold time
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class InferenceAdmission:
+    def __init__(
+        self,
+        max_concurrent: int = INFERENCE_MAX_CONCURRENT,
+        max_queue: int = INFERENCE_MAX_QUEUE,
+        queue_timeout: float = INFERENCE_QUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.__running = 0
+        self.__waiters: deque[asyncio.Future] = deque()
+        self.__service_time = 0.5  # seconds, until the first request finished
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_waiting = 0
+
+    @property
+    def saturated(self) -> bool:
+        """True when a new request would be rejected without waiting."""
+        return self.__running >= self.max_concurrent and len(self.__waiters) >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained, at least 1."""
+        backlog = len(self.__waiters) + self.__running
+        return max(1, math.ceil(backlog / max(1, self.max_concurrent) * self.__service_time))
+
+    def reject_if_saturated(self) -> None:
+        """Fail fast, e.g. before a one-time liveness token is spent on a request that cannot run."""
+        if self.saturated:
+            self.rejected += 1
+            raise self.__overloaded()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the max_concurrent slots; 503 when none frees up in time."""
+        await self.__acquire()
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            self.__service_time += _SERVICE_TIME_ALPHA * (elapsed - self.__service_time)
+            self.__release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "running": self.__running,
+            "waiting": len(self.__waiters),
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "service_time_ms": round(self.__service_time * 1000.0, 3),
+            "retry_after": self.retry_after(),
+        }
+
+    async def __acquire(self) -> None:
+        if self.__running < self.max_concurrent and not self.__waiters:
+            self.__running += 1
+            self.admitted += 1
+            return
+        if len(self.__waiters) >= self.max_queue:
+            self.rejected += 1
+            raise self.__overloaded()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.__waiters.append(waiter)
+        self.queued += 1
+        self.peak_waiting = max(self.peak_waiting, len(self.__waiters))
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.__abandon(waiter)
+            self.timed_out += 1
+            self.rejected += 1
+            raise self.__overloaded()
+        except BaseException:
+            # Client went away while queued
+            self.__abandon(waiter)
+            raise
+        self.admitted += 1
+
+    def __abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as we gave up: pass it on
+            self.__release()
+        else:
+            with suppress(ValueError):
+                self.__waiters.remove(waiter)
+
+    def __release(self) -> None:
+        # Hand the slot straight to the oldest live waiter, so it cannot be overtaken
+        while self.__waiters:
+            waiter = self.__waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.__running -= 1
+
+    def __overloaded(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Face recognition is busy, please try again shortly.",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+
+# Single global instance shared across the app
+inference_admission = InferenceAdmission()
@@ -0,0 +1,214 @@
+"""Approximate nearest-neighbour index for very large check-in galleries.
+
+Exhaustive scoring is one (m, d) x (d, n) multiply, which is fine for a
+lecture but not for a 10k-100k user orientation event. ``IVFIndex`` is an
+inverted-file index implemented with NumPy only:
+
+- vectors are projected with PCA to ``projection_dim`` dimensions,
+- spherical k-means in that space splits the gallery into ``nlist`` lists,
+- a query scores the centroids, scans the ``nprobe`` closest lists with the
+  projected vectors, keeps the ``rerank_k`` best candidates, and re-ranks
+  them exactly against the full-dimension gallery rows.
+
+``nprobe`` is the recall/latency knob: more lists means higher recall and
+more work per query. Recall drops for queries only moderately similar to
+their match (on 50k random 512-d users: 73% at cosine 0.5, 93% at 0.7 with
+the defaults), which is why EmbeddingGallery re-scores results that do
+not clear the threshold by a margin exactly. The index stores gallery row numbers, not user ids,
+and supports incremental ``add`` / ``remove`` plus ``remap`` (a renumbered
+copy) so a cached gallery can be patched when users enroll, re-enroll or
+leave instead of being rebuilt.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+ANN_MIN_GALLERY_SIZE = int(os.getenv("ANN_MIN_GALLERY_SIZE", "5000"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "64"))
+ANN_RERANK_K = int(os.getenv("ANN_RERANK_K", "128"))
+ANN_PROJECTION_DIM = int(os.getenv("ANN_PROJECTION_DIM", "64"))
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 32
+PCA_SAMPLE_SIZE = 20000
+
+
+def _normalize(arr: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    np.divide(arr, norms, out=arr, where=norms > 0)
+    return arr
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        projection: np.ndarray,
+        centroids: np.ndarray,
+        nprobe: int = ANN_NPROBE,
+        rerank_k: int = ANN_RERANK_K,
+    ) -> None:
+        self.projection = projection        # (d, p) float32
+        self.centroids = centroids          # (nlist, p) float32, unit-norm rows
+        self.nprobe = nprobe
+        self.rerank_k = rerank_k
+        self.__lock = threading.Lock()
+        self.__list_rows: list[np.ndarray] = [
+            np.empty(0, dtype=np.int64) for _ in range(len(centroids))
+        ]
+        self.__list_vecs: list[np.ndarray] = [
+            np.empty((0, projection.shape[1]), dtype=np.float32) for _ in range(len(centroids))
+        ]
+        self.__row_list: dict[int, int] = {}
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        rows: np.ndarray,
+        nlist: int | None = None,
+        projection_dim: int = ANN_PROJECTION_DIM,
+        nprobe: int = ANN_NPROBE,
+        rerank_k: int = ANN_RERANK_K,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Train projection and coarse centroids on ``matrix[rows]`` and index those rows."""
+        rng = np.random.default_rng(seed)
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = matrix[rows]
+        n, dim = vectors.shape
+
+        # PCA projection (identity when the embedding is already small)
+        if dim <= projection_dim:
+            projection = np.eye(dim, dtype=np.float32)
+        else:
+            sample = vectors[rng.choice(n, size=min(n, PCA_SAMPLE_SIZE), replace=False)]
+            centered = sample - sample.mean(axis=0)
+            _, eigvecs = np.linalg.eigh(centered.T @ centered)
+            projection = np.ascontiguousarray(
+                eigvecs[:, ::-1][:, :projection_dim], dtype=np.float32
+            )
+
+        projected = _normalize(vectors @ projection)
+
+        # Spherical k-means on a training sample of the projected vectors
+        if nlist is None:
+            nlist = int(2 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        train = projected[
+            rng.choice(n, size=min(n, nlist * KMEANS_SAMPLES_PER_LIST), replace=False)
+        ]
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            present, starts = np.unique(assign[order], return_index=True)
+            sums = train[rng.choice(len(train), size=nlist)]   # re-seeds empty lists
+            sums[present] = np.add.reduceat(train[order], starts, axis=0)
+            centroids = _normalize(sums)
+
+        index = cls(projection, centroids, nprobe=nprobe, rerank_k=rerank_k)
+        assign = np.argmax(projected @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        for list_id in range(nlist):
+            members = order[bounds[list_id]:bounds[list_id + 1]]
+            index.__list_rows[list_id] = rows[members]
+            index.__list_vecs[list_id] = projected[members]
+        index.__row_list = {int(r): int(a) for r, a in zip(rows, assign)}
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__row_list)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.projection.nbytes
+            + self.centroids.nbytes
+            + sum(v.nbytes + r.nbytes for v, r in zip(self.__list_vecs, self.__list_rows))
+        )
+
+    def add(self, row: int, vector) -> None:
+        """Index gallery row *row* (replacing it if it is already indexed)."""
+        projected = _normalize(
+            np.asarray(vector, dtype=np.float32).reshape(1, -1) @ self.projection
+        )
+        list_id = int(np.argmax(projected @ self.centroids.T))
+        with self.__lock:
+            self.__remove_locked(row)
+            self.__list_rows[list_id] = np.append(self.__list_rows[list_id], row)
+            self.__list_vecs[list_id] = np.vstack([self.__list_vecs[list_id], projected])
+            self.__row_list[row] = list_id
+
+    def remove(self, row: int) -> None:
+        with self.__lock:
+            self.__remove_locked(row)
+
+    def remap(self, new_rows: np.ndarray) -> "IVFIndex":
+        """
+        Copy of the index with gallery row r renumbered to ``new_rows[r]``;
+        rows mapped to -1 are dropped. Projection and centroids are shared,
+        so this costs O(n) and no k-means.
+        """
+        new_rows = np.asarray(new_rows, dtype=np.int64)
+        index = IVFIndex(self.projection, self.centroids, nprobe=self.nprobe, rerank_k=self.rerank_k)
+        with self.__lock:
+            for list_id, (rows, vecs) in enumerate(zip(self.__list_rows, self.__list_vecs)):
+                mapped = new_rows[rows]
+                kept = mapped >= 0
+                index.__list_rows[list_id] = mapped[kept]
+                index.__list_vecs[list_id] = vecs[kept]
+        index.__row_list = {
+            r: list_id for list_id, rows in enumerate(index.__list_rows) for r in rows.tolist()
+        }
+        return index
+
+    def search(self, queries: np.ndarray, matrix: np.ndarray, k: int = 1):
+        """
+        Return ``(rows, scores)``, each (m, k), for unit-norm *queries*.
+        Scores are exact cosine similarities against *matrix*; slots without
+        a candidate hold row -1 and score -1.0.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        m = queries.shape[0]
+        out_rows = np.full((m, k), -1, dtype=np.int64)
+        out_scores = np.full((m, k), -1.0, dtype=np.float32)
+
+        projected = _normalize(queries @ self.projection)
+        nprobe = max(1, min(self.nprobe, self.nlist))
+        coarse = projected @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        with self.__lock:
+            list_rows = [[self.__list_rows[l] for l in p] for p in probes]
+            list_vecs = [[self.__list_vecs[l] for l in p] for p in probes]
+
+        for i in range(m):
+            cand_rows = np.concatenate(list_rows[i])
+            if cand_rows.size == 0:
+                continue
+            approx = np.concatenate(list_vecs[i]) @ projected[i]
+            keep = min(max(self.rerank_k, k), cand_rows.size)
+            top = np.argpartition(-approx, keep - 1)[:keep]
+            cand_rows = cand_rows[top]
+
+            exact = matrix[cand_rows] @ queries[i]
+            best = np.argsort(-exact, kind="stable")[:k]
+            out_rows[i, :best.size] = cand_rows[best]
+            out_scores[i, :best.size] = exact[best]
+
+        return out_rows, out_scores
+
+    def __remove_locked(self, row: int) -> None:
+        list_id = self.__row_list.pop(row, None)
+        if list_id is None:
+            return
+        keep = self.__list_rows[list_id] != row
+        self.__list_rows[list_id] = self.__list_rows[list_id][keep]
+        self.__list_vecs[list_id] = self.__list_vecs[list_id][keep]
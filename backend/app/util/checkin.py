@@ -0,0 +1,354 @@
+"""
+Face check-in shared by POST /protected/session/checkin and the kiosk stream
+at /ws/checkin/{session_id}.
+
+record_checkins() matches the embeddings of one frame against the session
+gallery, writes the check-ins and broadcasts them to the dashboard.
+recognize_frame() runs a whole frame through detection and check-in and,
+given a FaceTracker, skips the embedder and matcher for faces whose track
+was already identified in an earlier frame (see app/util/face_tracker.py).
+
+CheckinStream serves one kiosk socket. Text messages are JSON control
+messages; binary messages are encoded frames (JPEG/PNG/WebP):
+
+    -> {"type": "challenge"}                          <- {"type": "challenge", "token", "action", ...}
+    -> {"type": "liveness", "token", "action"}        <- {"type": "armed", "expires_in"}
+    -> <frame bytes>                                   <- {"type": "result", "stats", "result", "frames"}
+
+A verified liveness token arms the stream for CHECKIN_WS_ARMED_SECONDS;
+the first frame that checks somebody in disarms it again, so every
+check-in still needs its own liveness challenge (requested over the same
+socket). Frames received while disarmed are dropped and answered once with
+{"type": "liveness_required"}.
+
+Frames go into a single latest-frame slot. A frame that arrives before the
+previous one was picked up replaces it (counted as dropped), so a slow model
+never builds a backlog. At most one frame per CHECKIN_WS_SAMPLE_INTERVAL_MS
+goes through detection and recognition. Each stream keeps its own tracker,
+so a student standing in front of the kiosk is embedded until confirmed and
+then about once per TRACK_RECHECK_SECONDS, not on every sampled frame. Each sampled frame re-runs the admission check and records its
+check-ins in short DB sessions of its own, so frames sent after the session ended get an error
+reply with status 409. Recognition shares the worker's inference_admission
+slots with the HTTP routes; when they are saturated the frame is answered
+with {"type": "error", "status": 503, "retry_after"} and the stream stays open.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import suppress
+from datetime import datetime
+from time import monotonic
+from typing import Callable
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.service.attendantService import AttendanceService
+from app.util.admission import inference_admission
+from app.util.datetime_json import utc_iso_z
+from app.util.embeddings import MAX_SIZE, inference
+from app.util.face_tracker import FaceTracker, Track
+from app.util.image_preprocess import decode_image
+from app.util.liveness import liveness_store
+from app.util.timing import timed
+from app.util.ws_manager import manager
+
+CHECKIN_WS_SAMPLE_INTERVAL_MS = float(os.getenv("CHECKIN_WS_SAMPLE_INTERVAL_MS", "200"))
+CHECKIN_WS_ARMED_SECONDS = float(os.getenv("CHECKIN_WS_ARMED_SECONDS", "20"))
+
+
+def check_session_admission(session_factory: Callable[[], Session], session_id: int) -> None:
+    """
+    AttendanceService.check_admission() in a short DB session of its own.
+    Blocking: callers on the event loop run it with run_in_threadpool.
+    """
+    with session_factory() as session:
+        AttendanceService(session=session).check_admission(session_id)
+
+
+async def record_checkins(
+    session: Session,
+    session_id: int,
+    embs,
+    tracks: list[Track] | None = None,
+) -> tuple[dict, Exception | None]:
+    """
+    Check in every face of one frame and broadcast the attendance changes.
+
+    Returns the response body and, when no face was checked in or already
+    checked in, the last per-face error (the HTTP route raises it). With
+    tracks (one per embedding) each face's outcome is recorded on its track.
+    """
+    service = AttendanceService(session=session)
+    results = {}
+    total_embs = len(embs)
+    checkedin_embs = 0
+    already_checked_in_embs = 0
+    last_error = None
+
+    # Score every detected face against the session gallery in one pass and
+    # assign faces to distinct users, committing all check-ins together
+    face_embeddings = [[float(x) for x in emb] for emb in embs]
+    outcomes = await run_in_threadpool(
+        service.check_in_faces, session_id=session_id, face_embeddings=face_embeddings
+    )
+
+    updates = []
+    for i, outcome in enumerate(outcomes):
+        if tracks is not None:
+            tracks[i].record(outcome)
+        if isinstance(outcome, Exception):
+            results[i] = {"success": False, "error": str(outcome)}
+            last_error = outcome
+            continue
+
+        results[i] = {"success": True, "data": outcome}
+        if outcome.get("attendance_updated"):
+            checkedin_embs += 1
+            ws_data = {**outcome}
+            if ws_data.get("check_in_time") is not None:
+                ct = ws_data["check_in_time"]
+                ws_data["check_in_time"] = (
+                    utc_iso_z(ct) if isinstance(ct, datetime) else str(ct)
+                )
+            updates.append(ws_data)
+        elif outcome.get("already_checked_in"):
+            already_checked_in_embs += 1
+
+    # Only broadcast to dashboard if this changed attendance state; one message per frame
+    if len(updates) == 1:
+        with timed("broadcast"):
+            await manager.broadcast_to_session(session_id, {
+                "type": "checkin",
+                "data": updates[0]
+            })
+    elif updates:
+        with timed("broadcast"):
+            await manager.broadcast_to_session(session_id, {
+                "type": "checkin_batch",
+                "data": updates
+            })
+
+    response = {
+        "stats": {
+            "num_face": total_embs,
+            "checked_in": checkedin_embs,
+            "already_checked_in": already_checked_in_embs,
+            "matched": checkedin_embs + already_checked_in_embs,
+        },
+        "result": results,
+    }
+    if checkedin_embs == 0 and already_checked_in_embs == 0 and last_error is not None:
+        return response, last_error
+    return response, None
+
+
+async def recognize_frame(
+    session: Session,
+    session_id: int,
+    img,
+    tracker: FaceTracker | None = None,
+) -> tuple[dict, Exception | None]:
+    """
+    record_checkins() for one decoded frame. Faces whose track is already
+    identified reuse the track's outcome; faces the matcher rejected a moment
+    ago reuse its error until their retry is due. Only the remaining crops
+    are embedded. Raises the detector's HTTPException when there is no face.
+    """
+    if tracker is None:
+        return await record_checkins(session, session_id, await inference.img_to_embedding(img, True))
+
+    boxes, faces = await inference.detect_with_boxes(img, True)
+    tracks = tracker.update(boxes)
+    pending = [i for i, track in enumerate(tracks) if track.needs_embedding()]
+
+    if pending:
+        embs = await inference.embed(faces[pending])
+        response, _ = await record_checkins(
+            session, session_id, embs, tracks=[tracks[i] for i in pending]
+        )
+        stats = response["stats"]
+        results = {pending[j]: result for j, result in response["result"].items()}
+    else:
+        stats = {"checked_in": 0, "already_checked_in": 0}
+        results = {}
+
+    skipped = [i for i in range(len(tracks)) if i not in results]
+    for i in skipped:
+        track = tracks[i]
+        if track.identity is not None:
+            results[i] = {"success": True, "data": track.identity, "tracked": True}
+            stats["already_checked_in"] += 1
+        else:
+            results[i] = {"success": False, "error": str(track.last_error), "tracked": True}
+
+    response = {
+        "stats": {
+            "num_face": len(tracks),
+            "checked_in": stats["checked_in"],
+            "already_checked_in": stats["already_checked_in"],
+            "matched": stats["checked_in"] + stats["already_checked_in"],
+            "tracked": len(skipped),
+        },
+        "result": dict(sorted(results.items())),
+    }
+    if response["stats"]["matched"] == 0:
+        errors = [t.last_error for t in tracks if t.last_error is not None]
+        if errors:
+            return response, errors[-1]
+    return response, None
+
+
+class CheckinStream:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_id: int,
+        session_factory: Callable[[], Session],
+        sample_interval_ms: float = CHECKIN_WS_SAMPLE_INTERVAL_MS,
+        armed_seconds: float = CHECKIN_WS_ARMED_SECONDS,
+    ):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.session_factory = session_factory
+        self.sample_interval = sample_interval_ms / 1000.0
+        self.armed_seconds = armed_seconds
+
+        self.__frame: bytes | None = None
+        self.__frame_ready = asyncio.Event()
+        self.__armed_until = 0.0
+        self.__told_disarmed = False
+        self.__send_lock = asyncio.Lock()
+        self.__tracker = FaceTracker()
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    async def run(self) -> None:
+        """Serve the socket until the kiosk disconnects."""
+        worker = asyncio.create_task(self.__process_frames())
+        try:
+            await self.__send({
+                "type": "ready",
+                "sample_interval_ms": self.sample_interval * 1000.0,
+                "max_frame_bytes": MAX_SIZE,
+            })
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self.__offer(message["bytes"])
+                elif message.get("text") is not None:
+                    await self.__control(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await worker
+
+    def stats(self) -> dict:
+        return {"received": self.received, "processed": self.processed, "dropped": self.dropped}
+
+    async def __offer(self, frame: bytes) -> None:
+        """Put a frame in the latest-frame slot, replacing one nobody picked up yet."""
+        self.received += 1
+        if len(frame) > MAX_SIZE or monotonic() >= self.__armed_until:
+            self.dropped += 1
+            if not self.__told_disarmed and len(frame) <= MAX_SIZE:
+                self.__told_disarmed = True
+                await self.__send({"type": "liveness_required"})
+            return
+        if self.__frame is not None:
+            self.dropped += 1
+        self.__frame = frame
+        self.__frame_ready.set()
+
+    async def __control(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+        except ValueError:
+            await self.__send({"type": "error", "status": 400, "detail": "Invalid JSON message"})
+            return
+
+        kind = message.get("type") if isinstance(message, dict) else None
+        if kind == "challenge":
+            await self.__send({"type": "challenge", **await liveness_store.acreate(session_id=self.session_id)})
+        elif kind == "liveness":
+            try:
+                await liveness_store.averify(message.get("token"), self.session_id, message.get("action"))
+            except HTTPException as error:
+                await self.__send({"type": "error", "status": error.status_code, "detail": error.detail})
+                return
+            self.__armed_until = monotonic() + self.armed_seconds
+            self.__told_disarmed = False
+            await self.__send({"type": "armed", "expires_in": self.armed_seconds})
+        else:
+            await self.__send({"type": "error", "status": 400, "detail": f"Unknown message type: {kind!r}"})
+
+    async def __process_frames(self) -> None:
+        next_at = 0.0
+        while True:
+            await self.__frame_ready.wait()
+            delay = next_at - monotonic()
+            if delay > 0:
+                # Frames that arrive meanwhile replace the waiting one
+                await asyncio.sleep(delay)
+            frame, self.__frame = self.__frame, None
+            self.__frame_ready.clear()
+            if frame is None or monotonic() >= self.__armed_until:
+                # Disarmed (a check-in happened or liveness expired) while the frame waited
+                self.dropped += frame is not None
+                continue
+            next_at = monotonic() + self.sample_interval
+
+            try:
+                reply = await self.__recognize(frame)
+            except HTTPException as error:
+                reply = {"type": "error", "status": error.status_code, "detail": error.detail}
+                if error.headers and "Retry-After" in error.headers:
+                    # Overloaded (503): the kiosk keeps streaming and a later frame tries again
+                    reply["retry_after"] = int(error.headers["Retry-After"])
+            except Exception as error:
+                print(f"[CheckinStream] session {self.session_id}: {error!r}")
+                reply = {"type": "error", "status": 500, "detail": "Check-in failed"}
+            self.processed += 1
+            await self.__send({**reply, "frames": self.stats()})
+
+    async def __recognize(self, frame: bytes) -> dict:
+        # Short DB sessions per frame: the socket may stay open for the whole lecture, and
+        # the session may end (or lose its roster) while the kiosk is still streaming
+        await run_in_threadpool(check_session_admission, self.session_factory, self.session_id)
+
+        async with inference_admission.slot():
+            with timed("decode"):
+                img = await run_in_threadpool(decode_image, frame)
+            if img is None:
+                raise HTTPException(status_code=400, detail="Could not decode image")
+
+            try:
+                # Detection and embedding run before the session first touches the database
+                with self.session_factory() as session:
+                    response, error = await recognize_frame(session, self.session_id, img, self.__tracker)
+            except HTTPException as error:
+                if error.status_code != 400:
+                    raise
+                return {"type": "result", "stats": {"num_face": 0}, "detail": error.detail}
+
+        if response["stats"]["checked_in"] > 0:
+            # One liveness challenge per check-in, as with POST /checkin
+            self.__armed_until = 0.0
+        reply = {"type": "result", **response}
+        if error is not None:
+            reply["detail"] = getattr(error, "detail", str(error))
+        return reply
+
+    async def __send(self, data: dict) -> None:
+        async with self.__send_lock:
+            with suppress(WebSocketDisconnect, RuntimeError):
+                await self.websocket.send_json(jsonable_encoder(data))
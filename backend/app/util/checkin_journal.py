@@ -0,0 +1,314 @@
+"""Write-behind journal for face check-ins.
+
+With CHECKIN_JOURNAL_DIR set, a recognized face is acknowledged as soon as
+its check-in is appended and fsync'd to a local journal file instead of
+after a SELECT / UPDATE / commit round trip to Postgres. A background
+flusher applies everything journaled since the last tick as one bulk upsert
+(AttendanceRepository.upsert_check_ins) every CHECKIN_JOURNAL_FLUSH_SECONDS.
+
+Files, one set per worker process (the pid is part of the name):
+
+    checkin-<pid>.log                 active segment, one JSON line per check-in
+    checkin-<pid>-<ns>.ready          rotated segment waiting to be applied
+
+A flush rotates the active segment, applies every .ready segment of this
+worker in order and deletes each one only after its transaction committed,
+so a crash at any point replays (never loses) acknowledged check-ins. On
+start, segments of dead processes (or of an earlier process with this pid)
+are adopted and replayed. Replaying is idempotent: the upsert only touches
+rows that are still ABSENT.
+
+Check-ins that are journaled but not yet flushed are kept in memory and
+overlaid on reads by AttendanceService, so the kiosk and the dashboard see
+them immediately. Each worker only knows its own pending check-ins.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter, time_ns
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.db.models.attendance import AttendanceStatus
+from app.db.repository.attendance import AttendanceRepository
+
+CHECKIN_JOURNAL_DIR = os.getenv("CHECKIN_JOURNAL_DIR", "")
+CHECKIN_JOURNAL_FLUSH_SECONDS = float(os.getenv("CHECKIN_JOURNAL_FLUSH_SECONDS", "1.0"))
+CHECKIN_JOURNAL_BATCH_ROWS = int(os.getenv("CHECKIN_JOURNAL_BATCH_ROWS", "1000"))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_pid(path: Path) -> int | None:
+    try:
+        return int(path.stem.split("-")[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def read_segment(path: Path) -> list[dict]:
+    """Journal entries of one segment. A torn last line (crash mid-append, never acknowledged) is skipped."""
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                print(f"[CheckinJournal] Skipping unreadable line in {path.name}")
+    return entries
+
+
+class CheckinJournal:
+    def __init__(
+        self,
+        directory: str = CHECKIN_JOURNAL_DIR,
+        flush_seconds: float = CHECKIN_JOURNAL_FLUSH_SECONDS,
+        batch_rows: int = CHECKIN_JOURNAL_BATCH_ROWS,
+        session_factory=None,
+    ) -> None:
+        self.directory = Path(directory) if directory else None
+        self.flush_seconds = flush_seconds
+        self.batch_rows = batch_rows
+        self.__session_factory = session_factory
+        self.__lock = threading.Lock()        # active segment + pending
+        self.__flush_lock = threading.Lock()  # one flush at a time
+        self.__fd: int | None = None
+        self.__pid: int | None = None
+        self.__pending: dict[tuple[int, int], dict] = {}
+        self.__stop = threading.Event()
+        self.__thread: threading.Thread | None = None
+        self.appended = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def start(self) -> None:
+        """Adopt and replay leftover segments, then start the background flusher."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.__adopt_segments()
+        self.flush()
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.__run, name="checkin-journal", daemon=True)
+            self.__thread.start()
+
+    def close(self) -> None:
+        """Stop the flusher and apply what is left (segments stay on disk if Postgres is down)."""
+        if not self.enabled:
+            return
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.flush()
+        with self.__lock:
+            if self.__fd is not None:
+                os.close(self.__fd)
+                self.__fd = None
+
+    def append(self, entries: list[dict]) -> None:
+        """
+        Durably journal check-ins (dicts with session_id, user_id, status,
+        check_in_time). Returns once the lines are fsync'd.
+        """
+        if not entries:
+            return
+        lines = b"".join(
+            json.dumps({
+                "session_id": e["session_id"],
+                "user_id": e["user_id"],
+                "status": e["status"],
+                "check_in_time": e["check_in_time"].isoformat(),
+            }).encode() + b"\n"
+            for e in entries
+        )
+        with self.__lock:
+            fd = self.__active_fd()
+            os.write(fd, lines)
+            os.fsync(fd)
+            for e in entries:
+                self.__pending[(e["session_id"], e["user_id"])] = e
+            self.appended += len(entries)
+
+    def pending(self, session_id: int, user_id: int) -> dict | None:
+        """The journaled, not yet flushed check-in of a user, if any."""
+        if not self.__pending:
+            return None
+        with self.__lock:
+            return self.__pending.get((session_id, user_id))
+
+    def pending_for_session(self, session_id: int) -> dict[int, dict]:
+        """user_id -> journaled, not yet flushed check-in for one session."""
+        if not self.__pending:
+            return {}
+        with self.__lock:
+            return {uid: e for (sid, uid), e in self.__pending.items() if sid == session_id}
+
+    def flush(self) -> int:
+        """Rotate the active segment and apply every ready segment. Returns the rows applied."""
+        if not self.enabled:
+            return 0
+        with self.__flush_lock:
+            self.__rotate()
+            started = perf_counter()
+            applied = 0
+            for segment in sorted(self.directory.glob(f"checkin-{os.getpid()}-*.ready")):
+                entries = read_segment(segment)
+                try:
+                    self.__apply(entries)
+                except SQLAlchemyError as error:
+                    # Keep the segment; the next tick retries it
+                    self.failures += 1
+                    print(f"[CheckinJournal] Flush of {segment.name} failed: {error}")
+                    break
+                segment.unlink()
+                self.__forget(entries)
+                applied += len(entries)
+            if applied:
+                self.flushes += 1
+                self.flushed += applied
+                self.last_flush_ms = (perf_counter() - started) * 1000.0
+            return applied
+
+    def stats(self) -> dict:
+        with self.__lock:
+            pending = len(self.__pending)
+        return {
+            "enabled": self.enabled,
+            "directory": str(self.directory) if self.enabled else None,
+            "flush_seconds": self.flush_seconds,
+            "pending": pending,
+            "appended": self.appended,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as error:
+                self.failures += 1
+                print(f"[CheckinJournal] Flusher error: {error}")
+
+    def __active_fd(self) -> int:
+        # A forked worker must not append to its parent's segment
+        if self.__fd is None or self.__pid != os.getpid():
+            self.__pid = os.getpid()
+            path = self.directory / f"checkin-{self.__pid}.log"
+            self.__fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        return self.__fd
+
+    def __rotate(self) -> None:
+        with self.__lock:
+            active = self.directory / f"checkin-{os.getpid()}.log"
+            if self.__fd is None or not active.exists() or active.stat().st_size == 0:
+                return
+            os.close(self.__fd)
+            self.__fd = None
+            os.rename(active, self.directory / f"checkin-{os.getpid()}-{time_ns()}.ready")
+            self.__fsync_directory()
+
+    def __adopt_segments(self) -> None:
+        """Take over the segments of processes that are gone (a crash or restart)."""
+        pid = os.getpid()
+        adopted = 0
+        for segment in sorted(self.directory.glob("checkin-*")):
+            owner = _segment_pid(segment)
+            if owner is None or (owner != pid and _pid_alive(owner)):
+                continue
+            if owner == pid and segment.suffix == ".ready":
+                target = segment
+            else:
+                target = self.directory / f"checkin-{pid}-{time_ns()}.ready"
+                try:
+                    os.rename(segment, target)
+                except FileNotFoundError:
+                    continue  # another worker adopted it first
+            entries = read_segment(target)
+            with self.__lock:
+                for e in entries:
+                    self.__pending[(e["session_id"], e["user_id"])] = self.__parse(e)
+            adopted += len(entries)
+        if adopted:
+            self.__fsync_directory()
+            print(f"[CheckinJournal] Replaying {adopted} journaled check-in(s)")
+
+    def __apply(self, entries: list[dict]) -> None:
+        # Earliest check-in per (session, user), like the synchronous path
+        rows: dict[tuple[int, int], dict] = {}
+        for e in map(self.__parse, entries):
+            key = (e["session_id"], e["user_id"])
+            if key not in rows or e["check_in_time"] < rows[key]["check_in_time"]:
+                rows[key] = e
+        rows = [{**e, "status": AttendanceStatus(e["status"])} for e in rows.values()]
+
+        with self.__new_session() as db:
+            repo = AttendanceRepository(session=db)
+            try:
+                for start in range(0, len(rows), self.batch_rows):
+                    repo.upsert_check_ins(rows[start:start + self.batch_rows])
+            except IntegrityError:
+                # A deleted session / user fails the whole batch: apply row by row and drop those
+                db.rollback()
+                for row in rows:
+                    try:
+                        repo.upsert_check_ins([row])
+                    except IntegrityError as error:
+                        db.rollback()
+                        self.dropped += 1
+                        print(f"[CheckinJournal] Dropping check-in {row['session_id']}/{row['user_id']}: {error}")
+
+    def __forget(self, entries: list[dict]) -> None:
+        with self.__lock:
+            for e in entries:
+                key = (e["session_id"], e["user_id"])
+                pending = self.__pending.get(key)
+                if pending is not None and pending["check_in_time"] <= self.__parse(e)["check_in_time"]:
+                    del self.__pending[key]
+
+    def __new_session(self):
+        if self.__session_factory is None:
+            from app.core.database import Sessionmaker
+
+            self.__session_factory = Sessionmaker
+        return self.__session_factory()
+
+    def __fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def __parse(entry: dict) -> dict:
+        if isinstance(entry["check_in_time"], str):
+            return {**entry, "check_in_time": datetime.fromisoformat(entry["check_in_time"])}
+        return entry
+
+
+# Single global instance shared across the app
+checkin_journal = CheckinJournal()
@@ -0,0 +1,124 @@
+"""Process-wide cache of face embeddings keyed by the uploaded image bytes.
+
+On flaky networks a kiosk resubmits the identical JPEG to /session/checkin
+(or a student re-sends /uploadPicture), and every copy would go through
+decode, detection and the embedder again. Entries are keyed by a hash of
+the raw upload plus the face model version and the multiple-faces flag, so
+a model change can never serve embeddings of the old model. Entries are
+evicted in LRU order once either the entry or byte budget is exceeded, and
+expire after EMBEDDING_CACHE_TTL_SECONDS.
+
+Only successful results are cached; an image that failed (no face,
+multiple faces) is processed again on resubmission. The writes that follow
+stay idempotent on their own: a repeated check-in finds the attendance
+already present, a repeated enrollment stores the same embedding again.
+
+Each uvicorn worker holds its own cache, like the gallery cache.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+import numpy as np
+import torch
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1024"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "120"))
+
+
+@dataclass
+class _CacheEntry:
+    embeddings: np.ndarray
+    stored_at: float
+    nbytes: int
+
+
+class EmbeddingCache:
+    """LRU, size-bounded map of hash(image bytes, model version) -> (k, 512) embeddings."""
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        ttl_seconds: float = EMBEDDING_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.__entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(data: bytes, model_version: str, multiple: bool) -> str:
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return f"{model_version}:{int(bool(multiple))}:{digest}"
+
+    def get(self, key: str) -> torch.Tensor | None:
+        """The cached embeddings as a fresh tensor (callers may modify it), or None."""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and monotonic() - entry.stored_at > self.ttl_seconds:
+                self.__drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return torch.tensor(entry.embeddings)
+
+    def put(self, key: str, embeddings: torch.Tensor) -> None:
+        array = embeddings.detach().cpu().numpy().astype(np.float32, copy=True)
+        entry = _CacheEntry(embeddings=array, stored_at=monotonic(), nbytes=int(array.nbytes + len(key)))
+        with self.__lock:
+            if key in self.__entries:
+                self.__drop(key)
+            self.__entries[key] = entry
+            self.__bytes += entry.nbytes
+            while self.__entries and (
+                len(self.__entries) > self.max_entries or self.__bytes > self.max_bytes
+            ):
+                oldest = next(iter(self.__entries))
+                self.__drop(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __drop(self, key: str) -> None:
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__bytes -= entry.nbytes
+
+
+# Single global instance shared across the app
+embedding_cache = EmbeddingCache()
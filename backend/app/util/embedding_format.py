@@ -0,0 +1,47 @@
+"""Binary storage format of face embeddings (Users.embedding_vec, UserFaceTemplates.embedding_vec).
+
+Embeddings are stored as raw little-endian float32 (or float16, see
+EMBEDDING_STORAGE_DTYPE) bytes in a bytea column instead of a float8[]
+array: 2 KB per 512-d vector instead of ~4 KB plus array headers, and a
+read is one np.frombuffer over the fetched buffer instead of parsing 512
+Python floats. Rows carry the tag of the model that produced them
+(EMBEDDING_MODEL) so embeddings of a different model are never compared.
+
+The dtype is recovered from the blob length, so float32 and float16 rows
+can coexist while a table is being converted.
+"""
+
+import os
+
+import numpy as np
+
+EMBEDDING_DIM = 512  # InceptionResnetV1 output size
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "facenet-vggface2")
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+
+_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+
+
+def encode_embedding(vec, dtype: str = EMBEDDING_STORAGE_DTYPE) -> bytes | None:
+    """Vector -> bytes for a bytea column (None/empty stays None)."""
+    if vec is None or len(vec) == 0:
+        return None
+    return np.asarray(vec, dtype=np.float32).reshape(-1).astype(_DTYPES[dtype]).tobytes()
+
+
+def decode_embedding(buf, dim: int = EMBEDDING_DIM, row: str = "embedding") -> np.ndarray | None:
+    """
+    Bytes from a bytea column -> (d,) float32 vector. float32 blobs are a
+    read-only, zero-copy view of buf; float16 blobs are widened to float32.
+    Any other length is a corrupt row and raises ValueError naming `row`.
+    """
+    if buf is None or len(buf) == 0:
+        return None
+    if len(buf) == dim * 2:
+        return np.frombuffer(buf, dtype=_DTYPES["float16"]).astype(np.float32)
+    if len(buf) == dim * 4:
+        return np.frombuffer(buf, dtype=_DTYPES["float32"])
+    raise ValueError(
+        f"{row}: embedding blob of {len(buf)} bytes is neither {dim}-d float16 ({dim * 2} bytes) "
+        f"nor float32 ({dim * 4} bytes)"
+    )
@@ -1,43 +1,120 @@
 from app.service.ModelService import ModelService
-from starlette.concurrency import run_in_threadpool
+from app.service.InferenceScheduler import InferenceScheduler
+from app.service.InferencePool import InferencePool
+from app.service.ModelRegistry import model_registry
+from app.service.InferenceEngine import INFERENCE_ENGINE
+from app.service.FaceDetector import FACE_DETECTOR
+from app.util.embedding_cache import embedding_cache
+from app.util.embedding_format import EMBEDDING_MODEL
+from app.util.image_preprocess import MAX_DIMENSION, SOURCE_MAX_DIMENSION, decode_image
+from app.util.timing import timed
 from PIL import Image, UnidentifiedImageError
 from app.db.models.user import User
 from fastapi import UploadFile, File, HTTPException
 
 import numpy as np
-import io, cv2
+import torch
+import io, os, cv2
 
 
-model = ModelService()
+# "inprocess": models run in this worker behind the micro-batching scheduler.
+# "pool": models run in separate processes (see InferencePool); this process loads none.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "inprocess")
+FACE_MODEL = "face"
+# Part of every embedding cache key: bump it (or change the defaults it is
+# built from) whenever the weights change, so cached embeddings go stale
+FACE_MODEL_VERSION = os.getenv(
+    "FACE_MODEL_VERSION",
+    f"{EMBEDDING_MODEL}/{INFERENCE_ENGINE}/{FACE_DETECTOR}/{MAX_DIMENSION}/{SOURCE_MAX_DIMENSION}",
+)
+
+
+def _warm_up_face_model(model: ModelService) -> None:
+    """One pass of the configured detector (FACE_DETECTOR) and of the embedder so the first check-in skips lazy init."""
+    model.detector.detect(np.zeros((480, 640, 3), dtype=np.uint8))
+    model.embedder.run(torch.zeros(2, 3, 160, 160))
+
+
+def _start_pool() -> InferencePool:
+    inference.wait_ready()
+    return inference
+
+
+if INFERENCE_BACKEND == "pool":
+    inference = InferencePool()
+    model_registry.register(FACE_MODEL, _start_pool)
+else:
+    model_registry.register(
+        FACE_MODEL, ModelService, warmup=_warm_up_face_model, fork_safe=INFERENCE_ENGINE == "torch"
+    )
+    inference = InferenceScheduler(lambda: model_registry.get(FACE_MODEL))
 
 ALLOWED = {"image/jpeg", "image/png", "image/webp", "image/gif"}
 MAX_SIZE = 20 * 1024 * 1024  # 20 MB
-MAX_DIMENSION = 1280  # Max width or height in pixels for faster face detection
 
 
 
 async def upload_img_to_embedding(upload_image: UploadFile = File(...),multiple = True):
+    """
+    Embeddings of the faces in an upload. A byte-identical resubmission
+    (same model version) is answered from embedding_cache without decoding.
+    """
+    data = await read_upload_bytes(upload_image)
+    key = embedding_cache.key(data, FACE_MODEL_VERSION, multiple)
+    embeddings = embedding_cache.get(key)
+    if embeddings is not None:
+        return embeddings
+
+    img = decode_upload(data)
+    embeddings = await inference.img_to_embedding(img, multiple)
+    embedding_cache.put(key, embeddings)
+
+    return embeddings
+
+
+async def read_upload_image(upload_image: UploadFile) -> np.ndarray:
+    """Validate an upload and decode it (once) to a BGR frame."""
+    return decode_upload(await read_upload_bytes(upload_image))
+
+
+async def read_upload_bytes(upload_image: UploadFile) -> bytes:
+    """Validate an upload's type and size and return its raw bytes."""
     if upload_image.content_type not in ALLOWED:
         raise HTTPException(status_code=415, detail=f"Unsupported media type: {upload_image.content_type}")
 
     data = await upload_image.read(MAX_SIZE + 1)
     if len(data) > MAX_SIZE:
         raise HTTPException(status_code=413, detail=f"File too large (max {MAX_SIZE // (1024*1024)} MB)")
-    arr = np.frombuffer(data, np.uint8)
-    img = cv2.imdecode(arr,cv2.IMREAD_COLOR)
+    return data
 
-    embeddings = await run_in_threadpool(model.img_to_embedding, img, multiple)
 
-    return embeddings
+def decode_upload(data: bytes) -> np.ndarray:
+    with timed("decode"):
+        img = decode_image(data)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return img
+
+
+async def detect_faces(img: np.ndarray, multiple=False) -> torch.Tensor:
+    """Aligned face crops of one decoded frame, for callers that inspect them before embedding."""
+    return await inference.detect(img, multiple)
+
+
+async def detect_faces_many(imgs: list[np.ndarray], multiple=False) -> list:
+    """Batched detect_faces: per frame, its crops or the HTTPException a single detect would raise."""
+    return await inference.detect_many(imgs, multiple)
+
+
+async def embed_faces(faces: torch.Tensor) -> torch.Tensor:
+    return await inference.embed(faces)
 
 
 async def has_embedding(session, user_id: int) -> bool: 
     try:
-        user = session.get(User, user_id)
-        #print(user.embedding)
-        if not user.embedding:
-            return False
-        return len(user.embedding) > 1
+        # Indexed flag column: no need to load the embedding itself
+        flag = session.query(User.has_embedding).filter(User.id == user_id).scalar()
+        return bool(flag)
     
     except Exception as error: 
         print(error)
@@ -45,6 +122,11 @@ async def has_embedding(session, user_id: int) -> bool:
         
 
 
+def mean_embedding(embs: torch.Tensor) -> torch.Tensor:
+    """L2-normalized mean of (n, 512) embeddings: the enrollment template."""
+    return torch.nn.functional.normalize(embs.mean(dim=0), p=2, dim=0)
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     if a.shape != b.shape:
         return -1.0
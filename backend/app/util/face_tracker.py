@@ -0,0 +1,238 @@
+"""
+Cross-frame face tracking for kiosk check-in.
+
+A kiosk sends the same person many times in a row: every sampled frame of
+/ws/checkin/{session_id} and every retry of a POST /checkin burst. FaceTracker
+associates the detector boxes of a frame with the tracks of the previous
+frames (greedy IoU, then centroid distance for faces that moved fast), so a
+face that was already identified is not embedded and matched again.
+
+    tracker = FaceTracker()
+    tracks = tracker.update(boxes)        # one Track per box, same order
+    pending = [i for i, t in enumerate(tracks) if t.needs_embedding()]
+
+A track is identified once the matcher assigned it the same user
+TRACK_CONFIRM_MATCHES times in a row; from then on its frames reuse that
+outcome, but the face is still re-embedded every TRACK_RECHECK_SECONDS. In
+a kiosk queue the next student steps into the box the previous one just
+left, and the re-check (a different user, or no match) drops the identity
+so they go through the full pipeline. A track taken over by the centroid
+fallback (no overlap with its last box) forgets its identity right away.
+Faces the matcher rejected are retried at most every TRACK_RETRY_SECONDS
+(the pose or lighting may get better). A track that has not been seen for
+TRACK_TIMEOUT_SECONDS expires.
+
+Trackers are process-local: with several workers a burst that lands on
+another worker just misses the tracker and goes through the full pipeline.
+"""
+
+import os
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Callable, Hashable
+
+import numpy as np
+
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.4"))
+# Centroid fallback: max centre shift as a fraction of the track's box width
+TRACK_MAX_CENTER_SHIFT = float(os.getenv("TRACK_MAX_CENTER_SHIFT", "0.5"))
+TRACK_TIMEOUT_SECONDS = float(os.getenv("TRACK_TIMEOUT_SECONDS", "2.0"))
+TRACK_RETRY_SECONDS = float(os.getenv("TRACK_RETRY_SECONDS", "1.0"))
+# Agreeing matches before a track's frames reuse its identity, and how often an identified face is re-checked
+TRACK_CONFIRM_MATCHES = int(os.getenv("TRACK_CONFIRM_MATCHES", "2"))
+TRACK_RECHECK_SECONDS = float(os.getenv("TRACK_RECHECK_SECONDS", "1.0"))
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (n, 4) and (m, 4) x1, y1, x2, y2 boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _greedy_pairs(scores: np.ndarray, min_score: float) -> list[tuple[int, int]]:
+    """One-to-one (row, col) pairs, best score first, stopping below min_score."""
+    pairs = []
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(scores, axis=None)[::-1]:
+        r, c = np.unravel_index(flat, scores.shape)
+        if scores[r, c] < min_score:
+            break
+        if r not in used_rows and c not in used_cols:
+            pairs.append((int(r), int(c)))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: np.ndarray
+    last_seen: float
+    hits: int = 1
+    # Check-in outcome of the user this face was matched to, once identified
+    identity: dict | None = None
+    last_attempt: float | None = None
+    last_error: Exception | None = None
+    # User the latest matches agreed on, and how many in a row
+    candidate: int | None = None
+    agreements: int = 0
+
+    def needs_embedding(
+        self,
+        now: float | None = None,
+        retry_seconds: float = TRACK_RETRY_SECONDS,
+        recheck_seconds: float = TRACK_RECHECK_SECONDS,
+    ) -> bool:
+        if self.last_attempt is None:
+            return True
+        now = monotonic() if now is None else now
+        if self.identity is not None:
+            return now - self.last_attempt >= recheck_seconds
+        if self.candidate is not None:
+            # Matched, but not confirmed yet
+            return True
+        return now - self.last_attempt >= retry_seconds
+
+    def record(self, outcome, now: float | None = None, confirm_matches: int = TRACK_CONFIRM_MATCHES) -> None:
+        """Store the matcher's outcome for this face: a check-in dict or an exception."""
+        if isinstance(outcome, Exception):
+            # Whoever was identified in this box is no longer recognized
+            self.forget()
+            self.last_error = outcome
+        else:
+            self.last_error = None
+            if outcome.get("user_id") != self.candidate:
+                self.identity = None
+                self.candidate = outcome.get("user_id")
+                self.agreements = 0
+            self.agreements += 1
+            if self.agreements >= confirm_matches:
+                # Later frames of the same face report it as already checked in
+                identity = {k: v for k, v in outcome.items() if k != "attendance_id"}
+                identity.update(already_checked_in=True, attendance_updated=False)
+                self.identity = identity
+        self.last_attempt = monotonic() if now is None else now
+
+    def forget(self) -> None:
+        """Drop the identity and match history; the next frame is embedded again."""
+        self.identity = None
+        self.candidate = None
+        self.agreements = 0
+        self.last_attempt = None
+        self.last_error = None
+
+
+class FaceTracker:
+    def __init__(
+        self,
+        iou_threshold: float = TRACK_IOU_THRESHOLD,
+        max_center_shift: float = TRACK_MAX_CENTER_SHIFT,
+        timeout_seconds: float = TRACK_TIMEOUT_SECONDS,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.timeout_seconds = timeout_seconds
+        self.clock = clock
+
+        self.__tracks: dict[int, Track] = {}
+        self.__next_id = 0
+        self.__lock = Lock()
+        self.last_update = clock()
+
+    def update(self, boxes: np.ndarray) -> list[Track]:
+        """
+        Associate the (k, 4) boxes of one frame with the live tracks and
+        return one Track per box, in box order. Unmatched boxes start new
+        tracks; tracks past the timeout are dropped first.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        with self.__lock:
+            now = self.clock()
+            self.last_update = now
+            self.__expire(now)
+
+            live = list(self.__tracks.values())
+            assigned: dict[int, Track] = {}
+            if len(boxes) and live:
+                track_boxes = np.stack([t.box for t in live])
+                for b, t in _greedy_pairs(iou_matrix(boxes, track_boxes), self.iou_threshold):
+                    assigned[b] = live[t]
+
+                # Fast movement between sampled frames can drop IoU to zero;
+                # fall back to centre distance relative to the face size
+                free_boxes = [b for b in range(len(boxes)) if b not in assigned]
+                taken = {id(t) for t in assigned.values()}
+                free_tracks = [t for t in live if id(t) not in taken]
+                if free_boxes and free_tracks:
+                    closeness = self.__closeness(boxes[free_boxes], np.stack([t.box for t in free_tracks]))
+                    for b, t in _greedy_pairs(closeness, 0.0):
+                        # Without overlap this may be somebody else who stepped in: identify again
+                        free_tracks[t].forget()
+                        assigned[free_boxes[b]] = free_tracks[t]
+
+            tracks = []
+            for b, box in enumerate(boxes):
+                track = assigned.get(b)
+                if track is None:
+                    track = Track(track_id=self.__next_id, box=box, last_seen=now)
+                    self.__next_id += 1
+                    self.__tracks[track.track_id] = track
+                else:
+                    track.box = box
+                    track.last_seen = now
+                    track.hits += 1
+                tracks.append(track)
+            return tracks
+
+    def __len__(self) -> int:
+        return len(self.__tracks)
+
+    def __expire(self, now: float) -> None:
+        for track_id in [i for i, t in self.__tracks.items() if now - t.last_seen > self.timeout_seconds]:
+            del self.__tracks[track_id]
+
+    def __closeness(self, boxes: np.ndarray, track_boxes: np.ndarray) -> np.ndarray:
+        """1 - centre shift / (max_center_shift * track width); below 0 means too far."""
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2.0
+        shift = np.linalg.norm(centers[:, None, :] - track_centers[None, :, :], axis=2)
+        widths = np.maximum(track_boxes[:, 2] - track_boxes[:, 0], 1.0)
+        return 1.0 - shift / (self.max_center_shift * widths[None, :])
+
+
+class FaceTrackerRegistry:
+    """One FaceTracker per kiosk of a session; trackers idle past the timeout are dropped."""
+
+    def __init__(self, timeout_seconds: float = TRACK_TIMEOUT_SECONDS, clock: Callable[[], float] = monotonic):
+        self.timeout_seconds = timeout_seconds
+        self.clock = clock
+        self.__trackers: dict[Hashable, FaceTracker] = {}
+        self.__lock = Lock()
+
+    def get(self, session_id: int, kiosk_id: str) -> FaceTracker:
+        with self.__lock:
+            now = self.clock()
+            for key in [k for k, t in self.__trackers.items() if now - t.last_update > self.timeout_seconds]:
+                del self.__trackers[key]
+            key = (session_id, kiosk_id)
+            tracker = self.__trackers.get(key)
+            if tracker is None:
+                tracker = FaceTracker(timeout_seconds=self.timeout_seconds, clock=self.clock)
+                self.__trackers[key] = tracker
+            return tracker
+
+    def __len__(self) -> int:
+        return len(self.__trackers)
+
+
+# Single global instance shared across the app
+face_trackers = FaceTrackerRegistry()
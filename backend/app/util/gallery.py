@@ -0,0 +1,249 @@
+"""Vectorized face gallery used by check-in matching.
+
+A gallery holds every enrolled embedding of a session's roster as one
+contiguous float32 matrix with L2-normalized rows, so all query faces of a
+frame are scored with a single matrix multiply instead of a Python loop.
+
+A user can have several rows (face templates: glasses, lighting, ...).
+Rows are grouped per user, so a query is scored against every template in
+the same multiply and reduced to its best template per user with one
+``np.maximum.reduceat``; matching stays linear in the total template count.
+
+Rows whose stored embedding cannot be compared (wrong dimension or zero norm)
+stay in the gallery but always score -1.0, which mirrors what
+``cosine_similarity`` returns for them.
+
+Galleries with at least ANN_MIN_GALLERY_SIZE usable rows also carry an
+``IVFIndex`` so best-match lookups scan a few inverted lists and re-rank the
+candidates exactly instead of scoring every row. The index can miss the
+true best user, so an approximate best is trusted only when it clears the
+check-in threshold by ANN_EXACT_MARGIN; anything closer (a stranger, an
+enrolled student the index missed, or a wrong user just above the
+threshold) falls back to the exact scan.
+"""
+
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from app.util.ann_index import ANN_MIN_GALLERY_SIZE, IVFIndex
+from app.util.embedding_format import EMBEDDING_DIM
+
+FACE_TEMPLATES_PER_USER = int(os.getenv("FACE_TEMPLATES_PER_USER", "5"))
+INVALID_SCORE = -1.0
+ASSIGN_CANDIDATES_PER_FACE = 8   # ANN candidates per face considered by assign()
+# Approximate best scores below threshold + margin are re-scored against the whole gallery
+ANN_EXACT_MARGIN = float(os.getenv("ANN_EXACT_MARGIN", "0.15"))
+_BELOW_THRESHOLD_PENALTY = -1e3
+
+
+@dataclass
+class GalleryMatch:
+    user_id: int
+    first_name: str | None
+    last_name: str | None
+    similarity: float
+
+
+@dataclass
+class EmbeddingGallery:
+    user_ids: np.ndarray                     # (n,) int64, rows of one user are contiguous
+    matrix: np.ndarray                       # (n, d) float32, unit-norm rows
+    valid: np.ndarray                        # (n,) bool
+    names: list[tuple[str | None, str | None]] = field(default_factory=list)
+    index: IVFIndex | None = None
+    user_starts: np.ndarray = field(init=False)   # (u,) first row of each user
+    row_user: np.ndarray = field(init=False)      # (n,) user slot of each row
+
+    def __post_init__(self) -> None:
+        new_user = np.ones(len(self.user_ids), dtype=bool)
+        new_user[1:] = self.user_ids[1:] != self.user_ids[:-1]
+        self.user_starts = np.flatnonzero(new_user)
+        self.row_user = np.cumsum(new_user) - 1
+
+    def __len__(self) -> int:
+        return int(self.user_ids.shape[0])
+
+    @property
+    def num_users(self) -> int:
+        return int(self.user_starts.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+
+    def score(self, queries) -> np.ndarray:
+        """Return the (m, n) cosine similarity matrix for m query embeddings."""
+        q = normalize_rows(queries)
+        if q.shape[1] != self.dim:
+            return np.full((q.shape[0], len(self)), INVALID_SCORE, dtype=np.float32)
+        scores = q @ self.matrix.T
+        scores[:, ~self.valid] = INVALID_SCORE
+        return scores
+
+    def score_users(self, queries) -> np.ndarray:
+        """Return the (m, u) similarity of every query to each user's best template."""
+        scores = self.score(queries)
+        if len(self) == 0:
+            return scores
+        return np.maximum.reduceat(scores, self.user_starts, axis=1)
+
+    def best_matches(self, queries, threshold: float | None = None) -> list[GalleryMatch]:
+        """
+        Return the highest-scoring gallery entry for every query embedding.
+        With an index, queries whose approximate best scores below
+        *threshold* + ANN_EXACT_MARGIN (or that found no candidate) are
+        re-scored exactly.
+        """
+        q = normalize_rows(queries)
+        if self.index is None or q.shape[1] != self.dim:
+            return self.__exact_best(q)
+
+        rows, sims = self.index.search(q, self.matrix, k=1)
+        matches = [
+            self.match_at(int(r), float(s)) if r >= 0 else None for r, s in zip(rows[:, 0], sims[:, 0])
+        ]
+        # Near or below the threshold, the index may have missed a better user
+        floor = INVALID_SCORE if threshold is None else threshold + ANN_EXACT_MARGIN
+        redo = np.flatnonzero((rows[:, 0] < 0) | (sims[:, 0] < floor))
+        if redo.size:
+            for i, match in zip(redo, self.__exact_best(q[redo])):
+                matches[int(i)] = match
+        return matches
+
+    def __exact_best(self, q: np.ndarray) -> list[GalleryMatch]:
+        scores = self.score_users(q)
+        best_user = np.argmax(scores, axis=1)
+        best_sim = scores[np.arange(scores.shape[0]), best_user]
+        return [
+            self.match_at(int(self.user_starts[u]), float(s)) for u, s in zip(best_user, best_sim)
+        ]
+
+    def assign(self, queries, threshold: float) -> list[GalleryMatch | None]:
+        """
+        Assign query faces to distinct gallery users in one step.
+
+        Solves the one-to-one assignment (Hungarian) that first maximizes the
+        number of pairs at or above *threshold* and then their total
+        similarity, so two faces in one frame never resolve to the same user.
+        Faces left without a pair above the threshold get None.
+        """
+        q = normalize_rows(queries)
+        results: list[GalleryMatch | None] = [None] * q.shape[0]
+        if len(self) == 0 or q.shape[1] != self.dim:
+            return results
+
+        # Columns are users (max over their templates), so two faces of a
+        # frame can never be assigned the same person via two templates
+        cols = scores = None
+        if self.index is not None:
+            rows, _ = self.index.search(q, self.matrix, k=ASSIGN_CANDIDATES_PER_FACE)
+            candidates = np.unique(self.row_user[rows[rows >= 0]])
+            if candidates.size:
+                sel = np.flatnonzero(np.isin(self.row_user, candidates))
+                row_scores = q @ self.matrix[sel].T
+                row_scores[:, ~self.valid[sel]] = INVALID_SCORE
+                starts = np.searchsorted(self.row_user[sel], candidates)
+                candidate_scores = np.maximum.reduceat(row_scores, starts, axis=1)
+                # A face whose best candidate does not clear the threshold by the margin
+                # may be an ANN miss: then every face is scored against the whole gallery
+                if (candidate_scores.max(axis=1) >= threshold + ANN_EXACT_MARGIN).all():
+                    cols, scores = candidates, candidate_scores
+        if scores is None:
+            cols = np.arange(self.num_users)
+            scores = self.score_users(q)
+
+        weights = np.where(scores >= threshold, scores, _BELOW_THRESHOLD_PENALTY)
+        face_idx, col_idx = linear_sum_assignment(weights, maximize=True)
+        for f, c in zip(face_idx, col_idx):
+            if scores[f, c] >= threshold:
+                results[int(f)] = self.match_at(
+                    int(self.user_starts[cols[c]]), float(scores[f, c])
+                )
+        return results
+
+    def match_at(self, idx: int, similarity: float) -> GalleryMatch:
+        first_name, last_name = self.names[idx]
+        return GalleryMatch(
+            user_id=int(self.user_ids[idx]),
+            first_name=first_name,
+            last_name=last_name,
+            similarity=similarity,
+        )
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Stack vectors into a new float32 matrix and L2-normalize each row (zero rows stay zero)."""
+    # Always a copy: the input may be the caller's own float32 array or a read-only buffer
+    arr = np.array(vectors, dtype=np.float32, copy=True)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    np.divide(arr, norms, out=arr, where=norms > 0)
+    return arr
+
+
+def build_gallery(
+    rows,
+    dim: int = EMBEDDING_DIM,
+    ann_min_size: int = ANN_MIN_GALLERY_SIZE,
+) -> EmbeddingGallery:
+    """
+    Build a gallery from ``(user_id, embedding, first_name, last_name)`` rows,
+    one per face template. Rows without an embedding are skipped and the rows
+    of one user are grouped together (users keep their first-seen order). An
+    ANN index is built once the gallery has at least *ann_min_size* usable rows.
+    """
+    grouped: dict[int, list] = {}
+    for r in rows:
+        if r[1] is not None and len(r[1]) > 0:
+            grouped.setdefault(r[0], []).append(r)
+    rows = [r for user_rows in grouped.values() for r in user_rows]
+    n = len(rows)
+    user_ids = np.empty(n, dtype=np.int64)
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    valid = np.zeros(n, dtype=bool)
+    names = []
+
+    for i, (user_id, embedding, first_name, last_name) in enumerate(rows):
+        user_ids[i] = user_id
+        names.append((first_name, last_name))
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vec.shape[0] != dim:
+            continue
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            continue
+        matrix[i] = vec / norm
+        valid[i] = True
+
+    index = None
+    if int(valid.sum()) >= max(ann_min_size, 1):
+        index = IVFIndex.build(matrix, np.flatnonzero(valid))
+
+    return EmbeddingGallery(
+        user_ids=user_ids, matrix=matrix, valid=valid, names=names, index=index
+    )
+
+
+def templates_to_keep(templates, max_templates: int) -> list[int]:
+    """
+    Indices of the templates a user keeps when over *max_templates*. The
+    last template (the new enrollment) always stays; otherwise the most
+    redundant one -- highest similarity to another kept template -- is
+    dropped first, so distinct looks (glasses, lighting) survive.
+    """
+    keep = list(range(len(templates)))
+    if len(keep) <= max_templates:
+        return keep
+    matrix = normalize_rows(templates)
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    while len(keep) > max(max_templates, 1):
+        sub = sims[np.ix_(keep, keep)]
+        redundancy = sub.max(axis=1)
+        redundancy[-1] = -np.inf           # never drop the newest
+        keep.pop(int(np.argmax(redundancy)))
+    return keep
@@ -0,0 +1,316 @@
+"""Process-wide cache of per-session check-in galleries.
+
+Enrolled embeddings change rarely, so a kiosk burst at the start of class
+should score faces against memory instead of reloading the roster from
+Postgres on every frame. Entries are keyed by session_id, evicted in LRU
+order once either the entry or byte budget is exceeded, and patched or
+invalidated by the repository methods that change embeddings or membership.
+Patches (a user re-enrolls, joins the roster or is deleted) are
+copy-on-write: they build a new gallery whose ANN index is updated with
+IVFIndex.add / remove / remap, so a large event never re-runs k-means for
+one user and readers holding the old gallery keep a consistent one. The new
+gallery is built outside the cache lock, so lookups on the check-in path
+never wait for a patch.
+
+Each uvicorn worker holds its own cache and invalidation is local to the
+worker that performed the write, so entries also expire after
+GALLERY_CACHE_TTL_SECONDS to bound staleness across workers.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+
+import numpy as np
+
+from app.util.ann_index import ANN_MIN_GALLERY_SIZE, IVFIndex
+from app.util.gallery import EmbeddingGallery, build_gallery
+
+GALLERY_CACHE_MAX_ENTRIES = int(os.getenv("GALLERY_CACHE_MAX_ENTRIES", "256"))
+GALLERY_CACHE_MAX_BYTES = int(os.getenv("GALLERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+GALLERY_CACHE_TTL_SECONDS = float(os.getenv("GALLERY_CACHE_TTL_SECONDS", "300"))
+
+
+@dataclass
+class _CacheEntry:
+    event_id: int | None
+    gallery: EmbeddingGallery
+    roster: frozenset[int]   # non-creator user ids, with or without an embedding
+    loaded_at: float
+    nbytes: int
+
+
+def _gallery_nbytes(gallery: EmbeddingGallery) -> int:
+    nbytes = gallery.matrix.nbytes + gallery.user_ids.nbytes + gallery.valid.nbytes
+    if gallery.index is not None:
+        nbytes += gallery.index.nbytes
+    return int(nbytes)
+
+
+def _as_templates(templates) -> list:
+    """None, one embedding or a list of embeddings -> list of embeddings."""
+    if templates is None or len(templates) == 0:
+        return []
+    if np.ndim(templates[0]) == 0:
+        return [templates]
+    return list(templates)
+
+
+def _splice(gallery: EmbeddingGallery, drop: set[int], rows: list) -> EmbeddingGallery:
+    """
+    Copy of *gallery* without the rows of the users in *drop* and with
+    build_gallery-style *rows* appended (their users must not be in the
+    gallery after the drop, so every user's rows stay contiguous).
+    """
+    keep = ~np.isin(gallery.user_ids, list(drop))
+    # Appended rows are added to the existing index below, never indexed on their own
+    added = build_gallery(rows, dim=gallery.dim, ann_min_size=len(rows) + 1)
+    matrix = np.concatenate([gallery.matrix[keep], added.matrix])
+    valid = np.concatenate([gallery.valid[keep], added.valid])
+
+    index = gallery.index
+    if index is not None:
+        index = index.remap(np.where(keep, np.cumsum(keep) - 1, -1))
+        offset = int(keep.sum())
+        for i in np.flatnonzero(added.valid):
+            index.add(offset + int(i), added.matrix[i])
+    elif int(valid.sum()) >= max(ANN_MIN_GALLERY_SIZE, 1):
+        # The gallery grew past the ANN threshold through patches
+        index = IVFIndex.build(matrix, np.flatnonzero(valid))
+
+    return EmbeddingGallery(
+        user_ids=np.concatenate([gallery.user_ids[keep], added.user_ids]),
+        matrix=matrix,
+        valid=valid,
+        names=[n for n, k in zip(gallery.names, keep) if k] + added.names,
+        index=index,
+    )
+
+
+class GalleryCache:
+    """LRU, size-bounded map of session_id -> EmbeddingGallery."""
+
+    def __init__(
+        self,
+        max_entries: int = GALLERY_CACHE_MAX_ENTRIES,
+        max_bytes: int = GALLERY_CACHE_MAX_BYTES,
+        ttl_seconds: float = GALLERY_CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.__entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__bytes = 0
+        self.__generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.patches = 0
+
+    def get(self, session_id: int) -> EmbeddingGallery | None:
+        with self.__lock:
+            entry = self.__entries.get(session_id)
+            if entry is not None and monotonic() - entry.loaded_at > self.ttl_seconds:
+                self.__drop(session_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(session_id)
+            self.hits += 1
+            return entry.gallery
+
+    def generation(self) -> int:
+        """Counter bumped by every write; pass it back to put() to detect races."""
+        with self.__lock:
+            return self.__generation
+
+    def put(
+        self,
+        session_id: int,
+        event_id: int | None,
+        gallery: EmbeddingGallery,
+        roster,
+        generation: int | None = None,
+    ) -> None:
+        """
+        Store a freshly loaded gallery. If *generation* is given and a write
+        happened while the gallery was loading, the result is not cached.
+        """
+        entry = _CacheEntry(
+            event_id=event_id,
+            gallery=gallery,
+            roster=frozenset(roster),
+            loaded_at=monotonic(),
+            nbytes=_gallery_nbytes(gallery),
+        )
+        with self.__lock:
+            if generation is not None and generation != self.__generation:
+                return
+            if session_id in self.__entries:
+                self.__drop(session_id)
+            self.__entries[session_id] = entry
+            self.__bytes += entry.nbytes
+            while self.__entries and (
+                len(self.__entries) > self.max_entries or self.__bytes > self.max_bytes
+            ):
+                oldest = next(iter(self.__entries))
+                self.__drop(oldest)
+                self.evictions += 1
+
+    def invalidate_session(self, session_id: int) -> None:
+        with self.__lock:
+            self.__generation += 1
+            if session_id in self.__entries:
+                self.__drop(session_id)
+                self.invalidations += 1
+
+    def invalidate_event(self, event_id: int) -> None:
+        with self.__lock:
+            self.__generation += 1
+            for session_id in [
+                sid for sid, e in self.__entries.items() if e.event_id == event_id
+            ]:
+                self.__drop(session_id)
+                self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self.__lock:
+            self.__generation += 1
+            for session_id in [
+                sid for sid, e in self.__entries.items() if user_id in e.roster
+            ]:
+                self.__drop(session_id)
+                self.invalidations += 1
+
+    def __contains__(self, session_id: int) -> bool:
+        with self.__lock:
+            return session_id in self.__entries
+
+    def patch_user(self, user_id: int, templates, name: tuple[str | None, str | None] | None = None) -> None:
+        """
+        Replace a user's face templates (one embedding or a list, any count)
+        in every cached gallery whose roster has the user. The user's name
+        comes from their existing rows, else from *name*; a gallery with
+        neither is invalidated.
+        """
+        templates = _as_templates(templates)
+        with self.__lock:
+            self.__generation += 1
+            generation = self.__generation
+            targets = []
+            for session_id, entry in list(self.__entries.items()):
+                if user_id not in entry.roster:
+                    continue
+                idx = np.flatnonzero(entry.gallery.user_ids == user_id)
+                user_name = entry.gallery.names[idx[0]] if idx.size else name
+                if user_name is None:
+                    self.__drop(session_id)
+                    self.invalidations += 1
+                    continue
+                targets.append((session_id, entry, entry.gallery, entry.roster, user_name))
+
+        updates = [
+            (session_id, entry, _splice(gallery, {user_id}, [(user_id, t, *user_name) for t in templates]), roster)
+            for session_id, entry, gallery, roster, user_name in targets
+        ]
+        self.__swap(updates, generation)
+
+    def add_users(self, session_id: int, rows) -> None:
+        """
+        Add new roster members to a cached session gallery, given their
+        build_gallery rows (user_id, embedding or None, first_name, last_name).
+        Users already on the roster are left alone.
+        """
+        rows = list(rows)
+        with self.__lock:
+            self.__generation += 1
+            generation = self.__generation
+            entry = self.__entries.get(session_id)
+            if entry is None:
+                return
+            gallery, roster = entry.gallery, entry.roster
+
+        rows = [r for r in rows if r[0] not in roster]
+        if rows:
+            self.__swap([(session_id, entry, _splice(gallery, set(), rows), roster | {r[0] for r in rows})], generation)
+
+    def remove_user(self, user_id: int) -> None:
+        """Drop a (deleted) user's rows from every cached gallery that has them."""
+        with self.__lock:
+            self.__generation += 1
+            generation = self.__generation
+            targets = [
+                (session_id, entry, entry.gallery, entry.roster)
+                for session_id, entry in self.__entries.items()
+                if user_id in entry.roster
+            ]
+
+        updates = [
+            (session_id, entry, _splice(gallery, {user_id}, []), roster - {user_id})
+            for session_id, entry, gallery, roster in targets
+        ]
+        self.__swap(updates, generation)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__generation += 1
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "patches": self.patches,
+            }
+
+    def __swap(self, updates: list, generation: int) -> None:
+        """
+        Install patched galleries built outside the lock (splicing and the
+        index update are O(n)). If any other write happened meanwhile the
+        patch may be based on an outdated gallery, so the entry is dropped
+        instead; an entry that was evicted or reloaded is left alone.
+        """
+        with self.__lock:
+            stale = generation != self.__generation
+            for session_id, entry, gallery, roster in updates:
+                if self.__entries.get(session_id) is not entry:
+                    continue
+                if stale:
+                    self.__drop(session_id)
+                    self.invalidations += 1
+                else:
+                    self.__replace(entry, gallery, roster)
+
+    def __replace(self, entry: _CacheEntry, gallery: EmbeddingGallery, roster: frozenset[int]) -> None:
+        # Readers that already hold entry.gallery keep using the old, unchanged one
+        nbytes = _gallery_nbytes(gallery)
+        self.__bytes += nbytes - entry.nbytes
+        entry.gallery = gallery
+        entry.roster = roster
+        entry.nbytes = nbytes
+        self.patches += 1
+
+    def __drop(self, session_id: int) -> None:
+        entry = self.__entries.pop(session_id, None)
+        if entry is not None:
+            self.__bytes -= entry.nbytes
+
+
+# Single global instance shared across the app
+gallery_cache = GalleryCache()
@@ -0,0 +1,210 @@
+"""Idempotency-Key support for the check-in and enrollment uploads.
+
+A kiosk that times out waiting for POST /session/checkin retries the same
+request, and without a key every retry runs decode, detection and the
+embedder again and may broadcast the check-in twice. Clients that send an
+``Idempotency-Key`` header get the first completed response back for every
+retry with the same key (marked with ``Idempotent-Replayed: true``), without
+the handler running again. A retry that arrives while the first request is
+still running waits for its result instead of starting a second inference.
+
+Keys are scoped by the caller (the session plus the kiosk or client for
+check-ins, the user for enrollment uploads), so the same key from another
+kiosk, user or session is a different request. Each entry also keeps a
+fingerprint of the request body (see request_fingerprint); reusing a key
+with a different body is rejected with 422 instead of replaying a response
+that belongs to another image.
+
+Successful responses and definite client errors (CACHEABLE_ERRORS, e.g.
+400 "no face detected" or 404 unknown session) are stored. Everything else
+(401/403 such as a failed liveness check, 409 conflicts, 429, server errors
+and 503s) is not, so a retry after those runs normally. Entries expire
+after IDEMPOTENCY_TTL_SECONDS and are evicted in LRU order beyond
+IDEMPOTENCY_MAX_ENTRIES.
+
+Like the other in-memory stores, each worker has its own; a retry that
+lands on a different worker runs again (and is still safe: a repeated
+check-in finds the attendance already present).
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException, Response, UploadFile, status
+
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Client errors that a retry of the same request would get again
+CACHEABLE_ERRORS = frozenset({
+    status.HTTP_400_BAD_REQUEST,
+    status.HTTP_404_NOT_FOUND,
+    status.HTTP_413_CONTENT_TOO_LARGE,
+    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+    status.HTTP_422_UNPROCESSABLE_CONTENT,
+})
+
+
+async def request_fingerprint(uploads: list[UploadFile], *fields) -> str:
+    """sha256 over the uploaded files and form fields; each upload is rewound for the handler."""
+    digest = hashlib.sha256()
+    for upload in uploads:
+        digest.update(await upload.read())
+        await upload.seek(0)
+        digest.update(b"\0")
+    for field in fields:
+        digest.update(str(field).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class _Entry:
+    stored_at: float
+    running: asyncio.Future | None  # resolved when the first request finishes
+    fingerprint: str | None = None
+    result: Any = None
+    error: HTTPException | None = None
+
+
+class IdempotencyStore:
+    """LRU, TTL-bounded map of (scope, Idempotency-Key) -> completed response."""
+
+    def __init__(
+        self,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Only touched from the event loop, so no lock
+        self.__entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def run(
+        self,
+        scope: str,
+        key: str | None,
+        handler: Callable[[], Awaitable[Any]],
+        response: Response | None = None,
+        fingerprint: str | None = None,
+    ) -> Any:
+        """
+        Run handler once per (scope, key); without a key it simply runs. A
+        key reused with a different fingerprint is rejected with 422.
+        """
+        if key is None:
+            return await handler()
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters.",
+            )
+        full_key = f"{scope}:{key}"
+
+        while (entry := self.__lookup(full_key)) is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                    detail="Idempotency-Key was already used for a different request.",
+                )
+            if entry.running is not None:
+                # Duplicate of a request still in flight: wait for it, then look again
+                self.joined += 1
+                await asyncio.shield(entry.running)
+                continue
+            self.replayed += 1
+            if response is not None:
+                response.headers["Idempotent-Replayed"] = "true"
+            if entry.error is not None:
+                raise HTTPException(
+                    status_code=entry.error.status_code,
+                    detail=entry.error.detail,
+                    headers=entry.error.headers,
+                )
+            return entry.result
+
+        entry = _Entry(
+            stored_at=monotonic(),
+            running=asyncio.get_running_loop().create_future(),
+            fingerprint=fingerprint,
+        )
+        self.__entries[full_key] = entry
+        self.__evict()
+        self.executed += 1
+        try:
+            result = await handler()
+        except HTTPException as error:
+            if error.status_code in CACHEABLE_ERRORS:
+                self.__finish(entry, error=error)
+            else:
+                self.__discard(full_key, entry)
+            raise
+        except BaseException:
+            # Crashed or the client went away: waiters run the request themselves
+            self.__discard(full_key, entry)
+            raise
+        self.__finish(entry, result=result)
+        return result
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.__entries),
+            "in_flight": sum(e.running is not None for e in self.__entries.values()),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __lookup(self, full_key: str) -> _Entry | None:
+        entry = self.__entries.get(full_key)
+        if entry is None:
+            return None
+        if entry.running is None and monotonic() - entry.stored_at > self.ttl_seconds:
+            del self.__entries[full_key]
+            self.expirations += 1
+            return None
+        self.__entries.move_to_end(full_key)
+        return entry
+
+    def __finish(self, entry: _Entry, result: Any = None, error: HTTPException | None = None) -> None:
+        entry.result = result
+        entry.error = error
+        entry.stored_at = monotonic()
+        running, entry.running = entry.running, None
+        running.set_result(None)
+
+    def __discard(self, full_key: str, entry: _Entry) -> None:
+        if self.__entries.get(full_key) is entry:
+            del self.__entries[full_key]
+        running, entry.running = entry.running, None
+        running.set_result(None)
+
+    def __evict(self) -> None:
+        # Oldest completed entries first; in-flight ones are never evicted
+        while len(self.__entries) > self.max_entries:
+            oldest = next((k for k, e in self.__entries.items() if e.running is None), None)
+            if oldest is None:
+                return
+            del self.__entries[oldest]
+            self.evictions += 1
+
+
+# Single global instance shared across the app
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,73 @@
+"""Resolution-aware decoding for the face pipeline.
+
+Phone photos are often 12MP+, but MTCNN finds faces just as well on a
+MAX_DIMENSION copy and the embedder only ever sees 160x160 crops.
+
+- ``decode_image`` decodes large JPEGs at 1/2, 1/4 or 1/8 scale (libjpeg
+  does this in the DCT, much faster than a full decode) while keeping the
+  longest side at or above SOURCE_MAX_DIMENSION. That decoded frame is the
+  "original" that faces are cropped from.
+- ``downscale`` makes the detection copy and returns the scale factor
+  needed to map boxes back onto the original.
+"""
+
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+MAX_DIMENSION = int(os.getenv("MAX_DIMENSION", "1280"))  # Longest side MTCNN runs on
+SOURCE_MAX_DIMENSION = int(os.getenv("SOURCE_MAX_DIMENSION", "2560"))  # Longest side kept for cropping
+
+_REDUCED_DECODE = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _jpeg_size(data: bytes) -> tuple[int, int] | None:
+    """(width, height) from the JPEG header, or None for other formats."""
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            if header.format != "JPEG":
+                return None
+            return header.size
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+def decode_flag(data: bytes, source_max_dimension: int = SOURCE_MAX_DIMENSION) -> int:
+    """Pick the cv2.imdecode flag: the strongest JPEG reduction that stays >= the source limit."""
+    size = _jpeg_size(data)
+    if size is not None:
+        longest = max(size)
+        for factor, flag in _REDUCED_DECODE:
+            if longest // factor >= source_max_dimension:
+                return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(data: bytes, source_max_dimension: int = SOURCE_MAX_DIMENSION) -> np.ndarray | None:
+    """Decode upload bytes to a BGR frame, at reduced scale for very large JPEGs."""
+    arr = np.frombuffer(data, np.uint8)
+    flag = decode_flag(data, source_max_dimension)
+    img = cv2.imdecode(arr, flag)
+    if img is None and flag != cv2.IMREAD_COLOR:
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    return img
+
+
+def downscale(img: np.ndarray, max_dimension: int = MAX_DIMENSION) -> tuple[np.ndarray, float]:
+    """Return (copy with longest side <= max_dimension, scale of copy relative to img)."""
+    h, w = img.shape[:2]
+    longest = max(h, w)
+    if longest <= max_dimension:
+        return img, 1.0
+    scale = max_dimension / longest
+    small = cv2.resize(
+        img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+    )
+    return small, scale
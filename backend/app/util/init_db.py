@@ -1,5 +1,5 @@
 from app.core.database import Base, engine
-from app.db.models import user, event, event_user, session, attendance, user_achievement, pending_email_change, breakout_room, event_audit_log
+from app.db.models import user, event, event_user, session, attendance, user_achievement, pending_email_change, breakout_room, event_audit_log, user_face_template, liveness_challenge
 
 def create_table():
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
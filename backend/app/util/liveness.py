@@ -1,16 +1,44 @@
+"""Liveness challenges: issued by /livenessChallenge (or the kiosk socket), spent by a check-in.
+
+LivenessChallengeStore holds the create / verify rules; subclasses only
+store and atomically take challenges. LIVENESS_STORE picks the backend:
+
+    memory     (default) a dict per worker with min-heap expiry, so purging
+               expired challenges costs O(log n) per challenge instead of a
+               scan of every challenge on each call. A challenge can only be
+               verified by the worker that issued it.
+    database   a LivenessChallenges table shared by every worker and pod.
+               A challenge is taken with one DELETE ... RETURNING, so it is
+               spent exactly once even when two workers race for it.
+               Uses the app's Postgres, or LIVENESS_DATABASE_URL (e.g. a
+               SQLite file for several workers on one host). Every call is a
+               database round-trip, so async callers use acreate / averify,
+               which run it in the threadpool instead of on the event loop.
+"""
+
 from __future__ import annotations
 
+import heapq
+import os
+import threading
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from secrets import token_urlsafe
 from time import time
 
 from fastapi import HTTPException, status
+from sqlalchemy import create_engine, delete, insert
+from starlette.concurrency import run_in_threadpool
 
 
 LIVENESS_ACTIONS = {
     "blink": "Blink once",
 }
 CHALLENGE_TTL_SECONDS = 20
+LIVENESS_STORE = os.getenv("LIVENESS_STORE", "memory")
+LIVENESS_DATABASE_URL = os.getenv("LIVENESS_DATABASE_URL", "")
+# How often (at most) a worker deletes expired rows from the shared table
+LIVENESS_PURGE_SECONDS = float(os.getenv("LIVENESS_PURGE_SECONDS", "60"))
 
 
 @dataclass
@@ -20,36 +48,35 @@ class LivenessChallenge:
     expires_at: float
 
 
-class LivenessChallengeStore:
-    def __init__(self) -> None:
-        self.__challenges: dict[str, LivenessChallenge] = {}
+class LivenessChallengeStore(ABC):
+    def __init__(self, ttl_seconds: float = CHALLENGE_TTL_SECONDS, clock=time) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
 
     def create(self, session_id: int) -> dict:
-        self.__remove_expired()
         action = "blink"
         token = token_urlsafe(24)
-        self.__challenges[token] = LivenessChallenge(
+        self._put(token, LivenessChallenge(
             session_id=session_id,
             action=action,
-            expires_at=time() + CHALLENGE_TTL_SECONDS,
-        )
+            expires_at=self.clock() + self.ttl_seconds,
+        ))
         return {
             "token": token,
             "action": action,
             "prompt": LIVENESS_ACTIONS[action],
-            "expires_in": CHALLENGE_TTL_SECONDS,
+            "expires_in": self.ttl_seconds,
         }
 
     def verify(self, token: str | None, session_id: int, action: str | None) -> None:
-        self.__remove_expired()
         if not token or not action:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Live face verification is required before check-in.",
             )
 
-        challenge = self.__challenges.pop(token, None)
-        if challenge is None:
+        challenge = self._take(token)
+        if challenge is None or challenge.expires_at <= self.clock():
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Live face verification expired. Please try again.",
@@ -61,15 +88,119 @@ class LivenessChallengeStore:
                 detail="Live face verification did not match this check-in.",
             )
 
+    async def acreate(self, session_id: int) -> dict:
+        """create() for async callers; stores that do I/O run it off the event loop."""
+        return self.create(session_id)
+
+    async def averify(self, token: str | None, session_id: int, action: str | None) -> None:
+        """verify() for async callers; stores that do I/O run it off the event loop."""
+        self.verify(token, session_id, action)
+
+    @abstractmethod
+    def _put(self, token: str, challenge: LivenessChallenge) -> None:
+        """Store a newly issued challenge."""
+
+    @abstractmethod
+    def _take(self, token: str) -> LivenessChallenge | None:
+        """Remove and return the challenge (expired or not), or None if it is unknown."""
+
+
+class InMemoryLivenessStore(LivenessChallengeStore):
+    def __init__(self, ttl_seconds: float = CHALLENGE_TTL_SECONDS, clock=time) -> None:
+        super().__init__(ttl_seconds, clock)
+        self.__challenges: dict[str, LivenessChallenge] = {}
+        self.__expiry: list[tuple[float, str]] = []  # min-heap of (expires_at, token)
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__challenges)
+
+    def _put(self, token: str, challenge: LivenessChallenge) -> None:
+        with self.__lock:
+            self.__remove_expired()
+            self.__challenges[token] = challenge
+            heapq.heappush(self.__expiry, (challenge.expires_at, token))
+
+    def _take(self, token: str) -> LivenessChallenge | None:
+        with self.__lock:
+            self.__remove_expired()
+            return self.__challenges.pop(token, None)
+
     def __remove_expired(self) -> None:
-        now = time()
-        expired_tokens = [
-            token
-            for token, challenge in self.__challenges.items()
-            if challenge.expires_at <= now
-        ]
-        for token in expired_tokens:
+        # Verified tokens stay in the heap until they would have expired; popping them is a no-op
+        now = self.clock()
+        while self.__expiry and self.__expiry[0][0] <= now:
+            _, token = heapq.heappop(self.__expiry)
             self.__challenges.pop(token, None)
 
 
-liveness_store = LivenessChallengeStore()
+class DatabaseLivenessStore(LivenessChallengeStore):
+    def __init__(
+        self,
+        engine=None,
+        ttl_seconds: float = CHALLENGE_TTL_SECONDS,
+        clock=time,
+        purge_seconds: float = LIVENESS_PURGE_SECONDS,
+    ) -> None:
+        super().__init__(ttl_seconds, clock)
+        self.__engine = engine
+        self.purge_seconds = purge_seconds
+        self.__table = None
+        self.__last_purge = 0.0
+
+    async def acreate(self, session_id: int) -> dict:
+        return await run_in_threadpool(self.create, session_id)
+
+    async def averify(self, token: str | None, session_id: int, action: str | None) -> None:
+        await run_in_threadpool(self.verify, token, session_id, action)
+
+    def _put(self, token: str, challenge: LivenessChallenge) -> None:
+        table = self.__ready()
+        with self.__engine.begin() as conn:
+            conn.execute(insert(table).values(
+                token=token,
+                session_id=challenge.session_id,
+                action=challenge.action,
+                expires_at=challenge.expires_at,
+            ))
+            now = self.clock()
+            if now - self.__last_purge >= self.purge_seconds:
+                self.__last_purge = now
+                conn.execute(delete(table).where(table.c.expires_at <= now))
+
+    def _take(self, token: str) -> LivenessChallenge | None:
+        table = self.__ready()
+        with self.__engine.begin() as conn:
+            row = conn.execute(
+                delete(table)
+                .where(table.c.token == token)
+                .returning(table.c.session_id, table.c.action, table.c.expires_at)
+            ).first()
+        if row is None:
+            return None
+        return LivenessChallenge(session_id=row.session_id, action=row.action, expires_at=row.expires_at)
+
+    def __ready(self):
+        if self.__table is None:
+            from app.db.models.liveness_challenge import LivenessChallengeRecord
+
+            if self.__engine is None:
+                from app.core.database import engine
+
+                self.__engine = engine
+            table = LivenessChallengeRecord.__table__
+            table.create(bind=self.__engine, checkfirst=True)
+            self.__table = table
+        return self.__table
+
+
+def make_liveness_store(kind: str = LIVENESS_STORE) -> LivenessChallengeStore:
+    if kind == "database":
+        engine = create_engine(LIVENESS_DATABASE_URL) if LIVENESS_DATABASE_URL else None
+        return DatabaseLivenessStore(engine)
+    if kind != "memory":
+        print(f"[LivenessChallengeStore] Unknown LIVENESS_STORE={kind!r}; using the in-memory store.")
+    return InMemoryLivenessStore()
+
+
+liveness_store = make_liveness_store()
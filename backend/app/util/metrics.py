@@ -0,0 +1,104 @@
+"""Request timing middleware and the Prometheus /metrics exposition.
+
+ServerTimingMiddleware opens a ``collect_timings()`` collector for every
+HTTP request, records the whole request under its route template in
+``request_timings`` and, when SERVER_TIMING=1 (off by default), adds a
+``Server-Timing`` header listing the pipeline stages the request went through:
+
+    Server-Timing: upload;dur=41.2, decode;dur=8.3, detect;dur=95.0, ..., total;dur=212.4
+
+Routes that take an upload add ``Depends(upload_received)`` to record the
+time from the first byte until the multipart body is parsed as "upload".
+
+render_prometheus() renders the stage and request histograms in the
+Prometheus text format. Like every aggregate in app/util/timing.py they are
+per worker process; scrape each worker (or run a single worker per pod).
+"""
+
+import os
+from contextvars import ContextVar
+from time import perf_counter
+
+from starlette.datastructures import MutableHeaders
+
+from app.util.timing import collect_timings, record_stage, request_timings, stage_timings
+
+# Off by default: the header shows every client how long each pipeline stage took
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_request_started: ContextVar[float | None] = ContextVar("request_started", default=None)
+
+
+def upload_received() -> None:
+    """Route dependency: FastAPI parses the form before any dependency, so this is the upload time."""
+    started = _request_started.get()
+    if started is not None:
+        record_stage("upload", perf_counter() - started)
+
+
+def server_timing_header(timings: dict[str, float], total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1000.0:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000.0:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        token = _request_started.set(started)
+        with collect_timings() as timings:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start" and self.server_timing and timings:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing_header(timings, perf_counter() - started))
+                    headers.append("Timing-Allow-Origin", "*")
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                _request_started.reset(token)
+                route = scope.get("route")
+                if route is not None:
+                    request_timings.record(f"{scope['method']} {route.path}", perf_counter() - started)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _histogram(name: str, help_text: str, histograms: dict, labels) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, hist in sorted(histograms.items()):
+        label = ",".join(f'{k}="{_escape(v)}"' for k, v in labels(key))
+        for le, count in hist["buckets"]:
+            bound = "+Inf" if le == float("inf") else repr(le)
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{label}}} {hist['sum']:.6f}")
+        lines.append(f"{name}_count{{{label}}} {hist['count']}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines = _histogram(
+        "veriface_stage_duration_seconds",
+        "Duration of one face pipeline stage (decode, detect, embed, match, ...).",
+        stage_timings.histograms(),
+        lambda stage: [("stage", stage)],
+    )
+    lines += _histogram(
+        "veriface_request_duration_seconds",
+        "Duration of an HTTP request by route.",
+        request_timings.histograms(),
+        lambda key: list(zip(("method", "route"), key.split(" ", 1))),
+    )
+    return "\n".join(lines) + "\n"
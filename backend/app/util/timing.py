@@ -0,0 +1,114 @@
+"""Per-stage timings for the face pipeline (decode, detect, crop, embed, ...).
+
+Every ``timed(stage)`` block is added to the process-wide ``stage_timings``
+aggregate (count, total, max and a latency histogram per stage). When a
+request opened a collector with ``collect_timings()``, the block is also
+added to that request's dict. The collector is held in a ContextVar, so it
+follows the request into ``run_in_threadpool``.
+
+Stages of a check-in / enrollment request, in order:
+
+    upload             receive + multipart parse (until the handler starts)
+    decode             cv2.imdecode (+ reduced-resolution decode)
+    downscale, detect, crop
+    embed_wait, embed  queueing for / running the batched embedder
+    occlusion          occlusion scoring of enrollment crops
+    gallery_load       session gallery from Postgres (gallery cache miss)
+    match              scoring and assigning faces to users
+    attendance_commit  check-in write
+    enroll_commit      face template write
+    broadcast          dashboard websocket broadcast
+"""
+
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+# Histogram bucket upper bounds (seconds), Prometheus-style
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageTimings:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.__lock = threading.Lock()
+        self.__stages: dict[str, list[float]] = {}   # stage -> [count, total, max]
+        self.__histograms: dict[str, list[int]] = {}  # stage -> per-bucket counts (+Inf last)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            entry = self.__stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            counts = self.__histograms.get(stage)
+            if counts is None:
+                counts = self.__histograms[stage] = [0] * (len(self.buckets) + 1)
+            counts[bisect_left(self.buckets, seconds)] += 1
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000.0, 3),
+                    "max_ms": round(longest * 1000.0, 3),
+                }
+                for stage, (count, total, longest) in self.__stages.items()
+            }
+
+    def histograms(self) -> dict[str, dict]:
+        """Per stage: cumulative bucket counts (le -> count, "+Inf" last), sum and count."""
+        with self.__lock:
+            result = {}
+            for stage, counts in self.__histograms.items():
+                cumulative, running = [], 0
+                for le, n in zip((*self.buckets, float("inf")), counts):
+                    running += n
+                    cumulative.append((le, running))
+                count, total, _ = self.__stages[stage]
+                result[stage] = {"buckets": cumulative, "sum": total, "count": count}
+            return result
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__stages.clear()
+            self.__histograms.clear()
+
+
+# Single global instance shared across the app
+stage_timings = StageTimings()
+# Whole-request durations, keyed by route template (see app/util/metrics.py)
+request_timings = StageTimings()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. in an inference worker process)."""
+    stage_timings.record(stage, seconds)
+    current = _request_timings.get()
+    if current is not None:
+        current[stage] = current.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, perf_counter() - started)
+
+
+@contextmanager
+def collect_timings():
+    """Collect this request's stage durations (seconds) into the yielded dict."""
+    timings: dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
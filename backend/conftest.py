@@ -8,6 +8,7 @@ This file provides:
 - Test data factories
 """
 
+import os
 import pytest
 from pathlib import Path
 from typing import Generator
@@ -15,6 +16,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from fastapi.testclient import TestClient
 
+# Load models on first use instead of warming all of them for every test session
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+
 from app.core.database import Base, get_db
 from app.core.security.hashHelper import HashHelper
 from app.core.security.authHandler import AuthHandler
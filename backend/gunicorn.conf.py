@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for multi-worker deployments.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py main:app
+
+MODEL_PRELOAD=1 imports the app in the master and loads the fork-safe model
+weights there before any worker is forked. The workers then share those
+pages copy-on-write instead of holding one copy each (see
+ModelRegistry.preload_for_fork). Measure the effect with
+`python -m scripts.measure_worker_rss`.
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:80")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("MODEL_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the app was imported (preload) and before the first fork
+    if preload_app:
+        from app.service.ModelRegistry import model_registry
+
+        model_registry.preload_for_fork()
+        server.log.info("Model weights preloaded in master: %s", model_registry.status()["models"])
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.service.ModelRegistry import model_registry
+
+        model_registry.after_fork()
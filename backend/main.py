@@ -1,17 +1,30 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 from app.util.init_db import create_table
 from app.routers.auth import authRouter
 from app.routers.protected.protected import protectedRouter
 from app.util.ws_manager import manager, breakout_manager
+from app.util.checkin import CheckinStream, check_session_admission
+from app.util.checkin_journal import checkin_journal
+from app.core.database import get_session_factory
+from app.util.embeddings import INFERENCE_BACKEND, inference
+from app.service.ModelRegistry import model_registry
 from fastapi.middleware.cors import CORSMiddleware
+from app.util.metrics import PROMETHEUS_CONTENT_TYPE, ServerTimingMiddleware, render_prometheus
 
 
 @asynccontextmanager
 async def lifespan(app:FastAPI):
     print("Writting to table")
     create_table()
+    model_registry.start_warmup()
+    checkin_journal.start()
     yield
+    checkin_journal.close()
+    if INFERENCE_BACKEND == "pool":
+        inference.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -22,8 +35,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition", "X-Report-Filename"],
+    expose_headers=["Content-Disposition", "X-Report-Filename", "Server-Timing", "Retry-After", "Idempotent-Replayed"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(router=authRouter, tags=["auth"], prefix="/auth")
 app.include_router(router=protectedRouter, tags=["protected"], prefix="/protected")
@@ -53,9 +67,36 @@ async def websocket_breakout(websocket: WebSocket, session_id: int):
         breakout_manager.disconnect(websocket, session_id)
 
 
+@app.websocket("/ws/checkin/{session_id}")
+async def websocket_checkin(websocket: WebSocket, session_id: int, session_factory=Depends(get_session_factory)):
+    """Kiosks stream camera frames here and get recognition / check-in results back (see CheckinStream)."""
+    await websocket.accept()
+    # The socket lives as long as the kiosk; hold a DB session only for the admission check
+    # (and, inside CheckinStream, for one recognized frame at a time)
+    try:
+        await run_in_threadpool(check_session_admission, session_factory, session_id)
+    except HTTPException as error:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=error.detail)
+        return
+    await CheckinStream(websocket, session_id, session_factory).run()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Hello from Docker!"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once every model is loaded and warmed up, 503 until then."""
+    readiness = model_registry.status()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: per-stage and per-route latency histograms of this worker."""
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 
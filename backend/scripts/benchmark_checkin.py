@@ -0,0 +1,290 @@
+"""
+Check-in matching benchmark on synthetic galleries.
+
+For every gallery size the script builds a throwaway database with one event,
+one session and N enrolled attendees whose embeddings are random unit
+vectors, then times the end-to-end match + write path exactly as the routes
+run it:
+
+  single   AttendanceService.check_in_with_embedding (one face)
+  frame    AttendanceService.check_in_faces (--faces faces per frame, the
+           path POST /checkin and /ws/checkin use)
+
+Each probe is an enrolled user's embedding plus noise (cosine ~--similarity
+to the original), so every check-in matches and writes. Per size and path
+it reports:
+
+  cold_ms       first call: gallery load from the DB + match + write
+  p50/p95/p99   latency of the following (warm gallery cache) calls, ms
+  queries       mean SQL statements per call (counted on the engine)
+  accuracy      share of probes matched to the user they were made from
+
+Results are printed and, with --json, written as one machine-readable file.
+--compare checks a run against an earlier results file and exits with
+status 1 when a p95 got more than --tolerance slower.
+
+The default database is in-memory SQLite. --database-url runs against a
+local Postgres instead; it must point at an empty database, the script
+creates its tables there and drops them again.
+
+Usage:
+    cd backend
+    python -m scripts.benchmark_checkin
+    python -m scripts.benchmark_checkin --sizes 50 500 --checkins 100 --json bench.json
+    python -m scripts.benchmark_checkin --compare bench.json --tolerance 0.25
+    python -m scripts.benchmark_checkin --database-url postgresql://localhost/bench
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, inspect, insert, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.util import init_db  # noqa: F401  (registers every mapped model)
+from app.db.models.attendance import Attendance, AttendanceStatus
+from app.db.models.event import Event
+from app.db.models.session import Session as SessionModel
+from app.db.models.user import User
+from app.service.attendantService import AttendanceService
+from app.util.ann_index import ANN_MIN_GALLERY_SIZE
+from app.util.embedding_format import EMBEDDING_DIM, EMBEDDING_MODEL, encode_embedding
+from app.util.gallery import normalize_rows
+from app.util.gallery_cache import gallery_cache
+
+DEFAULT_SIZES = [50, 500, 5000, 50000]
+INSERT_BATCH = 5000
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.__on_execute)
+
+    def __on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def make_engine(url: str | None):
+    if url is None:
+        return create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+    engine = create_engine(url)
+    if inspect(engine).get_table_names():
+        raise SystemExit(f"{url} is not empty; point --database-url at a throwaway database")
+    return engine
+
+
+def seed(db, size: int, rng: np.random.Generator) -> tuple[int, np.ndarray, np.ndarray]:
+    """Event, session and *size* enrolled attendees. Returns (session_id, user_ids, embeddings)."""
+    creator = User(email="creator@bench.local", first_name="Bench", last_name="Creator")
+    db.add(creator)
+    db.flush()
+    ev = Event(user_id=creator.id, event_name="benchmark")
+    db.add(ev)
+    db.flush()
+    sess = SessionModel(event_id=ev.id, sequence_number=1)
+    db.add(sess)
+    db.flush()
+
+    embeddings = normalize_rows(rng.standard_normal((size, EMBEDDING_DIM)))
+    for start in range(0, size, INSERT_BATCH):
+        db.execute(insert(User), [
+            {
+                "email": f"user{i}@bench.local",
+                "first_name": f"User{i}",
+                "last_name": "Bench",
+                "embedding_vec": encode_embedding(embeddings[i]),
+                "embedding_model": EMBEDDING_MODEL,
+                "has_embedding": True,
+            }
+            for i in range(start, min(start + INSERT_BATCH, size))
+        ])
+    user_ids = np.array(
+        [uid for (uid,) in db.query(User.id).filter(User.id != creator.id).order_by(User.id)],
+        dtype=np.int64,
+    )
+    rows = [{"user_id": int(uid), "session_id": sess.id, "status": AttendanceStatus.ABSENT} for uid in user_ids]
+    rows.append({"user_id": creator.id, "session_id": sess.id, "status": AttendanceStatus.ABSENT})
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.execute(insert(Attendance), rows[start:start + INSERT_BATCH])
+    db.commit()
+    return sess.id, user_ids, embeddings
+
+
+def probes(embeddings: np.ndarray, picks: np.ndarray, similarity: float, rng) -> np.ndarray:
+    """Unit vectors at cosine ~similarity to the picked embeddings."""
+    noise = normalize_rows(rng.standard_normal((len(picks), embeddings.shape[1])))
+    noise -= (noise * embeddings[picks]).sum(axis=1, keepdims=True) * embeddings[picks]
+    noise = normalize_rows(noise)
+    return normalize_rows(similarity * embeddings[picks] + np.sqrt(1 - similarity ** 2) * noise)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_path(path, Session, counter, session_id, user_ids, embeddings, args, rng) -> dict:
+    gallery_cache.clear()
+    with Session() as db:
+        db.execute(update(Attendance).values(status=AttendanceStatus.ABSENT, check_in_time=None))
+        db.commit()
+
+    per_call = args.faces if path == "frame" else 1
+    calls = min(args.checkins, len(user_ids) // per_call)
+    picks = rng.permutation(len(user_ids))[: calls * per_call].reshape(calls, per_call)
+
+    latencies, queries = [], []
+    correct = cold_ms = cold_queries = 0
+    for n, pick in enumerate(picks):
+        faces = probes(embeddings, pick, args.similarity, rng)
+        with Session() as db:
+            service = AttendanceService(session=db)
+            before = counter.count
+            started = time.perf_counter()
+            if path == "single":
+                try:
+                    outcomes = [service.check_in_with_embedding(session_id, faces[0].tolist(), threshold=args.threshold)]
+                except HTTPException as error:
+                    # A miss (e.g. ANN recall at large sizes) is a result, not a crash
+                    outcomes = [error]
+            else:
+                outcomes = service.check_in_faces(session_id, faces.tolist(), threshold=args.threshold)
+            elapsed = (time.perf_counter() - started) * 1000.0
+            used = counter.count - before
+
+        correct += sum(
+            isinstance(o, dict) and o["user_id"] == int(user_ids[i]) for o, i in zip(outcomes, pick)
+        )
+        if n == 0:
+            cold_ms = elapsed
+            cold_queries = used
+            continue
+        latencies.append(elapsed)
+        queries.append(used)
+
+    return {
+        "path": path,
+        "faces_per_call": per_call,
+        "calls": calls,
+        "cold_ms": round(cold_ms, 3),
+        "cold_queries": cold_queries,
+        "p50_ms": round(percentile(latencies, 0.50), 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else None,
+        "queries_per_call": round(statistics.fmean(queries), 2) if queries else None,
+        "accuracy": round(correct / (calls * per_call), 4) if calls else None,
+    }
+
+
+def run_size(size: int, args) -> list[dict]:
+    rng = np.random.default_rng(args.seed)
+    engine = make_engine(args.database_url)
+    Base.metadata.create_all(engine)
+    try:
+        Session = sessionmaker(bind=engine, autoflush=False)
+        counter = QueryCounter(engine)
+        started = time.perf_counter()
+        with Session() as db:
+            session_id, user_ids, embeddings = seed(db, size, rng)
+        seed_s = time.perf_counter() - started
+
+        results = []
+        for path in args.paths:
+            result = run_path(path, Session, counter, session_id, user_ids, embeddings, args, rng)
+            results.append({"gallery_size": size, "seed_seconds": round(seed_s, 2), **result})
+        return results
+    finally:
+        gallery_cache.clear()
+        if args.database_url is not None:
+            Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def print_results(results: list[dict]) -> None:
+    print(f"\n  {'users':>7} {'path':<7} {'calls':>6} {'cold ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'accuracy':>9}")
+    for r in results:
+        print(
+            f"  {r['gallery_size']:>7} {r['path']:<7} {r['calls']:>6} {r['cold_ms']:>9.2f} "
+            f"{r['p50_ms'] or 0:>8.2f} {r['p95_ms'] or 0:>8.2f} {r['p99_ms'] or 0:>8.2f} "
+            f"{r['queries_per_call'] or 0:>8.2f} {r['accuracy'] or 0:>9.3f}"
+        )
+
+
+def compare(results: list[dict], baseline_path: Path, tolerance: float) -> list[str]:
+    """Return one line per (size, path) whose p95 regressed by more than tolerance."""
+    baseline = {
+        (r["gallery_size"], r["path"]): r for r in json.loads(baseline_path.read_text())["results"]
+    }
+    regressions = []
+    for r in results:
+        old = baseline.get((r["gallery_size"], r["path"]))
+        if not old or not old.get("p95_ms") or r["p95_ms"] is None:
+            continue
+        if r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{r['gallery_size']} users / {r['path']}: p95 {old['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms"
+            )
+        if r["queries_per_call"] is not None and old.get("queries_per_call") is not None \
+                and r["queries_per_call"] > old["queries_per_call"]:
+            regressions.append(
+                f"{r['gallery_size']} users / {r['path']}: queries {old['queries_per_call']} -> {r['queries_per_call']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--paths", nargs="+", choices=["single", "frame"], default=["single", "frame"])
+    parser.add_argument("--checkins", type=int, default=200, help="calls per size and path")
+    parser.add_argument("--faces", type=int, default=3, help="faces per frame for the frame path")
+    parser.add_argument("--similarity", type=float, default=0.8, help="cosine of a probe to its user")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="empty local Postgres database (default: in-memory SQLite)")
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument("--compare", type=Path, help="earlier --json results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown for --compare")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"Gallery of {size} users...")
+        results.extend(run_size(size, args))
+    print_results(results)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "database": "sqlite-memory" if args.database_url is None else "postgresql",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "ann_min_gallery_size": ANN_MIN_GALLERY_SIZE,
+        "settings": {k: v for k, v in vars(args).items() if k not in {"json", "compare", "database_url"}},
+        "results": results,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
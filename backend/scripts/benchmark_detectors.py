@@ -0,0 +1,208 @@
+"""
+Side-by-side benchmark of the face detector backends (app/service/FaceDetector.py).
+
+Each detector runs exactly as ModelService runs it: on a copy of the image
+downscaled to MAX_DIMENSION, with the boxes mapped back to full resolution.
+Per detector the script reports:
+
+  latency   median / p95 detection time per image (ms)
+  recall    reference faces matched by a detection with IoU >= --iou
+  extra     detections that match no reference face
+  missed    images where the service would answer "No face detected"
+  cosine    (--embed) mean / min cosine between the embedding of the crop cut
+            from the detector's box and the crop cut from the reference box.
+            Stored embeddings come from MTCNN crops, so a detector whose boxes
+            sit differently shifts every probe embedding by this much.
+
+Reference faces come from --labels (JSON: {"file.jpg": [[x1, y1, x2, y2], ...]})
+or, by default, from MTCNN run on the full-resolution image (prob >= 0.9).
+With the default reference MTCNN's recall only measures the downscale loss.
+
+Detectors whose model file is missing are skipped (see FACE_DETECTOR_MODEL_DIR).
+
+Usage:
+    cd backend
+    python -m scripts.benchmark_detectors
+    python -m scripts.benchmark_detectors --detectors mtcnn centerface --embed
+    python -m scripts.benchmark_detectors --images test_images --labels faces.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from facenet_pytorch import MTCNN, InceptionResnetV1
+
+from app.service.FaceDetector import (
+    FACE_DETECTOR_MODEL_DIR,
+    MtcnnDetector,
+    _FILE_BACKENDS,
+)
+from app.util.face_tracker import iou_matrix
+from app.util.image_preprocess import MAX_DIMENSION, downscale
+
+BACKEND_DIR = Path(__file__).parent.parent
+DEFAULT_IMAGES = [BACKEND_DIR / "test_images", BACKEND_DIR / "test" / "imgs"]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+REFERENCE_MIN_PROB = 0.9
+
+
+def load_images(dirs: list[Path]) -> list[tuple[str, np.ndarray]]:
+    images = []
+    for d in dirs:
+        for path in sorted(Path(d).glob("*")):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                img = cv2.imread(str(path))
+                if img is not None:
+                    images.append((path.name, img))
+    return images
+
+
+def match(reference: np.ndarray, found: np.ndarray, min_iou: float) -> list[tuple[int, int]]:
+    """Greedy one-to-one matching, best IoU first."""
+    if len(reference) == 0 or len(found) == 0:
+        return []
+    ious = iou_matrix(reference, found)
+    pairs = []
+    used_ref, used_found = set(), set()
+    for flat in np.argsort(ious, axis=None)[::-1]:
+        r, f = np.unravel_index(flat, ious.shape)
+        if ious[r, f] < min_iou:
+            break
+        if r not in used_ref and f not in used_found:
+            pairs.append((int(r), int(f)))
+            used_ref.add(r)
+            used_found.add(f)
+    return pairs
+
+
+def reference_boxes(images, mtcnn: MTCNN, labels: dict | None) -> dict[str, np.ndarray]:
+    reference = {}
+    for name, img in images:
+        if labels is not None:
+            reference[name] = np.asarray(labels.get(name, []), dtype=np.float32).reshape(-1, 4)
+            continue
+        boxes, probs = mtcnn.detect(img)
+        if boxes is None:
+            reference[name] = np.empty((0, 4), dtype=np.float32)
+        else:
+            keep = np.asarray(probs, dtype=np.float32) >= REFERENCE_MIN_PROB
+            reference[name] = np.asarray(boxes, dtype=np.float32)[keep]
+    return reference
+
+
+def load_detectors(names: list[str], mtcnn: MTCNN, model_dir: Path) -> list:
+    detectors = []
+    for name in names:
+        if name == "mtcnn":
+            detectors.append(MtcnnDetector(mtcnn))
+            continue
+        cls, filename = _FILE_BACKENDS[name]
+        path = model_dir / filename
+        if not path.exists():
+            print(f"Skipping {name}: {path} not found")
+            continue
+        detectors.append(cls(path))
+    return detectors
+
+
+def embed_crops(mtcnn: MTCNN, embedder, img: np.ndarray, boxes: np.ndarray) -> torch.Tensor:
+    faces = mtcnn.extract(img, boxes, None)
+    with torch.no_grad():
+        return F.normalize(embedder(faces), p=2, dim=1)
+
+
+def benchmark(detector, images, reference, args, mtcnn, embedder) -> dict:
+    latencies, cosines = [], []
+    matched = total = extra = missed = 0
+    for name, img in images:
+        small, scale = downscale(img, args.max_dimension)
+        detector.detect(small)                        # warm the input shape
+        times = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            dets = detector.detect(small)
+            times.append(time.perf_counter() - started)
+        latencies.append(statistics.median(times) * 1000.0)
+
+        boxes = dets[:, :4] / scale
+        ref = reference[name]
+        pairs = match(ref, boxes, args.iou)
+        matched += len(pairs)
+        total += len(ref)
+        extra += len(boxes) - len(pairs)
+        missed += len(boxes) == 0
+
+        if embedder is not None and pairs:
+            ref_idx, found_idx = zip(*pairs)
+            expected = embed_crops(mtcnn, embedder, img, ref[list(ref_idx)])
+            actual = embed_crops(mtcnn, embedder, img, boxes[list(found_idx)])
+            cosines.extend((expected * actual).sum(dim=1).tolist())
+
+    latencies.sort()
+    return {
+        "detector": detector.name,
+        "median_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "recall": matched / total if total else None,
+        "matched": matched,
+        "reference": total,
+        "extra": extra,
+        "no_face_images": missed,
+        "cosine_mean": statistics.fmean(cosines) if cosines else None,
+        "cosine_min": min(cosines) if cosines else None,
+    }
+
+
+def print_results(results: list[dict], images: int) -> None:
+    print(f"\n{images} images, detection on a MAX_DIMENSION copy\n")
+    print(f"  {'detector':<11} {'median ms':>9} {'p95 ms':>8} {'recall':>13} {'extra':>6} {'no face':>8} {'cos mean':>9} {'cos min':>8}")
+    for r in results:
+        recall = "-" if r["recall"] is None else f"{r['recall']:.3f} ({r['matched']}/{r['reference']})"
+        cos_mean = "-" if r["cosine_mean"] is None else f"{r['cosine_mean']:.4f}"
+        cos_min = "-" if r["cosine_min"] is None else f"{r['cosine_min']:.4f}"
+        print(
+            f"  {r['detector']:<11} {r['median_ms']:>9.1f} {r['p95_ms']:>8.1f} {recall:>13} "
+            f"{r['extra']:>6} {r['no_face_images']:>8} {cos_mean:>9} {cos_min:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--detectors", nargs="+", default=["mtcnn", *_FILE_BACKENDS])
+    parser.add_argument("--model-dir", type=Path, default=FACE_DETECTOR_MODEL_DIR)
+    parser.add_argument("--labels", type=Path, help="ground-truth boxes (JSON); default: full-resolution MTCNN")
+    parser.add_argument("--max-dimension", type=int, default=MAX_DIMENSION)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--embed", action="store_true", help="compare crop embeddings against the reference boxes")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit("No images found")
+
+    mtcnn = MTCNN(image_size=160, margin=20, keep_all=True, device="cpu")
+    labels = json.loads(args.labels.read_text()) if args.labels else None
+    reference = reference_boxes(images, mtcnn, labels)
+    embedder = InceptionResnetV1(pretrained="vggface2").eval() if args.embed else None
+
+    results = [
+        benchmark(detector, images, reference, args, mtcnn, embedder)
+        for detector in load_detectors(args.detectors, mtcnn, args.model_dir)
+    ]
+    print_results(results, len(images))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
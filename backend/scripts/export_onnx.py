@@ -0,0 +1,80 @@
+"""
+Export the face embedder and occlusion classifier to ONNX for INFERENCE_ENGINE=onnx.
+
+Writes facenet_vggface2.onnx (and occlusion_model.onnx when
+models/occlusion_model.pth exists) into ONNX_MODEL_DIR with a dynamic batch
+axis, then checks each graph against PyTorch when onnxruntime is installed.
+
+Usage:
+    cd backend
+    python -m scripts.export_onnx
+    python -m scripts.export_onnx --out-dir /tmp/onnx --opset 17
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+
+from app.service.InferenceEngine import EMBEDDER_ONNX, OCCLUSION_ONNX, ONNX_MODEL_DIR
+
+
+def export(module: torch.nn.Module, sample: torch.Tensor, path: Path, opset: int) -> None:
+    torch.onnx.export(
+        module,
+        sample,
+        str(path),
+        input_names=["input"],
+        output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+        opset_version=opset,
+        dynamo=False,
+    )
+    print(f"Exported {path}")
+
+
+def verify(module: torch.nn.Module, sample: torch.Tensor, path: Path) -> None:
+    try:
+        from app.service.InferenceEngine import OnnxEngine
+        engine = OnnxEngine(path)
+    except ImportError:
+        print("onnxruntime not installed; skipping parity check.")
+        return
+
+    with torch.no_grad():
+        expected = module(sample).numpy()
+    actual = engine.run(sample).numpy()
+    cos = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1) + 1e-12
+    )
+    print(f"  min cosine vs PyTorch: {cos.min():.6f}  max abs diff: {np.abs(expected - actual).max():.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out-dir", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+
+    embedder = InceptionResnetV1(pretrained="vggface2").eval()
+    sample = torch.randn(4, 3, 160, 160)
+    path = args.out_dir / EMBEDDER_ONNX
+    export(embedder, sample[:1], path, args.opset)
+    verify(embedder, sample, path)
+
+    from app.service.OcclusionService import MODEL_PATH, load_torch_model
+    if not MODEL_PATH.exists():
+        print(f"{MODEL_PATH} not found; skipping occlusion model.")
+        return
+    classifier = load_torch_model(torch.device("cpu"))
+    sample = torch.randn(4, 3, 224, 224)
+    path = args.out_dir / OCCLUSION_ONNX
+    export(classifier, sample[:1], path, args.opset)
+    verify(classifier, sample, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Measure per-worker memory with and without prefork model sharing.
+
+Starts gunicorn (gunicorn.conf.py) twice, once with MODEL_PRELOAD=0 and once
+with MODEL_PRELOAD=1. It waits until every worker has loaded and warmed its
+models and its RSS has settled, then reads /proc/<pid>/smaps_rollup for the
+master and each worker:
+
+  RSS      resident pages, counting shared pages in every process
+  PSS      proportional set size: shared pages split between their users.
+           The sum of PSS is what the node actually pays.
+  shared   pages shared with another process (the preloaded weights)
+  private  pages only this process uses
+
+Linux only (needs /proc). The app must be able to start, i.e. the database
+in backend/.env must be reachable.
+
+Usage:
+    cd backend
+    python -m scripts.measure_worker_rss
+    python -m scripts.measure_worker_rss --workers 4 --app main:app --port 8765
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+
+def smaps_mb(pid: int) -> dict[str, float]:
+    totals = {"rss": 0.0, "pss": 0.0, "shared": 0.0, "private": 0.0}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in SMAPS_FIELDS:
+                totals[SMAPS_FIELDS[key]] += int(rest.split()[0]) / 1024.0
+    return totals
+
+
+def children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def wait_until_warm(master: subprocess.Popen, workers: int, port: int, timeout: float) -> list[int]:
+    """Wait for all workers to exist, /ready to answer 200 and worker RSS to stop growing."""
+    deadline = time.monotonic() + timeout
+    last, stable = None, 0
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            sys.exit(f"gunicorn exited with code {master.returncode}")
+        time.sleep(2)
+
+        pids = children(master.pid)
+        if len(pids) < workers or not _ready(port):
+            continue
+        rss = [smaps_mb(p)["rss"] for p in pids]
+        if last is not None and len(last) == len(rss) and all(
+            abs(a - b) <= max(1.0, 0.01 * b) for a, b in zip(rss, last)
+        ):
+            stable += 1
+            if stable >= 3:
+                return pids
+        else:
+            stable = 0
+        last = rss
+    sys.exit("Timed out waiting for the workers to warm up")
+
+
+def _ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def measure(preload: bool, args) -> dict:
+    env = dict(
+        os.environ,
+        MODEL_PRELOAD="1" if preload else "0",
+        MODEL_WARMUP="blocking",
+        WEB_CONCURRENCY=str(args.workers),
+        BIND=f"127.0.0.1:{args.port}",
+    )
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", args.app],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        pids = wait_until_warm(master, args.workers, args.port, args.timeout)
+        return {"master": smaps_mb(master.pid), "workers": [smaps_mb(p) for p in pids]}
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+
+
+def print_result(label: str, result: dict) -> float:
+    print(f"\n{label}")
+    print(f"  {'process':<10} {'RSS MB':>9} {'PSS MB':>9} {'shared MB':>10} {'private MB':>11}")
+    rows = [("master", result["master"])] + [
+        (f"worker {i}", w) for i, w in enumerate(result["workers"])
+    ]
+    for name, m in rows:
+        print(f"  {name:<10} {m['rss']:>9.1f} {m['pss']:>9.1f} {m['shared']:>10.1f} {m['private']:>11.1f}")
+    total_pss = sum(m["pss"] for _, m in rows)
+    print(f"  {'total PSS':<10} {total_pss:>9.1f} MB")
+    return total_pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--verbose", action="store_true", help="show gunicorn logs")
+    args = parser.parse_args()
+
+    if not Path("/proc/self/smaps_rollup").exists():
+        sys.exit("This script needs Linux /proc/<pid>/smaps_rollup")
+
+    without = print_result("Without sharing (MODEL_PRELOAD=0)", measure(False, args))
+    with_sharing = print_result("With sharing (MODEL_PRELOAD=1)", measure(True, args))
+    print(f"\nTotal PSS saved: {without - with_sharing:.1f} MB ({args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
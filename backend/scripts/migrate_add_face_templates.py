@@ -0,0 +1,89 @@
+"""
+One-time migration: add the UserFaceTemplates table and seed it with every
+existing Users.embedding as that user's first template.
+
+Users without a template keep matching on Users.embedding, so the backfill
+can run while the app is serving.
+
+Works before and after scripts/migrate_embedding_bytea.py (and on a fresh
+install, where create_all already made the bytea tables): once Users has an
+embedding_vec column the table is created with, and seeded from, the bytea
+blobs instead of the old REAL[] arrays. If migrate_embedding_bytea has not
+converted every user yet, run this script again afterwards; users that
+already have a template are skipped.
+
+Usage:
+    cd backend
+    python -m scripts.migrate_add_face_templates
+"""
+
+from sqlalchemy import text
+from app.core.database import engine
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return conn.execute(text(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = :table AND column_name = :column
+        """
+    ), {"table": table, "column": column}).first() is not None
+
+
+def migrate():
+    with engine.connect() as conn:
+        blobs = column_exists(conn, "Users", "embedding_vec")
+        embedding_column = "embedding_vec BYTEA NOT NULL" if blobs else "embedding REAL[] NOT NULL"
+        conn.execute(text(
+            f"""
+            CREATE TABLE IF NOT EXISTS "UserFaceTemplates" (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES "Users"(id) ON DELETE CASCADE,
+                {embedding_column},
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """
+        ))
+        conn.execute(text(
+            """
+            CREATE INDEX IF NOT EXISTS "ix_UserFaceTemplates_user_id"
+            ON "UserFaceTemplates" (user_id)
+            """
+        ))
+        conn.commit()
+        print("Table 'UserFaceTemplates' ensured.")
+
+        if blobs and column_exists(conn, "UserFaceTemplates", "embedding_vec"):
+            seed = """
+                INSERT INTO "UserFaceTemplates" (user_id, embedding_vec)
+                SELECT u.id, u.embedding_vec
+                FROM "Users" u
+                WHERE u.embedding_vec IS NOT NULL
+                  AND NOT EXISTS (
+                      SELECT 1 FROM "UserFaceTemplates" t WHERE t.user_id = u.id
+                  )
+            """
+        elif column_exists(conn, "Users", "embedding") and column_exists(conn, "UserFaceTemplates", "embedding"):
+            seed = """
+                INSERT INTO "UserFaceTemplates" (user_id, embedding)
+                SELECT u.id, u.embedding::real[]
+                FROM "Users" u
+                WHERE u.embedding IS NOT NULL
+                  AND cardinality(u.embedding) > 0
+                  AND NOT EXISTS (
+                      SELECT 1 FROM "UserFaceTemplates" t WHERE t.user_id = u.id
+                  )
+            """
+        else:
+            print("No embedding column to seed from; run scripts.migrate_embedding_bytea first.")
+            return
+
+        result = conn.execute(text(seed))
+        conn.commit()
+        print(f"Seeded {result.rowcount} user(s) with their existing embedding.")
+
+    print("Migration complete.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,126 @@
+"""
+One-time migration: move face embeddings from float8[] / real[] arrays to
+compact bytea blobs (see app/util/embedding_format.py).
+
+- Users: adds embedding_vec (bytea), embedding_model and an indexed
+  has_embedding flag, converts every "embedding" array and tags it with
+  EMBEDDING_MODEL.
+- UserFaceTemplates: adds embedding_vec and converts the real[] templates.
+
+Rows are converted in batches and the script can be re-run: only rows whose
+blob is still missing are converted. The old array columns are kept (and no
+longer read) unless --drop-arrays is given.
+
+Usage:
+    cd backend
+    python -m scripts.migrate_embedding_bytea
+    python -m scripts.migrate_embedding_bytea --dtype float16 --drop-arrays
+"""
+
+import argparse
+
+from sqlalchemy import text
+from app.core.database import engine
+from app.util.embedding_format import EMBEDDING_MODEL, EMBEDDING_STORAGE_DTYPE, encode_embedding
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return conn.execute(text(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = :table AND column_name = :column
+        """
+    ), {"table": table, "column": column}).first() is not None
+
+
+def convert(conn, table: str, dtype: str, batch_size: int, tag: bool) -> int:
+    """Fill embedding_vec from the array column, batch by batch."""
+    if not column_exists(conn, table, "embedding"):
+        return 0
+
+    extra = ", embedding_model = :model, has_embedding = TRUE" if tag else ""
+    update = text(f'UPDATE "{table}" SET embedding_vec = :vec{extra} WHERE id = :id')
+
+    converted = 0
+    while True:
+        rows = conn.execute(text(
+            f"""
+            SELECT id, embedding FROM "{table}"
+            WHERE embedding IS NOT NULL AND cardinality(embedding) > 0
+              AND embedding_vec IS NULL
+            ORDER BY id
+            LIMIT :limit
+            """
+        ), {"limit": batch_size}).all()
+        if not rows:
+            return converted
+
+        params = [{"id": r.id, "vec": encode_embedding(r.embedding, dtype)} for r in rows]
+        if tag:
+            for p in params:
+                p["model"] = EMBEDDING_MODEL
+        conn.execute(update, params)
+        conn.commit()
+        converted += len(rows)
+        print(f"  {table}: {converted} row(s) converted")
+
+
+def migrate(dtype: str, batch_size: int, drop_arrays: bool):
+    with engine.connect() as conn:
+        conn.execute(text(
+            """
+            ALTER TABLE "Users"
+            ADD COLUMN IF NOT EXISTS embedding_vec BYTEA,
+            ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS has_embedding BOOLEAN NOT NULL DEFAULT FALSE
+            """
+        ))
+        conn.execute(text(
+            """
+            CREATE INDEX IF NOT EXISTS "ix_Users_has_embedding"
+            ON "Users" (has_embedding)
+            """
+        ))
+        conn.execute(text(
+            """
+            ALTER TABLE "UserFaceTemplates"
+            ADD COLUMN IF NOT EXISTS embedding_vec BYTEA
+            """
+        ))
+        if column_exists(conn, "UserFaceTemplates", "embedding"):
+            # New templates only write embedding_vec
+            conn.execute(text(
+                'ALTER TABLE "UserFaceTemplates" ALTER COLUMN embedding DROP NOT NULL'
+            ))
+        conn.commit()
+        print("Columns 'embedding_vec', 'embedding_model', 'has_embedding' ensured.")
+
+        users = convert(conn, "Users", dtype, batch_size, tag=True)
+        templates = convert(conn, "UserFaceTemplates", dtype, batch_size, tag=False)
+        print(f"Converted {users} user embedding(s) and {templates} template(s) to {dtype}.")
+
+        remaining = conn.execute(text(
+            'SELECT count(*) FROM "UserFaceTemplates" WHERE embedding_vec IS NULL'
+        )).scalar()
+        if remaining == 0:
+            conn.execute(text(
+                'ALTER TABLE "UserFaceTemplates" ALTER COLUMN embedding_vec SET NOT NULL'
+            ))
+            conn.commit()
+
+        if drop_arrays:
+            conn.execute(text('ALTER TABLE "Users" DROP COLUMN IF EXISTS embedding'))
+            conn.execute(text('ALTER TABLE "UserFaceTemplates" DROP COLUMN IF EXISTS embedding'))
+            conn.commit()
+            print("Dropped the old array columns.")
+
+    print("Migration complete.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default=EMBEDDING_STORAGE_DTYPE)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-arrays", action="store_true", help="drop the old embedding array columns")
+    args = parser.parse_args()
+    migrate(args.dtype, args.batch_size, args.drop_arrays)
@@ -0,0 +1,294 @@
+"""
+Build INT8 versions of the exported ONNX models and write their benchmark /
+accuracy report (used by INFERENCE_ENGINE=onnx-int8).
+
+Steps, per model (embedder, and the occlusion classifier if exported):
+  1. calibrate static QDQ INT8 quantization on sample images
+     (faces cropped with MTCNN exactly like ModelService does),
+  2. compare FP32 vs INT8 on augmented copies of the same images:
+     - embedder : same-person decision (cosine >= --match-threshold) over all pairs
+     - occlusion: occluded decision (clear prob < --occlusion-threshold)
+  3. time both graphs and measure file size / resident memory,
+  4. write <model>.int8.onnx and <model>.int8.json next to the FP32 graph.
+
+The JSON report carries the INT8 file's sha256; InferenceEngine refuses the
+INT8 graph if the hash differs or agreement < QUANTIZED_MIN_AGREEMENT. The
+script exits non-zero when a model fails the gate.
+
+Usage:
+    cd backend
+    python -m scripts.export_onnx          # FP32 graphs first
+    python -m scripts.quantize_models
+    python -m scripts.quantize_models --images test_images test/imgs --min-agreement 0.995
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from app.service.InferenceEngine import (
+    EMBEDDER_ONNX,
+    OCCLUSION_ONNX,
+    ONNX_MODEL_DIR,
+    QUANTIZED_MIN_AGREEMENT,
+    OnnxEngine,
+    file_sha256,
+    quantization_report_path,
+    quantized_file,
+)
+
+BACKEND_DIR = Path(__file__).parent.parent
+DEFAULT_IMAGES = [BACKEND_DIR / "test_images", BACKEND_DIR / "test" / "imgs"]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+# ---------------------------------------------------------------------------
+# Sample data
+# ---------------------------------------------------------------------------
+
+def load_images(dirs: list[Path]) -> list[np.ndarray]:
+    images = []
+    for d in dirs:
+        for path in sorted(Path(d).glob("*")):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                img = cv2.imread(str(path))
+                if img is not None:
+                    images.append(img)
+    return images
+
+
+def augment(img: np.ndarray) -> list[np.ndarray]:
+    """Original plus flip / exposure / blur variants (kiosk lighting varies a lot)."""
+    return [
+        img,
+        cv2.flip(img, 1),
+        cv2.convertScaleAbs(img, alpha=0.7, beta=0),
+        cv2.convertScaleAbs(img, alpha=1.2, beta=15),
+        cv2.GaussianBlur(img, (5, 5), 0),
+    ]
+
+
+def face_crops(images: list[np.ndarray]) -> torch.Tensor:
+    from facenet_pytorch import MTCNN
+
+    mtcnn = MTCNN(image_size=160, margin=20, keep_all=True, device="cpu")
+    crops = [faces for img in images if (faces := mtcnn(img)) is not None]
+    if not crops:
+        return torch.empty(0, 3, 160, 160)
+    return torch.cat(crops)
+
+
+def occlusion_inputs(images: list[np.ndarray]) -> torch.Tensor:
+    from app.service.OcclusionService import _transform
+
+    return torch.stack([
+        _transform(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))) for img in images
+    ])
+
+
+# ---------------------------------------------------------------------------
+# Quantization + measurement
+# ---------------------------------------------------------------------------
+
+class _CalibrationReader:
+    """
+    onnxruntime CalibrationDataReader over a tensor of model inputs. Feeds one
+    sample at a time: the histogram calibrators need equal-shaped batches.
+    """
+
+    def __init__(self, input_name: str, samples: torch.Tensor):
+        self.batches = iter([
+            {input_name: samples[i:i + 1].numpy().astype(np.float32)} for i in range(len(samples))
+        ])
+
+    def get_next(self):
+        return next(self.batches, None)
+
+
+def quantize(fp32_path: Path, int8_path: Path, calibration: torch.Tensor) -> None:
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    input_name = OnnxEngine(fp32_path).input_name
+    quantize_static(
+        str(fp32_path),
+        str(int8_path),
+        _CalibrationReader(input_name, calibration),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+
+
+def _rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import resource
+        return pages * resource.getpagesize() / 2**20
+    except (OSError, ImportError, ValueError):
+        return None
+
+
+def load_measured(path: Path, name: str) -> tuple[OnnxEngine, float | None]:
+    """Create the session and return it with the resident memory it added (MB)."""
+    before = _rss_mb()
+    engine = OnnxEngine(path, name=name)
+    after = _rss_mb()
+    return engine, (None if before is None else round(after - before, 1))
+
+
+def latency_ms(engine: OnnxEngine, batch: torch.Tensor, repeats: int) -> float:
+    engine.run(batch)  # warm-up
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        engine.run(batch)
+        times.append((time.perf_counter() - started) * 1000.0)
+    return round(statistics.median(times), 2)
+
+
+def embedder_agreement(fp32: torch.Tensor, int8: torch.Tensor, threshold: float) -> dict:
+    a = torch.nn.functional.normalize(fp32, dim=1)
+    b = torch.nn.functional.normalize(int8, dim=1)
+    iu = torch.triu_indices(len(a), len(a), offset=1)
+    same_a = (a @ a.T)[iu[0], iu[1]] >= threshold
+    same_b = (b @ b.T)[iu[0], iu[1]] >= threshold
+    cos = (a * b).sum(dim=1)
+    return {
+        "decision": f"cosine >= {threshold} over all pairs",
+        "samples": len(a),
+        "pairs": int(iu.shape[1]),
+        "same_pairs_fp32": int(same_a.sum()),
+        "agreement": float((same_a == same_b).float().mean()) if iu.shape[1] else 0.0,
+        "embedding_cosine_min": round(float(cos.min()), 5),
+        "embedding_cosine_mean": round(float(cos.mean()), 5),
+    }
+
+
+def occlusion_agreement(fp32: torch.Tensor, int8: torch.Tensor, threshold: float) -> dict:
+    clear_a = torch.softmax(fp32, dim=1)[:, 0]
+    clear_b = torch.softmax(int8, dim=1)[:, 0]
+    return {
+        "decision": f"clear prob < {threshold}",
+        "samples": len(clear_a),
+        "occluded_fp32": int((clear_a < threshold).sum()),
+        "agreement": float(((clear_a < threshold) == (clear_b < threshold)).float().mean()),
+        "clear_prob_max_abs_diff": round(float((clear_a - clear_b).abs().max()), 5),
+    }
+
+
+def build_report(
+    onnx_file: str,
+    model_dir: Path,
+    calibration: torch.Tensor,
+    evaluation: torch.Tensor,
+    compare,
+    args,
+) -> dict | None:
+    fp32_path = model_dir / onnx_file
+    int8_path = model_dir / quantized_file(onnx_file)
+    if not fp32_path.exists():
+        print(f"{fp32_path} not found; run `python -m scripts.export_onnx` first. Skipping.")
+        return None
+    if len(calibration) == 0 or len(evaluation) < 2:
+        print(f"Not enough sample inputs for {onnx_file}. Skipping.")
+        return None
+
+    print(f"Quantizing {fp32_path.name} on {len(calibration)} calibration inputs...")
+    quantize(fp32_path, int8_path, calibration)
+
+    fp32, fp32_rss = load_measured(fp32_path, "onnx")
+    int8, int8_rss = load_measured(int8_path, "onnx-int8")
+
+    report = compare(fp32.run(evaluation), int8.run(evaluation))
+    batch = evaluation[:args.batch_size]
+    if len(batch) < args.batch_size:
+        batch = batch.repeat(-(-args.batch_size // len(batch)), 1, 1, 1)[:args.batch_size]
+    fp32_ms = latency_ms(fp32, batch, args.repeats)
+    int8_ms = latency_ms(int8, batch, args.repeats)
+
+    report.update({
+        "model": onnx_file,
+        "int8_file": int8_path.name,
+        "sha256": file_sha256(int8_path),
+        "min_agreement": args.min_agreement,
+        "passed": report["agreement"] >= args.min_agreement,
+        "latency_ms": {
+            "batch_size": len(batch),
+            "fp32": fp32_ms,
+            "int8": int8_ms,
+            "speedup": round(fp32_ms / int8_ms, 2) if int8_ms else None,
+        },
+        "file_mb": {
+            "fp32": round(fp32_path.stat().st_size / 2**20, 2),
+            "int8": round(int8_path.stat().st_size / 2**20, 2),
+        },
+        "session_rss_mb": {"fp32": fp32_rss, "int8": int8_rss},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    quantization_report_path(int8_path).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def print_report(report: dict) -> None:
+    lat, size, rss = report["latency_ms"], report["file_mb"], report["session_rss_mb"]
+    status = "PASS" if report["passed"] else "FAIL (INT8 will be refused)"
+    print(f"\n{report['model']} -> {report['int8_file']}")
+    print(f"  agreement      : {report['agreement']:.4f} ({report['decision']}, min {report['min_agreement']})  {status}")
+    print(f"  latency (b={lat['batch_size']:>2}) : fp32 {lat['fp32']} ms   int8 {lat['int8']} ms   x{lat['speedup']}")
+    print(f"  file size      : fp32 {size['fp32']} MB   int8 {size['int8']} MB")
+    print(f"  session RSS    : fp32 {rss['fp32']} MB   int8 {rss['int8']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--model-dir", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--min-agreement", type=float, default=QUANTIZED_MIN_AGREEMENT)
+    parser.add_argument("--match-threshold", type=float, default=0.5)
+    parser.add_argument("--occlusion-threshold", type=float, default=0.8)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        sys.exit(f"No images found in {', '.join(map(str, args.images))}")
+
+    # Calibrate on originals + flips, evaluate on every augmentation
+    calibration_images = [v for img in images for v in augment(img)[:2]]
+    evaluation_images = [v for img in images for v in augment(img)]
+
+    reports = [
+        build_report(
+            EMBEDDER_ONNX, args.model_dir,
+            face_crops(calibration_images), face_crops(evaluation_images),
+            lambda a, b: embedder_agreement(a, b, args.match_threshold), args,
+        ),
+        build_report(
+            OCCLUSION_ONNX, args.model_dir,
+            occlusion_inputs(calibration_images), occlusion_inputs(evaluation_images),
+            lambda a, b: occlusion_agreement(a, b, args.occlusion_threshold), args,
+        ),
+    ]
+    reports = [r for r in reports if r is not None]
+    for report in reports:
+        print_report(report)
+
+    if any(not r["passed"] for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Tests for recognition admission control: the concurrency limiter
+(app/util/admission.py) and AttendanceService.check_admission.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.util import init_db  # noqa: F401  (registers every mapped model)
+from app.db.models.attendance import Attendance
+from app.db.models.event import Event
+from app.db.models.session import Session as SessionModel
+from app.db.models.user import User
+from app.service.attendantService import AttendanceService
+from app.util.admission import InferenceAdmission
+
+
+async def hold(admission: InferenceAdmission, release: asyncio.Event, order: list, name: str):
+    async with admission.slot():
+        order.append(name)
+        await release.wait()
+
+
+@pytest.mark.unit
+class TestInferenceAdmission:
+    """Tests for the per-worker inference slot limiter."""
+
+    async def test_caps_concurrency_and_serves_waiters_in_order(self):
+        admission = InferenceAdmission(max_concurrent=2, max_queue=4, queue_timeout=5)
+        release = asyncio.Event()
+        order = []
+
+        tasks = [asyncio.create_task(hold(admission, release, order, n)) for n in "abcd"]
+        await asyncio.sleep(0)
+
+        assert order == ["a", "b"]
+        assert admission.stats()["running"] == 2
+        assert admission.stats()["waiting"] == 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+        assert order == ["a", "b", "c", "d"]
+        assert admission.stats()["running"] == 0
+        assert admission.stats()["admitted"] == 4
+
+    async def test_full_queue_is_rejected_with_retry_after(self):
+        admission = InferenceAdmission(max_concurrent=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, release, [], n)) for n in "ab"]
+        await asyncio.sleep(0)
+
+        assert admission.saturated
+        with pytest.raises(HTTPException) as exc:
+            async with admission.slot():
+                pass
+
+        assert exc.value.status_code == 503
+        assert int(exc.value.headers["Retry-After"]) >= 1
+        with pytest.raises(HTTPException):
+            admission.reject_if_saturated()
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert admission.stats()["rejected"] == 2
+
+    async def test_wait_times_out(self):
+        admission = InferenceAdmission(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, release, [], "a"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as exc:
+            async with admission.slot():
+                pass
+
+        assert exc.value.status_code == 503
+        assert admission.stats()["timed_out"] == 1
+        assert admission.stats()["waiting"] == 0
+        release.set()
+        await holder
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        admission = InferenceAdmission(max_concurrent=1, max_queue=4, queue_timeout=5)
+        release = asyncio.Event()
+        order = []
+        holder = asyncio.create_task(hold(admission, release, order, "a"))
+        waiter = asyncio.create_task(hold(admission, release, order, "b"))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        await holder
+
+        assert order == ["a"]
+        assert admission.stats()["running"] == 0
+        assert admission.stats()["waiting"] == 0
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+    engine.dispose()
+
+
+def make_session(db, end_time=None, attendees: int = 1) -> int:
+    creator = User(email="creator@example.com")
+    db.add(creator)
+    db.flush()
+    event = Event(user_id=creator.id, event_name="class")
+    db.add(event)
+    db.flush()
+    sess = SessionModel(event_id=event.id, sequence_number=1, end_time=end_time)
+    db.add(sess)
+    db.flush()
+    for i in range(attendees):
+        user = User(email=f"u{i}@example.com")
+        db.add(user)
+        db.flush()
+        db.add(Attendance(user_id=user.id, session_id=sess.id))
+    db.commit()
+    return sess.id
+
+
+def pacific_now() -> datetime:
+    return datetime.now(ZoneInfo("America/Los_Angeles")).replace(tzinfo=None)
+
+
+@pytest.mark.unit
+class TestCheckAdmission:
+    """Tests for AttendanceService.check_admission."""
+
+    def test_open_session_is_admitted(self, db):
+        session_id = make_session(db, end_time=pacific_now() + timedelta(hours=1))
+
+        AttendanceService(session=db).check_admission(session_id)
+
+    def test_unknown_session(self, db):
+        with pytest.raises(HTTPException) as exc:
+            AttendanceService(session=db).check_admission(99999)
+
+        assert exc.value.status_code == 404
+
+    def test_session_without_attendees(self, db):
+        session_id = make_session(db, attendees=0)
+
+        with pytest.raises(HTTPException) as exc:
+            AttendanceService(session=db).check_admission(session_id)
+
+        assert exc.value.status_code == 404
+
+    def test_ended_session(self, db):
+        session_id = make_session(db, end_time=pacific_now() - timedelta(hours=1))
+
+        with pytest.raises(HTTPException) as exc:
+            AttendanceService(session=db).check_admission(session_id)
+
+        assert exc.value.status_code == 409
@@ -0,0 +1,168 @@
+"""
+Tests for the write-behind check-in journal (app/util/checkin_journal.py)
+and its use by AttendanceService. Runs on in-memory SQLite.
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.util import init_db  # noqa: F401  (registers every mapped model)
+from app.db.models.attendance import Attendance, AttendanceStatus
+from app.db.models.event import Event
+from app.db.models.session import Session as SessionModel
+from app.db.models.user import User
+from app.service import attendantService
+from app.service.attendantService import AttendanceService
+from app.util.checkin_journal import CheckinJournal, read_segment
+from app.util.gallery import normalize_rows
+from app.util.gallery_cache import gallery_cache
+
+
+@pytest.fixture
+def Session():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    gallery_cache.clear()
+    yield sessionmaker(bind=engine, autoflush=False)
+    gallery_cache.clear()
+    engine.dispose()
+
+
+@pytest.fixture
+def roster(Session):
+    """One session with three absent attendees. Returns (session_id, user_ids, embeddings)."""
+    embeddings = normalize_rows(np.random.default_rng(0).standard_normal((3, 512)))
+    with Session() as db:
+        creator = User(email="creator@example.com", first_name="C", last_name="C")
+        db.add(creator)
+        db.flush()
+        event = Event(user_id=creator.id, event_name="class")
+        db.add(event)
+        db.flush()
+        sess = SessionModel(event_id=event.id, sequence_number=1)
+        db.add(sess)
+        db.flush()
+        users = [
+            User(email=f"u{i}@example.com", first_name=f"U{i}", last_name="X", embedding=embeddings[i])
+            for i in range(3)
+        ]
+        db.add_all(users)
+        db.flush()
+        db.add_all(Attendance(user_id=u.id, session_id=sess.id) for u in users)
+        db.commit()
+        return sess.id, [u.id for u in users], embeddings
+
+
+def statuses(Session, session_id: int) -> dict[int, AttendanceStatus]:
+    with Session() as db:
+        return {a.user_id: a.status for a in db.query(Attendance).filter(Attendance.session_id == session_id)}
+
+
+def entry(session_id: int, user_id: int, hour: int = 9) -> dict:
+    return {
+        "session_id": session_id,
+        "user_id": user_id,
+        "status": "present",
+        "check_in_time": datetime(2026, 1, 5, hour, tzinfo=timezone.utc),
+    }
+
+
+@pytest.mark.unit
+class TestCheckinJournal:
+    """Tests for append / flush / replay."""
+
+    def test_flush_applies_appended_check_ins(self, Session, roster, tmp_path):
+        session_id, user_ids, _ = roster
+        journal = CheckinJournal(str(tmp_path), session_factory=Session)
+        journal.start()
+        try:
+            journal.append([entry(session_id, user_ids[0]), entry(session_id, user_ids[1])])
+
+            assert journal.pending(session_id, user_ids[0])["status"] == "present"
+            assert statuses(Session, session_id)[user_ids[0]] == AttendanceStatus.ABSENT
+
+            assert journal.flush() == 2
+        finally:
+            journal.close()
+
+        stored = statuses(Session, session_id)
+        assert stored[user_ids[0]] == AttendanceStatus.PRESENT
+        assert stored[user_ids[1]] == AttendanceStatus.PRESENT
+        assert stored[user_ids[2]] == AttendanceStatus.ABSENT
+        assert journal.pending(session_id, user_ids[0]) is None
+        assert not any(tmp_path.glob("*.ready"))
+
+    def test_replays_segments_left_by_a_crash(self, Session, roster, tmp_path):
+        session_id, user_ids, _ = roster
+        crashed = CheckinJournal(str(tmp_path), session_factory=Session)
+        crashed.append([entry(session_id, user_ids[2])])  # never flushed
+
+        restarted = CheckinJournal(str(tmp_path), session_factory=Session)
+        restarted.start()
+        restarted.close()
+
+        assert statuses(Session, session_id)[user_ids[2]] == AttendanceStatus.PRESENT
+        assert list(tmp_path.iterdir()) == []
+
+    def test_does_not_override_an_earlier_check_in(self, Session, roster, tmp_path):
+        session_id, user_ids, _ = roster
+        journal = CheckinJournal(str(tmp_path), session_factory=Session)
+        journal.start()
+        journal.append([entry(session_id, user_ids[0], hour=9)])
+        journal.flush()
+        late = {**entry(session_id, user_ids[0], hour=11), "status": "late"}
+        journal.append([late])
+        journal.close()
+
+        with Session() as db:
+            att = db.query(Attendance).filter(Attendance.user_id == user_ids[0]).one()
+        assert att.status == AttendanceStatus.PRESENT
+        assert att.check_in_time.hour == 9
+
+    def test_torn_last_line_is_skipped(self, tmp_path):
+        segment = tmp_path / "checkin-1-1.ready"
+        segment.write_bytes(b'{"session_id": 1, "user_id": 2}\n{"session_id": 1, "us')
+
+        assert read_segment(segment) == [{"session_id": 1, "user_id": 2}]
+
+    def test_disabled_without_directory(self):
+        journal = CheckinJournal("")
+
+        assert not journal.enabled
+        assert journal.flush() == 0
+        assert journal.pending(1, 1) is None
+
+
+@pytest.mark.unit
+class TestJournaledCheckIn:
+    """Tests for AttendanceService.check_in_faces with the journal enabled."""
+
+    def test_acknowledged_before_flush_and_applied_after(self, Session, roster, tmp_path, monkeypatch):
+        session_id, user_ids, embeddings = roster
+        journal = CheckinJournal(str(tmp_path), session_factory=Session)
+        monkeypatch.setattr(attendantService, "checkin_journal", journal)
+        journal.start()
+        try:
+            with Session() as db:
+                first = AttendanceService(session=db).check_in_faces(session_id, embeddings[:2].tolist())
+            with Session() as db:
+                again = AttendanceService(session=db).check_in_faces(session_id, embeddings[:1].tolist())
+
+            assert [r["attendance_updated"] for r in first] == [True, True]
+            assert first[0]["status"] in {"present", "late"}
+            assert again[0]["already_checked_in"] is True
+            assert again[0]["check_in_time"] == first[0]["check_in_time"]
+            assert statuses(Session, session_id)[user_ids[0]] == AttendanceStatus.ABSENT
+        finally:
+            journal.close()
+
+        stored = statuses(Session, session_id)
+        assert stored[user_ids[0]] != AttendanceStatus.ABSENT
+        assert stored[user_ids[1]] != AttendanceStatus.ABSENT
+        assert stored[user_ids[2]] == AttendanceStatus.ABSENT
@@ -0,0 +1,119 @@
+"""
+Tests for the upload embedding cache (app/util/embedding_cache.py) and its
+use in upload_img_to_embedding.
+"""
+
+import io
+
+import cv2
+import numpy as np
+import pytest
+import torch
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+import app.util.embeddings as embeddings
+from app.util.embedding_cache import EmbeddingCache
+
+
+def _upload(data: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="frame.jpg", headers=Headers({"content-type": "image/jpeg"}))
+
+
+def _jpeg(value: int) -> bytes:
+    return cv2.imencode(".jpg", np.full((32, 32, 3), value, np.uint8))[1].tobytes()
+
+
+class FakeInference:
+    def __init__(self):
+        self.calls = 0
+
+    async def img_to_embedding(self, img, multiple=False):
+        self.calls += 1
+        return torch.full((1, 512), float(self.calls))
+
+
+@pytest.mark.unit
+class TestEmbeddingCache:
+    """Tests for EmbeddingCache."""
+
+    def test_hit_and_miss_counters(self):
+        cache = EmbeddingCache()
+        key = cache.key(b"frame", "v1", True)
+
+        assert cache.get(key) is None
+        cache.put(key, torch.ones(2, 512))
+
+        assert torch.equal(cache.get(key), torch.ones(2, 512))
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["bytes"] > 2 * 512 * 4
+
+    def test_key_depends_on_bytes_version_and_multiple(self):
+        key = EmbeddingCache.key(b"frame", "v1", True)
+
+        assert key == EmbeddingCache.key(b"frame", "v1", True)
+        assert key != EmbeddingCache.key(b"frame!", "v1", True)
+        assert key != EmbeddingCache.key(b"frame", "v2", True)
+        assert key != EmbeddingCache.key(b"frame", "v1", False)
+
+    def test_returned_tensor_is_a_copy(self):
+        cache = EmbeddingCache()
+        cache.put("k", torch.zeros(1, 512))
+
+        cache.get("k").add_(1.0)
+
+        assert torch.equal(cache.get("k"), torch.zeros(1, 512))
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_entries=2)
+        cache.put("a", torch.zeros(1, 512))
+        cache.put("b", torch.zeros(1, 512))
+        cache.get("a")
+        cache.put("c", torch.zeros(1, 512))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_byte_budget_eviction(self):
+        cache = EmbeddingCache(max_bytes=3 * 512 * 4)
+        cache.put("a", torch.zeros(2, 512))
+        cache.put("b", torch.zeros(2, 512))
+
+        assert cache.get("a") is None
+        assert cache.get("b") is not None
+
+    def test_ttl_expiry(self):
+        cache = EmbeddingCache(ttl_seconds=0.0)
+        cache.put("a", torch.zeros(1, 512))
+
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+
+@pytest.mark.unit
+class TestUploadEmbeddingCache:
+    """Tests for upload_img_to_embedding answering resubmissions from the cache."""
+
+    @pytest.fixture
+    def fake(self, monkeypatch):
+        fake = FakeInference()
+        monkeypatch.setattr(embeddings, "inference", fake)
+        monkeypatch.setattr(embeddings, "embedding_cache", EmbeddingCache())
+        return fake
+
+    async def test_identical_upload_skips_the_model(self, fake):
+        first = await embeddings.upload_img_to_embedding(_upload(_jpeg(10)))
+        second = await embeddings.upload_img_to_embedding(_upload(_jpeg(10)))
+
+        assert fake.calls == 1
+        assert torch.equal(first, second)
+
+    async def test_different_upload_or_flag_runs_the_model(self, fake):
+        await embeddings.upload_img_to_embedding(_upload(_jpeg(10)))
+        await embeddings.upload_img_to_embedding(_upload(_jpeg(200)))
+        await embeddings.upload_img_to_embedding(_upload(_jpeg(10)), multiple=False)
+
+        assert fake.calls == 3
@@ -0,0 +1,81 @@
+"""
+Tests for the binary embedding storage format (app/util/embedding_format.py)
+and the embedding property of the User / UserFaceTemplate models.
+"""
+
+import numpy as np
+import pytest
+
+from app.util import init_db  # noqa: F401  (registers every mapped model)
+from app.db.models.user import User
+from app.db.models.user_face_template import UserFaceTemplate
+from app.util.embedding_format import EMBEDDING_MODEL, decode_embedding, encode_embedding
+
+
+@pytest.mark.unit
+class TestEmbeddingFormat:
+    """Tests for encode_embedding / decode_embedding."""
+
+    def test_float32_round_trip_is_zero_copy(self):
+        vec = np.random.default_rng(0).standard_normal(512).astype(np.float32)
+
+        blob = encode_embedding(vec)
+        out = decode_embedding(blob)
+
+        assert len(blob) == 512 * 4
+        assert np.array_equal(out, vec)
+        assert out.dtype == np.float32
+        assert not out.flags.owndata and not out.flags.writeable
+
+    def test_float16_round_trip(self):
+        vec = np.linspace(-1, 1, 512)
+
+        blob = encode_embedding(vec, "float16")
+        out = decode_embedding(blob)
+
+        assert len(blob) == 512 * 2
+        assert out.dtype == np.float32
+        assert np.allclose(out, vec, atol=1e-3)
+
+    def test_empty_is_none(self):
+        assert encode_embedding(None) is None
+        assert encode_embedding([]) is None
+        assert decode_embedding(None) is None
+        assert decode_embedding(b"") is None
+
+    def test_unexpected_length_names_the_row(self):
+        blob = encode_embedding(np.ones(128))
+
+        with pytest.raises(ValueError, match="user 7"):
+            decode_embedding(blob, row="user 7")
+        with pytest.raises(ValueError, match="Users id=3"):
+            User(id=3, email="a@example.com", embedding_vec=b"\x00" * 1000).embedding
+
+
+@pytest.mark.unit
+class TestEmbeddingColumns:
+    """Tests for the list-valued embedding property over the bytea column."""
+
+    def test_user_embedding_sets_flag_and_model(self):
+        user = User(email="a@example.com", embedding=[0.25] * 512)
+
+        assert user.embedding == [0.25] * 512
+        assert all(isinstance(x, float) for x in user.embedding)
+        assert user.has_embedding is True
+        assert user.embedding_model == EMBEDDING_MODEL
+
+    def test_clearing_user_embedding_clears_flag(self):
+        user = User(email="a@example.com", embedding=[0.25] * 512)
+
+        user.embedding = None
+
+        assert user.embedding is None
+        assert user.embedding_vec is None
+        assert user.has_embedding is False
+        assert user.embedding_model is None
+
+    def test_template_embedding(self):
+        template = UserFaceTemplate(user_id=1, embedding=np.ones(512))
+
+        assert len(template.embedding_vec) == 512 * 4
+        assert template.embedding == [1.0] * 512
@@ -0,0 +1,98 @@
+"""
+Tests for the pluggable face detection stage (app/service/FaceDetector.py).
+"""
+
+import numpy as np
+import pytest
+import torch
+from fastapi import HTTPException
+
+from app.service.FaceDetector import MtcnnDetector, load_detector
+from app.service.ModelService import ModelService
+
+
+class FakeMtcnn:
+    def __init__(self, boxes=None, probs=None):
+        self.boxes = boxes
+        self.probs = probs
+        self.calls = []
+
+    def detect(self, img):
+        self.calls.append(len(img) if isinstance(img, list) else 1)
+        if isinstance(img, list):
+            return [self.boxes] * len(img), [self.probs] * len(img)
+        return self.boxes, self.probs
+
+    def extract(self, img, boxes, save_path):
+        return torch.zeros(len(boxes), 3, 160, 160)
+
+
+class FakeDetector:
+    def __init__(self, counts):
+        self.counts = counts
+
+    def detect_batch(self, imgs):
+        return [np.tile([[0, 0, 10, 10, 1.0]], (n, 1)).astype(np.float32) for n in self.counts]
+
+
+@pytest.mark.unit
+class TestFaceDetector:
+    """Tests for the detector wrappers and load_detector."""
+
+    def test_mtcnn_no_face_is_empty_array(self):
+        dets = MtcnnDetector(FakeMtcnn()).detect(np.zeros((10, 10, 3), np.uint8))
+
+        assert dets.shape == (0, 5)
+
+    def test_mtcnn_boxes_and_scores(self):
+        boxes = np.array([[1, 2, 30, 40], [5, 5, 20, 20]], dtype=object)
+        mtcnn = FakeMtcnn(boxes, np.array([0.99, 0.8]))
+
+        dets = MtcnnDetector(mtcnn).detect(np.zeros((50, 50, 3), np.uint8))
+
+        assert dets.dtype == np.float32
+        assert dets.shape == (2, 5)
+        assert dets[0].tolist() == pytest.approx([1, 2, 30, 40, 0.99])
+
+    def test_default_is_mtcnn(self):
+        assert isinstance(load_detector(FakeMtcnn(), "mtcnn"), MtcnnDetector)
+
+    def test_unknown_name_falls_back_to_mtcnn(self):
+        assert isinstance(load_detector(FakeMtcnn(), "retinaface"), MtcnnDetector)
+
+    @pytest.mark.parametrize("name", ["yunet", "centerface"])
+    def test_missing_model_file_falls_back_to_mtcnn(self, name, tmp_path):
+        detector = load_detector(FakeMtcnn(), name, str(tmp_path / "missing.onnx"))
+
+        assert isinstance(detector, MtcnnDetector)
+
+    def test_corrupt_model_file_falls_back_to_mtcnn(self, tmp_path):
+        path = tmp_path / "centerface.onnx"
+        path.write_bytes(b"not a model")
+
+        assert isinstance(load_detector(FakeMtcnn(), "centerface", str(path)), MtcnnDetector)
+
+    def test_mtcnn_batch_groups_equal_sized_frames(self):
+        mtcnn = FakeMtcnn(np.array([[1, 2, 30, 40]]), np.array([0.9]))
+        frames = [np.zeros((50, 50, 3), np.uint8)] * 3 + [np.zeros((60, 40, 3), np.uint8)]
+
+        dets = MtcnnDetector(mtcnn).detect_batch(frames)
+
+        assert sorted(mtcnn.calls) == [1, 3]
+        assert [d.shape for d in dets] == [(1, 5)] * 4
+
+
+@pytest.mark.unit
+class TestDetectMany:
+    """Tests for ModelService.detect_many."""
+
+    def test_bad_frames_become_errors_without_failing_the_others(self):
+        model = ModelService.__new__(ModelService)
+        model.mtcnn = FakeMtcnn()
+        model.detector = FakeDetector([1, 0, 2])
+
+        results = model.detect_many([np.zeros((20, 20, 3), np.uint8)] * 3)
+
+        assert results[0].shape == (1, 3, 160, 160)
+        assert isinstance(results[1], HTTPException) and results[1].detail == "No face detected"
+        assert isinstance(results[2], HTTPException) and results[2].status_code == 400
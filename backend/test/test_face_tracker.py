@@ -0,0 +1,261 @@
+"""
+Tests for cross-frame face tracking (app/util/face_tracker.py) and the
+tracked check-in path (app/util/checkin.recognize_frame).
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+import torch
+from fastapi import HTTPException
+
+import app.util.checkin as checkin
+from app.util.face_tracker import FaceTracker, FaceTrackerRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+OUTCOME = {
+    "user_id": 7,
+    "first_name": "Ada",
+    "last_name": "Lovelace",
+    "similarity": 0.91,
+    "already_checked_in": False,
+    "attendance_updated": True,
+    "status": "present",
+    "check_in_time": "2026-01-01T09:00:00Z",
+    "attendance_id": 3,
+}
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+def identify(track, outcome=OUTCOME, now=None):
+    """Record enough agreeing matches for the track to reuse its identity."""
+    for _ in range(2):
+        track.record(outcome, now=now)
+
+
+@pytest.mark.unit
+class TestFaceTracker:
+    """Tests for FaceTracker association, identity reuse and expiry."""
+
+    def test_overlapping_box_keeps_its_track(self):
+        tracker = FaceTracker(clock=FakeClock())
+
+        [first] = tracker.update(boxes([10, 10, 110, 110]))
+        [second] = tracker.update(boxes([14, 12, 114, 112]))
+
+        assert second is first
+        assert second.hits == 2
+        assert len(tracker) == 1
+
+    def test_two_faces_keep_their_own_tracks(self):
+        tracker = FaceTracker(clock=FakeClock())
+        left, right = tracker.update(boxes([0, 0, 100, 100], [300, 0, 400, 100]))
+
+        # Same faces, reported in the opposite order
+        a, b = tracker.update(boxes([305, 2, 405, 102], [3, 1, 103, 101]))
+
+        assert a is right and b is left
+
+    def test_fast_move_matches_by_centroid(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [first] = tracker.update(boxes([0, 0, 100, 100]))
+
+        # No overlap, but the centre moved less than half a face width
+        [moved] = tracker.update(boxes([40, 0, 140, 100]))
+        [other] = tracker.update(boxes([400, 0, 500, 100]))
+
+        assert moved is first
+        assert other is not first
+
+    def test_track_expires_after_timeout(self):
+        clock = FakeClock()
+        tracker = FaceTracker(timeout_seconds=2.0, clock=clock)
+        [first] = tracker.update(boxes([0, 0, 100, 100]))
+
+        clock.now += 2.5
+        [later] = tracker.update(boxes([0, 0, 100, 100]))
+
+        assert later is not first
+        assert len(tracker) == 1
+
+    def test_identified_track_skips_embedding(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [track] = tracker.update(boxes([0, 0, 100, 100]))
+        assert track.needs_embedding()
+
+        track.record(OUTCOME)
+        assert track.needs_embedding()
+        assert track.identity is None
+
+        track.record(OUTCOME)
+
+        assert not track.needs_embedding()
+        assert track.identity["user_id"] == 7
+        assert track.identity["already_checked_in"] is True
+        assert track.identity["attendance_updated"] is False
+        assert "attendance_id" not in track.identity
+
+    def test_rejected_track_retries_after_interval(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [track] = tracker.update(boxes([0, 0, 100, 100]))
+
+        track.record(HTTPException(status_code=422, detail="not recognized"), now=10.0)
+
+        assert not track.needs_embedding(now=10.5, retry_seconds=1.0)
+        assert track.needs_embedding(now=11.0, retry_seconds=1.0)
+
+    def test_identified_track_is_rechecked(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [track] = tracker.update(boxes([0, 0, 100, 100]))
+        identify(track, now=10.0)
+
+        assert not track.needs_embedding(now=10.5, recheck_seconds=1.0)
+        assert track.needs_embedding(now=11.0, recheck_seconds=1.0)
+
+    def test_next_person_in_the_same_box_is_identified_again(self):
+        clock = FakeClock()
+        tracker = FaceTracker(clock=clock)
+        [a] = tracker.update(boxes([0, 0, 100, 100]))
+        identify(a, now=10.0)
+
+        # A leaves, B steps into the same box before the track expires
+        clock.now += 1.0
+        [b] = tracker.update(boxes([2, 0, 102, 100]))
+        assert b is a
+        assert b.needs_embedding(now=11.0, recheck_seconds=1.0)
+
+        b.record({**OUTCOME, "user_id": 8}, now=11.0)
+        assert b.identity is None
+        assert b.needs_embedding(now=11.2)
+        b.record({**OUTCOME, "user_id": 8}, now=11.2)
+        assert b.identity["user_id"] == 8
+
+    def test_unrecognized_face_drops_the_identity(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [track] = tracker.update(boxes([0, 0, 100, 100]))
+        identify(track, now=10.0)
+
+        track.record(HTTPException(status_code=422, detail="not recognized"), now=11.0)
+
+        assert track.identity is None
+        assert track.last_error is not None
+
+    def test_centroid_takeover_forgets_identity(self):
+        tracker = FaceTracker(clock=FakeClock())
+        [track] = tracker.update(boxes([0, 0, 100, 100]))
+        identify(track)
+
+        # Too little overlap with the last box for IoU: may be somebody else
+        [moved] = tracker.update(boxes([45, 0, 145, 100]))
+
+        assert moved is track
+        assert moved.identity is None
+        assert moved.needs_embedding()
+
+    def test_registry_keys_by_session_and_kiosk(self):
+        clock = FakeClock()
+        registry = FaceTrackerRegistry(timeout_seconds=2.0, clock=clock)
+
+        assert registry.get(1, "a") is registry.get(1, "a")
+        assert registry.get(1, "a") is not registry.get(1, "b")
+        assert registry.get(1, "a") is not registry.get(2, "a")
+
+        clock.now += 3.0
+        registry.get(1, "a")
+        assert len(registry) == 1
+
+
+class FakeInference:
+    def __init__(self, dets):
+        self.dets = dets
+        self.embedded = []
+
+    async def detect_with_boxes(self, img, multiple=False):
+        return self.dets, torch.zeros(len(self.dets), 3, 160, 160)
+
+    async def embed(self, faces):
+        self.embedded.append(len(faces))
+        return torch.zeros(len(faces), 512)
+
+
+@pytest.mark.unit
+class TestRecognizeFrame:
+    """Tests for recognize_frame skipping identified tracks."""
+
+    def run(self, monkeypatch, dets, tracker, outcomes):
+        fake = FakeInference(dets)
+        calls = []
+
+        async def fake_record(session, session_id, embs, tracks=None):
+            calls.append(len(embs))
+            for track, outcome in zip(tracks, outcomes):
+                track.record(outcome)
+            results = {
+                i: {"success": True, "data": o} if isinstance(o, dict) else {"success": False, "error": str(o)}
+                for i, o in enumerate(outcomes)
+            }
+            checked_in = sum(isinstance(o, dict) for o in outcomes)
+            return {
+                "stats": {"num_face": len(embs), "checked_in": checked_in, "already_checked_in": 0,
+                          "matched": checked_in},
+                "result": results,
+            }, None
+
+        monkeypatch.setattr(checkin, "inference", fake)
+        monkeypatch.setattr(checkin, "record_checkins", fake_record)
+        response, error = asyncio.run(
+            checkin.recognize_frame(None, 1, np.zeros((200, 600, 3), np.uint8), tracker)
+        )
+        return response, error, fake.embedded
+
+    def test_only_unidentified_faces_are_embedded(self, monkeypatch):
+        tracker = FaceTracker(clock=FakeClock())
+        known, _ = tracker.update(boxes([0, 0, 100, 100], [300, 0, 400, 100]))
+        identify(known)
+
+        response, error, embedded = self.run(
+            monkeypatch, boxes([2, 0, 102, 100], [302, 0, 402, 100]), tracker, [{**OUTCOME, "user_id": 8}]
+        )
+
+        assert embedded == [1]
+        assert error is None
+        assert response["stats"] == {
+            "num_face": 2, "checked_in": 1, "already_checked_in": 1, "matched": 2, "tracked": 1,
+        }
+        assert response["result"][0]["tracked"] is True
+        assert response["result"][0]["data"]["user_id"] == 7
+        assert response["result"][1]["data"]["user_id"] == 8
+
+    def test_all_faces_tracked_skips_embedder(self, monkeypatch):
+        tracker = FaceTracker(clock=FakeClock())
+        [known] = tracker.update(boxes([0, 0, 100, 100]))
+        identify(known)
+
+        response, error, embedded = self.run(monkeypatch, boxes([1, 1, 101, 101]), tracker, [])
+
+        assert embedded == []
+        assert response["stats"]["already_checked_in"] == 1
+
+    def test_rejected_face_reuses_its_error_until_retry(self, monkeypatch):
+        tracker = FaceTracker(clock=FakeClock())
+        [stranger] = tracker.update(boxes([0, 0, 100, 100]))
+        rejected = HTTPException(status_code=422, detail="not recognized")
+        stranger.record(rejected)
+
+        response, error, embedded = self.run(monkeypatch, boxes([0, 0, 100, 100]), tracker, [])
+
+        assert embedded == []
+        assert error is rejected
+        assert response["stats"]["matched"] == 0
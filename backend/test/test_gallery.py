@@ -0,0 +1,431 @@
+"""
+Tests for the vectorized check-in gallery (app/util/gallery.py) and its
+process-wide cache (app/util/gallery_cache.py).
+"""
+
+import numpy as np
+import pytest
+
+from app.util.gallery import build_gallery, normalize_rows, templates_to_keep
+from app.util.gallery_cache import GalleryCache
+
+
+def _unit(dim: int, hot: int) -> list[float]:
+    vec = [0.0] * dim
+    vec[hot] = 1.0
+    return vec
+
+
+@pytest.mark.unit
+class TestEmbeddingGallery:
+    """Tests for build_gallery / EmbeddingGallery.best_matches."""
+
+    def test_best_match_per_query(self):
+        gallery = build_gallery([
+            (1, _unit(512, 0), "Ada", "Lovelace"),
+            (2, _unit(512, 1), "Alan", "Turing"),
+            (3, _unit(512, 2), "Grace", "Hopper"),
+        ])
+
+        matches = gallery.best_matches([_unit(512, 2), _unit(512, 0)])
+
+        assert [m.user_id for m in matches] == [3, 1]
+        assert matches[0].first_name == "Grace"
+        assert matches[0].similarity == pytest.approx(1.0)
+
+    def test_rows_are_normalized(self):
+        gallery = build_gallery([(1, [3.0] * 512, None, None)])
+
+        assert np.linalg.norm(gallery.matrix[0]) == pytest.approx(1.0)
+        assert gallery.best_matches([[0.5] * 512])[0].similarity == pytest.approx(1.0)
+
+    def test_users_without_embedding_are_skipped(self):
+        gallery = build_gallery([
+            (1, None, "No", "Face"),
+            (2, [], "Empty", "Face"),
+            (3, _unit(512, 5), "Has", "Face"),
+        ])
+
+        assert len(gallery) == 1
+        assert gallery.best_matches([_unit(512, 5)])[0].user_id == 3
+
+    def test_invalid_rows_score_minus_one(self):
+        gallery = build_gallery([
+            (1, [0.0] * 512, None, None),
+            (2, [1.0] * 128, None, None),
+        ])
+
+        scores = gallery.score([_unit(512, 0)])
+
+        assert scores.tolist() == [[-1.0, -1.0]]
+
+    def test_query_dimension_mismatch(self):
+        gallery = build_gallery([(1, _unit(512, 0), None, None)])
+
+        assert gallery.best_matches([[1.0] * 128])[0].similarity == -1.0
+
+    def test_ties_pick_first_row(self):
+        gallery = build_gallery([
+            (7, _unit(512, 0), None, None),
+            (8, _unit(512, 0), None, None),
+        ])
+
+        assert gallery.best_matches([_unit(512, 0)])[0].user_id == 7
+
+    def test_assign_resolves_each_user_once(self):
+        alice = _unit(512, 0)
+        bob = [0.8, 0.6] + [0.0] * 510
+        gallery = build_gallery([(1, alice, None, None), (2, bob, None, None)])
+
+        # Both faces prefer user 1 on their own; face 0 is a near-perfect match
+        face_a = [1.0, 0.05] + [0.0] * 510
+        face_b = [0.9, 0.44] + [0.0] * 510
+        assigned = gallery.assign([face_a, face_b], threshold=0.5)
+
+        assert [m.user_id for m in assigned] == [1, 2]
+
+    def test_assign_leaves_extra_faces_unmatched(self):
+        gallery = build_gallery([(1, _unit(512, 0), None, None)])
+
+        assigned = gallery.assign([_unit(512, 0), _unit(512, 0), _unit(512, 3)], threshold=0.5)
+
+        assert sum(m is not None for m in assigned) == 1
+        assert assigned[2] is None
+
+    def test_assign_prefers_more_pairs_above_threshold(self):
+        gallery = build_gallery([
+            (1, _unit(512, 0), None, None),
+            (2, _unit(512, 1), None, None),
+        ])
+
+        face_a = [0.9, 0.436] + [0.0] * 510   # matches both users
+        face_b = _unit(512, 0)                # matches only user 1
+        assigned = gallery.assign([face_a, face_b], threshold=0.4)
+
+        assert [m.user_id for m in assigned] == [2, 1]
+
+    def test_best_template_per_user(self):
+        # User 1 enrolled with and without glasses; user 2 once
+        rows = [
+            (1, _unit(512, 0), "A", "One"),
+            (2, _unit(512, 1), "B", "Two"),
+            (1, _unit(512, 2), "A", "One"),
+        ]
+        gallery = build_gallery(rows)
+
+        assert gallery.user_ids.tolist() == [1, 1, 2]
+        assert gallery.num_users == 2
+        assert gallery.score_users([_unit(512, 2)]).tolist() == [[1.0, 0.0]]
+        match = gallery.best_matches([_unit(512, 2)])[0]
+        assert (match.user_id, match.first_name, match.similarity) == (1, "A", 1.0)
+
+    def test_assign_counts_each_user_once_across_templates(self):
+        gallery = build_gallery([
+            (1, _unit(512, 0), None, None),
+            (1, _unit(512, 1), None, None),
+            (2, [0.6, 0.8] + [0.0] * 510, None, None),
+        ])
+
+        # Each face is closest to a different template of user 1
+        assigned = gallery.assign([_unit(512, 0), _unit(512, 1)], threshold=0.5)
+
+        assert sorted(m.user_id for m in assigned) == [1, 2]
+
+    def test_templates_to_keep_drops_most_redundant(self):
+        near_a = [0.99, 0.141] + [0.0] * 510
+        templates = [_unit(512, 0), _unit(512, 1), near_a, _unit(512, 2)]
+
+        assert templates_to_keep(templates, 3) == [1, 2, 3]
+        assert templates_to_keep(templates, 4) == [0, 1, 2, 3]
+        assert templates_to_keep(templates, 1) == [3]
+
+    def test_normalize_rows_keeps_zero_rows(self):
+        out = normalize_rows([[0.0, 0.0], [3.0, 4.0]])
+
+        assert out.dtype == np.float32
+        assert out.tolist() == [[0.0, 0.0], [pytest.approx(0.6), pytest.approx(0.8)]]
+
+    def test_normalize_rows_leaves_input_untouched(self):
+        vectors = np.array([[3.0, 4.0]], dtype=np.float32)
+        frozen = np.frombuffer(np.array([0.0, 2.0], dtype=np.float32).tobytes(), dtype=np.float32)
+
+        out = normalize_rows(vectors)
+
+        assert vectors.tolist() == [[3.0, 4.0]]
+        assert out is not vectors
+        assert normalize_rows(frozen).tolist() == [[0.0, 1.0]]
+
+
+@pytest.mark.unit
+class TestGalleryCache:
+    """Tests for the process-wide GalleryCache."""
+
+    def _gallery(self, *user_ids):
+        return build_gallery([(uid, _unit(512, uid), None, None) for uid in user_ids])
+
+    def test_hit_and_miss_counters(self):
+        cache = GalleryCache(max_entries=4)
+
+        assert cache.get(1) is None
+        cache.put(1, event_id=10, gallery=self._gallery(1, 2), roster=[1, 2])
+
+        assert cache.get(1) is not None
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_lru_eviction(self):
+        cache = GalleryCache(max_entries=2)
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1])
+        cache.put(2, event_id=10, gallery=self._gallery(2), roster=[2])
+        cache.get(1)
+        cache.put(3, event_id=10, gallery=self._gallery(3), roster=[3])
+
+        assert cache.get(2) is None
+        assert cache.get(1) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_byte_budget_eviction(self):
+        gallery = self._gallery(1, 2, 3)
+        cache = GalleryCache(max_bytes=gallery.matrix.nbytes + 100)
+        cache.put(1, event_id=10, gallery=gallery, roster=[1, 2, 3])
+        cache.put(2, event_id=10, gallery=self._gallery(4, 5, 6), roster=[4, 5, 6])
+
+        assert cache.get(1) is None
+        assert cache.get(2) is not None
+
+    def test_ttl_expiry(self):
+        cache = GalleryCache(ttl_seconds=0.0)
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1])
+
+        assert cache.get(1) is None
+
+    def test_invalidate_event_and_user(self):
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1])
+        cache.put(2, event_id=20, gallery=self._gallery(2), roster=[2, 3])
+
+        cache.invalidate_event(10)
+        cache.invalidate_user(3)
+
+        assert cache.get(1) is None
+        assert cache.get(2) is None
+
+    def test_patch_user_replaces_row(self):
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1, 2), roster=[1, 2])
+
+        cache.patch_user(2, _unit(512, 9))
+
+        gallery = cache.get(1)
+        assert gallery.best_matches([_unit(512, 9)])[0].user_id == 2
+        assert cache.stats()["patches"] == 1
+
+    def test_patch_user_replaces_all_templates(self):
+        cache = GalleryCache()
+        gallery = build_gallery([
+            (1, _unit(512, 0), None, None),
+            (2, _unit(512, 1), None, None),
+            (2, _unit(512, 2), None, None),
+        ])
+        cache.put(1, event_id=10, gallery=gallery, roster=[1, 2])
+
+        cache.patch_user(2, [_unit(512, 8), _unit(512, 9)])
+
+        assert cache.get(1).best_matches([_unit(512, 8)])[0].user_id == 2
+
+        cache.patch_user(2, [_unit(512, 9)])
+        gallery = cache.get(1)
+        assert gallery.user_ids.tolist() == [1, 2]
+        assert gallery.best_matches([_unit(512, 9)])[0].user_id == 2
+
+    def test_patch_user_without_row_invalidates(self):
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1, 2])
+
+        cache.patch_user(2, _unit(512, 9))
+
+        assert cache.get(1) is None
+
+    def test_patch_user_first_enrollment_with_name(self):
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1, 2])
+
+        cache.patch_user(2, _unit(512, 9), name=("Ada", "Lovelace"))
+
+        match = cache.get(1).best_matches([_unit(512, 9)])[0]
+        assert (match.user_id, match.first_name) == (2, "Ada")
+
+    def test_add_users_and_remove_user(self):
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1, 2), roster=[1, 2])
+
+        cache.add_users(1, [(3, _unit(512, 3), "C", None), (4, None, "D", None), (1, _unit(512, 9), None, None)])
+        cache.remove_user(2)
+
+        gallery = cache.get(1)
+        assert gallery.user_ids.tolist() == [1, 3]
+        assert gallery.best_matches([_unit(512, 3)])[0].user_id == 3
+        # User 4 has no embedding yet but is on the roster, so enrolling patches the gallery
+        cache.patch_user(4, _unit(512, 4), name=("D", None))
+        assert cache.get(1).best_matches([_unit(512, 4)])[0].user_id == 4
+        assert cache.stats()["invalidations"] == 0
+
+    def test_patch_that_grows_past_ann_threshold_builds_index(self, monkeypatch):
+        import app.util.gallery_cache as gallery_cache_module
+
+        monkeypatch.setattr(gallery_cache_module, "ANN_MIN_GALLERY_SIZE", 3)
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1, 2), roster=[1, 2])
+
+        cache.add_users(1, [(3, _unit(512, 3), None, None)])
+
+        gallery = cache.get(1)
+        assert gallery.index is not None
+        assert len(gallery.index) == 3
+
+    def test_patch_racing_another_write_drops_the_entry(self, monkeypatch):
+        import app.util.gallery_cache as gallery_cache_module
+
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=self._gallery(1, 2), roster=[1, 2])
+        splice = gallery_cache_module._splice
+
+        def splice_during_write(*args):
+            # Another patch lands while this one is built outside the lock
+            cache.invalidate_user(99)
+            return splice(*args)
+
+        monkeypatch.setattr(gallery_cache_module, "_splice", splice_during_write)
+        cache.patch_user(2, _unit(512, 9))
+
+        assert cache.get(1) is None
+
+    def test_patches_update_the_index_copy_on_write(self):
+        data = normalize_rows(np.random.default_rng(2).standard_normal((600, 512)))
+        gallery = build_gallery([(uid, data[uid], None, None) for uid in range(500)], ann_min_size=100)
+        cache = GalleryCache()
+        cache.put(1, event_id=10, gallery=gallery, roster=range(500))
+
+        cache.remove_user(7)
+        cache.add_users(1, [(uid, data[uid], None, None) for uid in range(500, 600)])
+        cache.patch_user(42, data[599] * -1.0)
+
+        patched = cache.get(1)
+        assert patched.index is not gallery.index
+        assert len(patched.index) == 599
+        assert patched.best_matches(data[[550, 8]], threshold=0.8)[0].user_id == 550
+        assert [m.user_id for m in patched.assign(data[[550, 8]], threshold=0.8)] == [550, 8]
+        row = patched.index.search(data[[550]], patched.matrix)[0][0, 0]
+        assert patched.user_ids[row] == 550
+        # The gallery readers already hold is unchanged
+        assert len(gallery.index) == 500
+        assert gallery.best_matches(data[[7]])[0].user_id == 7
+
+    def test_put_after_concurrent_write_is_dropped(self):
+        cache = GalleryCache()
+        generation = cache.generation()
+        cache.invalidate_user(1)
+
+        cache.put(1, event_id=10, gallery=self._gallery(1), roster=[1], generation=generation)
+
+        assert cache.get(1) is None
+
+
+@pytest.mark.unit
+class TestIVFIndex:
+    """Tests for the approximate nearest-neighbour index (app/util/ann_index.py)."""
+
+    def _data(self, n=3000, dim=128, seed=0):
+        rng = np.random.default_rng(seed)
+        basis = rng.standard_normal((16, dim)).astype(np.float32)
+        data = rng.standard_normal((n, 16)).astype(np.float32) @ basis
+        data += 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+        return normalize_rows(data), rng
+
+    def test_recall_against_exact_search(self):
+        from app.util.ann_index import IVFIndex
+
+        data, rng = self._data()
+        index = IVFIndex.build(data, np.arange(len(data)), projection_dim=32, nprobe=8)
+        picks = rng.integers(0, len(data), 100)
+        queries = normalize_rows(data[picks] + 0.02 * rng.standard_normal(data[picks].shape))
+
+        rows, scores = index.search(queries, data, k=1)
+
+        exact = np.argmax(queries @ data.T, axis=1)
+        assert (rows[:, 0] == exact).mean() >= 0.95
+        assert np.allclose(scores[:, 0], np.sum(queries * data[rows[:, 0]], axis=1), atol=1e-5)
+
+    def test_add_and_remove(self):
+        from app.util.ann_index import IVFIndex
+
+        data, _ = self._data(n=500)
+        index = IVFIndex.build(data, np.arange(400), projection_dim=32, nprobe=64)
+
+        index.add(450, data[450])
+        assert index.search(data[450:451], data)[0][0, 0] == 450
+
+        index.remove(450)
+        assert index.search(data[450:451], data)[0][0, 0] != 450
+        assert len(index) == 400
+
+    def test_gallery_uses_index_above_threshold(self):
+        data, _ = self._data(n=600, dim=512)
+        rows = [(uid, data[uid], None, None) for uid in range(len(data))]
+
+        gallery = build_gallery(rows, ann_min_size=500)
+
+        assert gallery.index is not None
+        assert gallery.best_matches(data[[7, 42]])[0].user_id == 7
+        assert build_gallery(rows, ann_min_size=10_000).index is None
+
+    def test_recall_at_threshold_similarity(self):
+        # Unstructured gallery and faces only just above the 0.5 threshold: the
+        # index alone misses some of these, the exact fallback must not
+        rng = np.random.default_rng(1)
+        data = normalize_rows(rng.standard_normal((6000, 512)))
+        gallery = build_gallery([(uid, data[uid], None, None) for uid in range(len(data))], ann_min_size=500)
+        picks = rng.choice(len(data), 40, replace=False)
+        noise = normalize_rows(rng.standard_normal((len(picks), 512)))
+        noise = normalize_rows(noise - np.sum(noise * data[picks], axis=1, keepdims=True) * data[picks])
+        queries = 0.55 * data[picks] + np.sqrt(1 - 0.55 ** 2) * noise
+
+        matches = gallery.best_matches(queries, threshold=0.5)
+        assigned = gallery.assign(queries, threshold=0.5)
+
+        assert gallery.index is not None
+        assert [m.user_id for m in matches] == picks.tolist()
+        assert [m.user_id for m in assigned] == picks.tolist()
+
+    def test_wrong_ann_hit_above_threshold_is_rescored(self, monkeypatch):
+        rng = np.random.default_rng(3)
+        data = normalize_rows(rng.standard_normal((600, 512)))
+        gallery = build_gallery([(uid, data[uid], None, None) for uid in range(len(data))], ann_min_size=500)
+        # The query is user 5; user 9 scores 0.56, just above the threshold
+        other = normalize_rows(data[9] - (data[9] @ data[5]) * data[5])[0]
+        data[9] = normalize_rows(0.56 * data[5] + np.sqrt(1 - 0.56 ** 2) * other)[0]
+        gallery.matrix[9] = data[9]
+        query = data[[5]]
+
+        def wrong_search(queries, matrix, k=1):
+            rows = np.full((len(queries), k), 9, dtype=np.int64)
+            return rows, (matrix[rows[:, 0]] @ queries.T).diagonal()[:, None].repeat(k, axis=1)
+
+        monkeypatch.setattr(gallery.index, "search", wrong_search)
+
+        assert gallery.best_matches(query, threshold=0.5)[0].user_id == 5
+        assert gallery.assign(query, threshold=0.5)[0].user_id == 5
+
+    def test_indexed_assign_reduces_templates_per_user(self):
+        data, _ = self._data(n=600, dim=512)
+        # 300 users with two templates each
+        rows = [(uid // 2, data[uid], None, None) for uid in range(len(data))]
+
+        gallery = build_gallery(rows, ann_min_size=500)
+        assigned = gallery.assign(data[[10, 11, 41]], threshold=0.8)
+
+        assert gallery.index is not None
+        assert [m.user_id if m else None for m in assigned][0] == 5
+        assert assigned[2].user_id == 20
+        assert len({m.user_id for m in assigned if m}) == len([m for m in assigned if m])
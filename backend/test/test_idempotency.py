@@ -0,0 +1,190 @@
+"""
+Tests for the Idempotency-Key store (app/util/idempotency.py).
+"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException, Response, UploadFile
+
+from app.util.idempotency import IdempotencyStore, request_fingerprint
+
+
+class CountingHandler:
+    """Async handler that counts its runs and can be held open or made to fail."""
+
+    def __init__(self, result=None, error: HTTPException | None = None):
+        self.calls = 0
+        self.result = result if result is not None else {"ok": True}
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {**self.result, "run": self.calls}
+
+
+@pytest.mark.unit
+class TestIdempotencyStore:
+    """Tests for IdempotencyStore.run."""
+
+    async def test_retry_replays_first_response(self):
+        store = IdempotencyStore()
+        handler = CountingHandler()
+        response = Response()
+
+        first = await store.run("checkin:1", "k1", handler)
+        again = await store.run("checkin:1", "k1", handler, response)
+
+        assert handler.calls == 1
+        assert again == first
+        assert response.headers["Idempotent-Replayed"] == "true"
+
+    async def test_without_key_always_runs(self):
+        store = IdempotencyStore()
+        handler = CountingHandler()
+
+        await store.run("checkin:1", None, handler)
+        await store.run("checkin:1", None, handler)
+
+        assert handler.calls == 2
+        assert store.stats()["entries"] == 0
+
+    async def test_keys_are_scoped(self):
+        store = IdempotencyStore()
+        handler = CountingHandler()
+
+        await store.run("uploadPicture:1", "k1", handler)
+        await store.run("uploadPicture:2", "k1", handler)
+
+        assert handler.calls == 2
+
+    async def test_concurrent_duplicates_wait_for_the_first(self):
+        store = IdempotencyStore()
+        handler = CountingHandler()
+        handler.release.clear()
+
+        tasks = [asyncio.create_task(store.run("checkin:1", "k1", handler)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert store.stats()["in_flight"] == 1
+        handler.release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert handler.calls == 1
+        assert results == [results[0]] * 3
+        assert store.stats()["joined"] == 2
+
+    async def test_client_errors_are_replayed(self):
+        store = IdempotencyStore()
+        handler = CountingHandler(error=HTTPException(status_code=400, detail="No face detected"))
+
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                await store.run("checkin:1", "k1", handler)
+            assert exc.value.status_code == 400
+
+        assert handler.calls == 1
+
+    @pytest.mark.parametrize("status_code", [403, 409])
+    async def test_liveness_and_conflict_errors_are_not_stored(self, status_code):
+        store = IdempotencyStore()
+        handler = CountingHandler(error=HTTPException(status_code=status_code, detail="retry me"))
+
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await store.run("checkin:1", "k1", handler)
+
+        assert handler.calls == 2
+        assert store.stats()["entries"] == 0
+
+    async def test_key_reused_for_a_different_body_is_rejected(self):
+        store = IdempotencyStore()
+        handler = CountingHandler()
+
+        await store.run("checkin:1", "k1", handler, fingerprint="image-a")
+        with pytest.raises(HTTPException) as exc:
+            await store.run("checkin:1", "k1", handler, fingerprint="image-b")
+
+        assert exc.value.status_code == 422
+        assert handler.calls == 1
+
+    async def test_fingerprint_covers_files_and_fields_and_rewinds(self):
+        upload = UploadFile(io.BytesIO(b"jpeg-bytes"), filename="face.jpg")
+
+        first = await request_fingerprint([upload], "token", "blink")
+        assert await upload.read() == b"jpeg-bytes"
+        await upload.seek(0)
+
+        assert await request_fingerprint([upload], "token", "blink") == first
+        assert await request_fingerprint([upload], "token", "smile") != first
+        other = UploadFile(io.BytesIO(b"other-bytes"), filename="face.jpg")
+        assert await request_fingerprint([other], "token", "blink") != first
+
+    async def test_server_errors_are_not_stored(self):
+        store = IdempotencyStore()
+        handler = CountingHandler(error=HTTPException(status_code=503, detail="busy"))
+
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await store.run("checkin:1", "k1", handler)
+
+        assert handler.calls == 2
+        assert store.stats()["entries"] == 0
+
+    async def test_waiters_run_themselves_when_the_first_fails(self):
+        store = IdempotencyStore()
+        calls = []
+        release = asyncio.Event()
+
+        async def handler():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                await release.wait()
+                raise HTTPException(status_code=500, detail="boom")
+            return {"ok": True}
+
+        first = asyncio.create_task(store.run("checkin:1", "k1", handler))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(store.run("checkin:1", "k1", handler))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(first, second, return_exceptions=True)
+
+        assert len(calls) == 2
+        assert isinstance(results[0], HTTPException)
+        assert results[1] == {"ok": True}
+
+    async def test_expired_entries_run_again(self):
+        store = IdempotencyStore(ttl_seconds=0.0)
+        handler = CountingHandler()
+
+        await store.run("checkin:1", "k1", handler)
+        await asyncio.sleep(0.001)
+        await store.run("checkin:1", "k1", handler)
+
+        assert handler.calls == 2
+        assert store.stats()["expirations"] == 1
+
+    async def test_lru_eviction(self):
+        store = IdempotencyStore(max_entries=2)
+        handler = CountingHandler()
+
+        for key in ("a", "b", "c"):
+            await store.run("checkin:1", key, handler)
+        await store.run("checkin:1", "a", handler)
+
+        assert handler.calls == 4
+        assert store.stats()["evictions"] == 2
+
+    async def test_rejects_overlong_key(self):
+        store = IdempotencyStore()
+
+        with pytest.raises(HTTPException) as exc:
+            await store.run("checkin:1", "x" * 256, CountingHandler())
+
+        assert exc.value.status_code == 400
@@ -0,0 +1,101 @@
+"""
+Tests for resolution-aware decoding (app/util/image_preprocess.py) and the
+stage timing helpers (app/util/timing.py).
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from app.util.image_preprocess import decode_flag, decode_image, downscale
+from app.util.timing import StageTimings, collect_timings, record_stage, timed
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    img = np.full((height, width, 3), 127, dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.mark.unit
+class TestDecodeImage:
+    """Tests for decode_flag / decode_image."""
+
+    def test_large_jpeg_uses_reduced_decode(self):
+        data = _jpeg(6000, 4000)
+
+        assert decode_flag(data, source_max_dimension=2560) == cv2.IMREAD_REDUCED_COLOR_2
+        assert decode_image(data, source_max_dimension=2560).shape == (2000, 3000, 3)
+
+    def test_strongest_reduction_that_keeps_source_size(self):
+        assert decode_flag(_jpeg(6000, 4000), source_max_dimension=700) == cv2.IMREAD_REDUCED_COLOR_8
+        assert decode_flag(_jpeg(6000, 4000), source_max_dimension=1500) == cv2.IMREAD_REDUCED_COLOR_4
+
+    def test_small_jpeg_decodes_full_size(self):
+        data = _jpeg(640, 480)
+
+        assert decode_flag(data) == cv2.IMREAD_COLOR
+        assert decode_image(data).shape == (480, 640, 3)
+
+    def test_png_is_never_reduced(self):
+        ok, buf = cv2.imencode(".png", np.zeros((4000, 6000, 3), dtype=np.uint8))
+
+        assert decode_flag(buf.tobytes(), source_max_dimension=100) == cv2.IMREAD_COLOR
+
+    def test_garbage_returns_none(self):
+        assert decode_image(b"not an image") is None
+
+
+@pytest.mark.unit
+class TestDownscale:
+    """Tests for downscale."""
+
+    def test_small_image_is_untouched(self):
+        img = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+        small, scale = downscale(img, 1280)
+
+        assert small is img
+        assert scale == 1.0
+
+    def test_longest_side_is_capped(self):
+        img = np.zeros((3000, 4000, 3), dtype=np.uint8)
+
+        small, scale = downscale(img, 1280)
+
+        assert small.shape == (960, 1280, 3)
+        assert scale == pytest.approx(0.32)
+
+
+@pytest.mark.unit
+class TestStageTimings:
+    """Tests for timed / collect_timings."""
+
+    def test_aggregate_stats(self):
+        timings = StageTimings()
+        timings.record("detect", 0.010)
+        timings.record("detect", 0.030)
+
+        stats = timings.stats()["detect"]
+
+        assert stats["count"] == 2
+        assert stats["avg_ms"] == pytest.approx(20.0)
+        assert stats["max_ms"] == pytest.approx(30.0)
+
+    def test_request_collector(self):
+        with collect_timings() as request:
+            with timed("decode"):
+                pass
+            record_stage("embed", 0.5)
+            record_stage("embed", 0.25)
+
+        assert set(request) == {"decode", "embed"}
+        assert request["embed"] == pytest.approx(0.75)
+
+    def test_no_collector_outside_request(self):
+        with collect_timings() as request:
+            pass
+        record_stage("detect", 0.1)
+
+        assert request == {}
@@ -0,0 +1,117 @@
+"""
+Parity tests for the ONNX Runtime inference engine (app/service/InferenceEngine.py).
+
+The embedder is exported with random weights (no download needed); the ONNX
+path must produce the same embeddings as eager PyTorch. The INT8 gate tests
+check that a quantized graph is only used with a matching, passing report.
+"""
+
+import json
+
+import pytest
+import torch
+
+ort = pytest.importorskip("onnxruntime")
+facenet = pytest.importorskip("facenet_pytorch")
+
+from app.service.InferenceEngine import (
+    OnnxEngine,
+    TorchEngine,
+    file_sha256,
+    load_engine,
+    quantization_gate,
+    quantization_report_path,
+)
+from scripts.export_onnx import export
+
+
+@pytest.fixture(scope="module")
+def embedder():
+    torch.manual_seed(0)
+    return facenet.InceptionResnetV1().eval()
+
+
+@pytest.fixture(scope="module")
+def embedder_onnx(embedder, tmp_path_factory):
+    path = tmp_path_factory.mktemp("onnx") / "embedder.onnx"
+    export(embedder, torch.randn(1, 3, 160, 160), path, opset=17)
+    return path
+
+
+@pytest.mark.unit
+@pytest.mark.slow
+class TestOnnxEngine:
+    """ONNX vs PyTorch agreement for the face embedder."""
+
+    def test_embedding_cosine_agreement(self, embedder, embedder_onnx):
+        faces = torch.randn(6, 3, 160, 160)
+
+        expected = TorchEngine(embedder, "cpu").run(faces)
+        actual = OnnxEngine(embedder_onnx).run(faces)
+
+        cos = torch.nn.functional.cosine_similarity(expected, actual, dim=1)
+        assert actual.shape == (6, 512)
+        assert cos.min().item() > 0.9999
+
+    def test_dynamic_batch_size(self, embedder_onnx):
+        engine = OnnxEngine(embedder_onnx)
+
+        assert engine.run(torch.randn(1, 3, 160, 160)).shape == (1, 512)
+        assert engine.run(torch.randn(9, 3, 160, 160)).shape == (9, 512)
+
+    def test_missing_graph_falls_back_to_torch(self, embedder, tmp_path, monkeypatch):
+        monkeypatch.setattr("app.service.InferenceEngine.ONNX_MODEL_DIR", tmp_path)
+
+        engine = load_engine(lambda: embedder, "missing.onnx", "cpu", engine="onnx")
+
+        assert engine.name == "torch"
+
+
+@pytest.mark.unit
+@pytest.mark.slow
+class TestQuantizationGate:
+    """INT8 graphs are refused unless their agreement report allows them."""
+
+    def _install(self, tmp_path, embedder_onnx, agreement, sha=None):
+        int8 = tmp_path / "embedder.int8.onnx"
+        int8.write_bytes(embedder_onnx.read_bytes())
+        quantization_report_path(int8).write_text(json.dumps({
+            "agreement": agreement,
+            "sha256": sha or file_sha256(int8),
+        }))
+        return int8
+
+    def test_passing_report_is_accepted(self, tmp_path, embedder_onnx):
+        int8 = self._install(tmp_path, embedder_onnx, agreement=0.999)
+
+        assert quantization_gate(int8, min_agreement=0.99)[0] is True
+
+    def test_low_agreement_is_refused(self, tmp_path, embedder_onnx):
+        int8 = self._install(tmp_path, embedder_onnx, agreement=0.95)
+
+        ok, reason = quantization_gate(int8, min_agreement=0.99)
+
+        assert ok is False
+        assert "0.9500" in reason
+
+    def test_stale_report_is_refused(self, tmp_path, embedder_onnx):
+        int8 = self._install(tmp_path, embedder_onnx, agreement=1.0, sha="0" * 64)
+
+        assert quantization_gate(int8)[0] is False
+
+    def test_refused_int8_falls_back_to_fp32_onnx(self, tmp_path, embedder_onnx, monkeypatch):
+        (tmp_path / "embedder.onnx").write_bytes(embedder_onnx.read_bytes())
+        self._install(tmp_path, embedder_onnx, agreement=0.5)
+        monkeypatch.setattr("app.service.InferenceEngine.ONNX_MODEL_DIR", tmp_path)
+
+        engine = load_engine(lambda: None, "embedder.onnx", "cpu", engine="onnx-int8")
+
+        assert engine.name == "onnx"
+
+    def test_accepted_int8_is_used(self, tmp_path, embedder_onnx, monkeypatch):
+        self._install(tmp_path, embedder_onnx, agreement=1.0)
+        monkeypatch.setattr("app.service.InferenceEngine.ONNX_MODEL_DIR", tmp_path)
+
+        engine = load_engine(lambda: None, "embedder.onnx", "cpu", engine="onnx-int8")
+
+        assert engine.name == "onnx-int8"
@@ -0,0 +1,112 @@
+"""
+Tests for the liveness challenge stores (app/util/liveness.py).
+"""
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+
+from app.db.models.liveness_challenge import LivenessChallengeRecord
+from app.util.liveness import DatabaseLivenessStore, InMemoryLivenessStore, LivenessChallengeStore
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def assert_forbidden(store, token, session_id, action, detail):
+    with pytest.raises(HTTPException) as exc:
+        store.verify(token, session_id, action)
+    assert exc.value.status_code == 403
+    assert detail in exc.value.detail
+
+
+def shared_stores(tmp_path, clock, **kwargs):
+    """Two stores on one SQLite file, like two workers sharing a database."""
+    url = f"sqlite:///{tmp_path / 'liveness.db'}"
+    return (
+        DatabaseLivenessStore(create_engine(url), clock=clock, **kwargs),
+        DatabaseLivenessStore(create_engine(url), clock=clock, **kwargs),
+    )
+
+
+@pytest.mark.unit
+class TestLivenessChallengeStore:
+    """Tests for the shared base class."""
+
+    def test_base_store_is_abstract(self):
+        with pytest.raises(TypeError):
+            LivenessChallengeStore()
+
+
+@pytest.mark.unit
+class TestInMemoryLivenessStore:
+    """Tests for create / verify on the per-worker store."""
+
+    def test_challenge_is_spent_once(self):
+        store = InMemoryLivenessStore()
+        challenge = store.create(session_id=1)
+
+        store.verify(challenge["token"], 1, challenge["action"])
+
+        assert_forbidden(store, challenge["token"], 1, challenge["action"], "expired")
+
+    def test_wrong_session_or_missing_token(self):
+        store = InMemoryLivenessStore()
+        challenge = store.create(session_id=1)
+
+        assert_forbidden(store, challenge["token"], 2, challenge["action"], "did not match")
+        assert_forbidden(store, None, 1, "blink", "required")
+
+    def test_expired_challenges_are_purged(self):
+        clock = FakeClock()
+        store = InMemoryLivenessStore(ttl_seconds=20, clock=clock)
+        old = [store.create(session_id=1) for _ in range(100)]
+
+        clock.now += 21
+        fresh = store.create(session_id=1)
+
+        assert len(store) == 1
+        assert_forbidden(store, old[0]["token"], 1, "blink", "expired")
+        store.verify(fresh["token"], 1, fresh["action"])
+
+
+@pytest.mark.unit
+class TestDatabaseLivenessStore:
+    """Tests for the shared store on a SQLite file."""
+
+    def test_verified_by_another_worker_once(self, tmp_path):
+        issuer, verifier = shared_stores(tmp_path, FakeClock())
+        challenge = issuer.create(session_id=7)
+
+        verifier.verify(challenge["token"], 7, challenge["action"])
+
+        assert_forbidden(issuer, challenge["token"], 7, challenge["action"], "expired")
+
+    async def test_async_calls_run_in_threadpool(self, tmp_path):
+        issuer, verifier = shared_stores(tmp_path, FakeClock())
+        challenge = await issuer.acreate(session_id=7)
+
+        await verifier.averify(challenge["token"], 7, challenge["action"])
+
+        with pytest.raises(HTTPException) as exc:
+            await issuer.averify(challenge["token"], 7, challenge["action"])
+        assert exc.value.status_code == 403
+
+    def test_expired_challenge_is_rejected_and_purged(self, tmp_path):
+        clock = FakeClock()
+        issuer, verifier = shared_stores(tmp_path, clock, purge_seconds=0)
+        old = [issuer.create(session_id=7) for _ in range(3)]
+
+        clock.now += 21
+        assert_forbidden(verifier, old[0]["token"], 7, old[0]["action"], "expired")
+        issuer.create(session_id=7)  # purges the two expired challenges nobody verified
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'liveness.db'}")
+        with engine.connect() as conn:
+            remaining = conn.execute(select(func.count()).select_from(LivenessChallengeRecord.__table__)).scalar()
+        assert remaining == 1
@@ -0,0 +1,118 @@
+"""
+Tests for the latency histograms (app/util/timing.py), the Server-Timing
+middleware and the Prometheus exposition (app/util/metrics.py).
+"""
+
+import importlib
+
+import pytest
+from fastapi import Depends, FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.util import metrics
+from app.util.metrics import ServerTimingMiddleware, render_prometheus, server_timing_header, upload_received
+from app.util.timing import StageTimings, request_timings, stage_timings, timed
+
+
+def make_app(server_timing: bool = True) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware, server_timing=server_timing)
+
+    @app.post("/items/{item_id}/upload", dependencies=[Depends(upload_received)])
+    async def upload(item_id: int, upload_image: UploadFile = File(...)):
+        with timed("decode"):
+            await upload_image.read()
+        return {"item_id": item_id}
+
+    @app.get("/plain")
+    def plain():
+        return {"ok": True}
+
+    return app
+
+
+@pytest.mark.unit
+class TestStageHistograms:
+    """Tests for StageTimings.histograms."""
+
+    def test_cumulative_buckets(self):
+        timings = StageTimings(buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.01, 0.05, 0.5):
+            timings.record("detect", seconds)
+
+        hist = timings.histograms()["detect"]
+
+        assert hist["buckets"] == [(0.01, 2), (0.1, 3), (float("inf"), 4)]
+        assert hist["count"] == 4
+        assert hist["sum"] == pytest.approx(0.565)
+
+    def test_reset_clears_histograms(self):
+        timings = StageTimings()
+        timings.record("detect", 0.01)
+
+        timings.reset()
+
+        assert timings.histograms() == {}
+
+
+@pytest.mark.unit
+class TestServerTiming:
+    """Tests for ServerTimingMiddleware and the /metrics rendering."""
+
+    def setup_method(self):
+        stage_timings.reset()
+        request_timings.reset()
+
+    def test_header_format(self):
+        header = server_timing_header({"detect": 0.0125, "embed": 0.2}, 0.25)
+
+        assert header == "detect;dur=12.5, embed;dur=200.0, total;dur=250.0"
+
+    def test_response_lists_request_stages(self):
+        client = TestClient(make_app())
+
+        response = client.post("/items/7/upload", files={"upload_image": ("a.jpg", b"jpeg", "image/jpeg")})
+
+        assert response.status_code == 200
+        entries = [e.split(";")[0] for e in response.headers["Server-Timing"].split(", ")]
+        assert entries == ["upload", "decode", "total"]
+        assert response.headers["Timing-Allow-Origin"] == "*"
+
+    def test_no_header_without_stages_or_when_disabled(self):
+        assert "Server-Timing" not in TestClient(make_app()).get("/plain").headers
+
+        response = TestClient(make_app(server_timing=False)).post(
+            "/items/7/upload", files={"upload_image": ("a.jpg", b"jpeg", "image/jpeg")}
+        )
+        assert "Server-Timing" not in response.headers
+        assert stage_timings.stats()["decode"]["count"] == 1
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("SERVER_TIMING", raising=False)
+        module = importlib.reload(metrics)
+        try:
+            assert module.SERVER_TIMING is False
+            assert module.ServerTimingMiddleware(app=None).server_timing is False
+        finally:
+            monkeypatch.undo()
+            importlib.reload(metrics)
+
+    def test_requests_recorded_by_route_template(self):
+        client = TestClient(make_app())
+        client.post("/items/1/upload", files={"upload_image": ("a.jpg", b"x", "image/jpeg")})
+        client.post("/items/2/upload", files={"upload_image": ("a.jpg", b"x", "image/jpeg")})
+
+        stats = request_timings.stats()
+
+        assert stats["POST /items/{item_id}/upload"]["count"] == 2
+
+    def test_prometheus_text(self):
+        TestClient(make_app()).post("/items/1/upload", files={"upload_image": ("a.jpg", b"x", "image/jpeg")})
+
+        text = render_prometheus()
+
+        assert "# TYPE veriface_stage_duration_seconds histogram" in text
+        assert 'veriface_stage_duration_seconds_bucket{stage="decode",le="+Inf"} 1' in text
+        assert 'veriface_stage_duration_seconds_count{stage="upload"} 1' in text
+        assert 'veriface_request_duration_seconds_count{method="POST",route="/items/{item_id}/upload"} 1' in text
+        assert text.endswith("\n")
@@ -0,0 +1,110 @@
+"""
+Tests for lazy model loading and readiness reporting (app/service/ModelRegistry.py).
+"""
+
+import gc
+
+import pytest
+
+from app.service.ModelRegistry import ModelRegistry
+
+
+@pytest.mark.unit
+class TestModelRegistry:
+    """Tests for ModelRegistry."""
+
+    def test_loads_once_on_first_get(self):
+        calls = []
+        registry = ModelRegistry()
+        registry.register("m", lambda: calls.append(1) or object())
+
+        assert registry.status()["models"]["m"]["state"] == "not_loaded"
+        first = registry.get("m")
+
+        assert registry.get("m") is first
+        assert len(calls) == 1
+
+    def test_warmup_runs_and_is_timed(self):
+        warmed = []
+        registry = ModelRegistry()
+        registry.register("m", lambda: "model", warmup=warmed.append)
+
+        registry.get("m")
+
+        status = registry.status()["models"]["m"]
+        assert warmed == ["model"]
+        assert status["state"] == "ready"
+        assert status["load_ms"] is not None
+        assert status["warmup_ms"] is not None
+
+    def test_ready_waits_for_required_models_only(self):
+        registry = ModelRegistry()
+        registry.register("face", lambda: "face")
+        registry.register("extra", lambda: "extra", required=False)
+
+        assert registry.ready is False
+        registry.get("face")
+
+        assert registry.ready is True
+
+    def test_failed_load_is_reported_and_retried(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("weights missing")
+            return "model"
+
+        registry = ModelRegistry()
+        registry.register("m", flaky)
+
+        with pytest.raises(RuntimeError):
+            registry.get("m")
+        assert registry.status()["models"]["m"]["state"] == "failed"
+        assert "weights missing" in registry.status()["models"]["m"]["error"]
+
+        assert registry.get("m") == "model"
+        assert registry.ready is True
+
+    def test_blocking_warmup_loads_everything(self):
+        registry = ModelRegistry()
+        registry.register("a", lambda: "a")
+        registry.register("b", lambda: "b")
+
+        registry.start_warmup("blocking")
+
+        assert registry.is_loaded("a") and registry.is_loaded("b")
+
+    def test_lazy_warmup_loads_nothing(self):
+        registry = ModelRegistry()
+        registry.register("a", lambda: "a")
+
+        registry.start_warmup("lazy")
+
+        assert registry.is_loaded("a") is False
+
+    def test_preload_for_fork_loads_without_warmup(self):
+        warmed = []
+        registry = ModelRegistry()
+        registry.register("shared", lambda: "weights", warmup=warmed.append, fork_safe=True)
+        registry.register("per_worker", lambda: "session")
+
+        registry.preload_for_fork()
+        registry.after_fork()
+        gc.unfreeze()
+
+        models = registry.status()["models"]
+        assert models["shared"]["state"] == "loaded"
+        assert models["shared"]["preloaded"] is True
+        assert models["per_worker"]["state"] == "not_loaded"
+        assert registry.ready is False
+
+        assert registry.get("shared") == "weights"
+        assert warmed == ["weights"]
+
+    async def test_aget(self):
+        registry = ModelRegistry()
+        registry.register("a", lambda: "a")
+
+        assert await registry.aget("a") == "a"
@@ -0,0 +1,69 @@
+"""
+Tests for scoring occlusion on the detector's face crops (app/service/OcclusionService.py).
+"""
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from app.service.OcclusionService import OcclusionService, _transform, face_inputs
+
+
+class FakeEngine:
+    name = "fake"
+
+    def __init__(self, logits):
+        self.logits = torch.tensor(logits)
+        self.batches = []
+
+    def run(self, batch):
+        self.batches.append(batch)
+        return self.logits
+
+
+def make_service(enabled=True, logits=None):
+    service = OcclusionService.__new__(OcclusionService)
+    service.device = torch.device("cpu")
+    service.enabled = enabled
+    service.model = FakeEngine(logits) if logits is not None else None
+    return service
+
+
+@pytest.mark.unit
+class TestOcclusionService:
+    """Tests for face_inputs and OcclusionService.score_faces."""
+
+    def test_face_inputs_matches_pil_transform(self):
+        rng = np.random.default_rng(0)
+        bgr = rng.integers(0, 256, size=(160, 160, 3), dtype=np.uint8)
+        # MTCNN crop layout: channels of the BGR frame, (x - 127.5) / 128
+        crop = (torch.from_numpy(bgr).permute(2, 0, 1).float() - 127.5) / 128.0
+
+        expected = _transform(Image.fromarray(bgr[:, :, ::-1].copy()))
+        actual = face_inputs(crop.unsqueeze(0))[0]
+
+        assert actual.shape == (3, 224, 224)
+        assert torch.allclose(actual, expected, atol=0.05)
+
+    def test_score_faces_one_batch_for_all_crops(self):
+        service = make_service(logits=[[4.0, 0.0], [0.0, 4.0]])
+
+        results = service.score_faces(torch.zeros(2, 3, 160, 160))
+
+        assert len(service.model.batches) == 1
+        assert service.model.batches[0].shape == (2, 3, 224, 224)
+        assert [occluded for occluded, _ in results] == [False, True]
+        assert results[1][1] == pytest.approx(torch.softmax(torch.tensor([0.0, 4.0]), 0)[1].item())
+
+    def test_uncertain_face_counts_as_occluded(self):
+        service = make_service(logits=[[0.5, 0.0]])
+
+        [(occluded, _)] = service.score_faces(torch.zeros(1, 3, 160, 160))
+
+        assert occluded is True
+
+    def test_disabled_service_passes_every_face(self):
+        service = make_service(enabled=False)
+
+        assert service.score_faces(torch.zeros(3, 3, 160, 160)) == [(False, 0.0)] * 3
@@ -4,6 +4,7 @@ Tests for session router (/protected/session).
 Tests:
 - POST /protected/session/createSession
 - POST /protected/session/checkin
+- WS /ws/checkin/{session_id}
 """
 
 import pytest
@@ -557,6 +558,121 @@ class TestCheckin:
             assert first["user_id"] in [user1.id, user2.id]
 
 
+# ============================================================================
+# Streaming Check-in Tests
+# ============================================================================
+
+@pytest.mark.session
+@pytest.mark.integration
+class TestCheckinStream:
+    """Tests for the WS /ws/checkin/{session_id} kiosk stream."""
+
+    @pytest.fixture
+    def fake_inference(self, monkeypatch):
+        """One face at a fixed box in every frame; counts the crops sent to the embedder."""
+        import numpy as np
+        import torch
+
+        class FakeInference:
+            def __init__(self):
+                self.embedded = 0
+
+            async def img_to_embedding(self, img, multiple=False):
+                return torch.full((1, 512), 0.1)
+
+            async def detect_with_boxes(self, img, multiple=False):
+                return np.array([[10, 10, 110, 110]], dtype=np.float32), torch.zeros((1, 3, 160, 160))
+
+            async def embed(self, faces):
+                self.embedded += len(faces)
+                return torch.full((len(faces), 512), 0.1)
+
+        fake = FakeInference()
+        monkeypatch.setattr("app.util.checkin.inference", fake)
+        return fake
+
+    @pytest.fixture(autouse=True)
+    def stream_sessions(self, client: TestClient, test_db):
+        """The stream opens its own short sessions; bind them to the test database."""
+        from sqlalchemy.orm import sessionmaker
+        from app.core.database import get_session_factory
+
+        client.app.dependency_overrides[get_session_factory] = lambda: sessionmaker(bind=test_db.get_bind())
+        yield
+        client.app.dependency_overrides.pop(get_session_factory, None)
+
+    def test_unknown_session_is_closed(self, client: TestClient):
+        from starlette.websockets import WebSocketDisconnect
+
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect("/ws/checkin/99999") as ws:
+                ws.receive_json()
+
+        assert closed.value.code == 1008
+
+    def test_frames_need_liveness(self, client: TestClient, test_session, test_attendance, fake_inference):
+        with client.websocket_connect(f"/ws/checkin/{test_session.id}") as ws:
+            assert ws.receive_json()["type"] == "ready"
+
+            ws.send_bytes(create_dummy_image().getvalue())
+
+            assert ws.receive_json() == {"type": "liveness_required"}
+
+    def test_stream_checks_in(self, client: TestClient, test_session, test_attendance, fake_inference):
+        with client.websocket_connect(f"/ws/checkin/{test_session.id}") as ws:
+            assert ws.receive_json()["type"] == "ready"
+
+            ws.send_json({"type": "challenge"})
+            challenge = ws.receive_json()
+            ws.send_json({"type": "liveness", "token": challenge["token"], "action": challenge["action"]})
+            assert ws.receive_json()["type"] == "armed"
+
+            ws.send_bytes(create_dummy_image().getvalue())
+            result = ws.receive_json()
+
+        assert result["type"] == "result"
+        assert result["stats"]["num_face"] == 1
+        assert result["stats"]["matched"] == 1
+        assert result["frames"]["processed"] == 1
+
+    def test_confirmed_face_is_not_embedded_again(self, client: TestClient, test_session, test_attendance, fake_inference):
+        # Two agreeing matches confirm the track; the third frame (well within the re-check interval) reuses it
+        results = []
+        with client.websocket_connect(f"/ws/checkin/{test_session.id}") as ws:
+            assert ws.receive_json()["type"] == "ready"
+            for _ in range(3):
+                # Every check-in disarms the stream, so each frame gets its own challenge
+                ws.send_json({"type": "challenge"})
+                challenge = ws.receive_json()
+                ws.send_json({"type": "liveness", "token": challenge["token"], "action": challenge["action"]})
+                assert ws.receive_json()["type"] == "armed"
+
+                ws.send_bytes(create_dummy_image().getvalue())
+                results.append(ws.receive_json())
+
+        assert [r["stats"]["matched"] for r in results] == [1, 1, 1]
+        assert results[2]["stats"]["tracked"] == 1
+        assert fake_inference.embedded == 2
+
+    def test_ended_session_rejects_frames(self, client: TestClient, test_db, test_session, test_attendance, fake_inference):
+        from datetime import datetime, timedelta
+
+        with client.websocket_connect(f"/ws/checkin/{test_session.id}") as ws:
+            assert ws.receive_json()["type"] == "ready"
+            ws.send_json({"type": "challenge"})
+            challenge = ws.receive_json()
+            ws.send_json({"type": "liveness", "token": challenge["token"], "action": challenge["action"]})
+            assert ws.receive_json()["type"] == "armed"
+
+            test_session.end_time = datetime.now() - timedelta(days=1)
+            test_db.commit()
+            ws.send_bytes(create_dummy_image().getvalue())
+            result = ws.receive_json()
+
+        assert result["type"] == "error"
+        assert result["status"] == 409
+
+
 # ============================================================================
 # Integration Tests
 # ============================================================================
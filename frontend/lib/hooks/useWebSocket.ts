@@ -28,6 +28,11 @@ export function useSessionWebSocket(
         const message = JSON.parse(event.data);
         if (message.type === "checkin") {
           onCheckInRef.current(message.data);
+        } else if (message.type === "checkin_batch") {
+          // Group check-in: one message carries every face updated in a frame
+          for (const item of message.data ?? []) {
+            onCheckInRef.current(item);
+          }
         }
       } catch (e) {
         console.error("[WebSocket] Failed to parse message:", e);